@@ -0,0 +1,162 @@
+"""
+DeepRead - 书籍分析结果缓存
+按 (提示词版本, 模型, 温度, 书籍信息) 的哈希缓存LLM解析结果
+重复分析同一本书不再消耗token
+
+旧提示词版本的条目不会被读到（版本计入缓存键），只占磁盘空间，需要时手动清理:
+    python analysis_cache.py stats     # 查看各提示词版本的条目数
+    python analysis_cache.py prune     # 清除当前提示词版本以外的条目
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_ANALYSIS_CACHE_PATH = "./cache/analysis_cache.db"
+
+
+def make_analysis_key(prompt_version: str, model: str, temperature: float, book_fields: Dict) -> str:
+    """生成内容寻址的缓存键（规范化JSON的SHA-256）"""
+    payload = json.dumps(
+        {
+            "prompt_version": prompt_version,
+            "model": model,
+            "temperature": temperature,
+            "book": book_fields,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    分析结果缓存（SQLite）
+    只缓存成功解析的LLM结果，降级结果不缓存
+    """
+
+    def __init__(self, db_path: str = DEFAULT_ANALYSIS_CACHE_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0}
+
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                cache_key TEXT PRIMARY KEY,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                book_title TEXT,
+                analysis_json TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, cache_key: str) -> Optional[Dict]:
+        """查询缓存，未命中返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT analysis_json FROM analysis_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            self._stats["hits" if row else "misses"] += 1
+        return json.loads(row[0]) if row else None
+
+    def put(self, cache_key: str, analysis: Dict, prompt_version: str, model: str, book_title: str = ""):
+        """写入分析结果"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache "
+                "(cache_key, prompt_version, model, book_title, analysis_json, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, prompt_version, model, book_title,
+                 json.dumps(analysis, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+            self._stats["writes"] += 1
+
+    def invalidate(self, keep_version: Optional[str] = None) -> int:
+        """
+        清除缓存
+        keep_version: 只保留该提示词版本的条目；None 表示全部清除
+        返回: 删除的条目数
+        """
+        with self._lock:
+            if keep_version is None:
+                cursor = self._conn.execute("DELETE FROM analysis_cache")
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM analysis_cache WHERE prompt_version != ?", (keep_version,)
+                )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def prune_stale(self, current_version: str) -> int:
+        """
+        清除当前提示词版本以外的条目（维护命令使用），返回清除的条数
+        注意：仍在运行旧版本代码的其他进程的缓存也会被清除
+        """
+        return self.invalidate(keep_version=current_version)
+
+    def stats(self) -> Dict:
+        """缓存统计（含各提示词版本的条目数）"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute(
+                "SELECT COUNT(*) FROM analysis_cache"
+            ).fetchone()[0]
+            stats["versions"] = dict(self._conn.execute(
+                "SELECT prompt_version, COUNT(*) FROM analysis_cache GROUP BY prompt_version"
+            ).fetchall())
+        return stats
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="DeepRead 分析结果缓存维护")
+    parser.add_argument("--db", default=DEFAULT_ANALYSIS_CACHE_PATH, help="缓存数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="查看缓存条目数")
+    sub.add_parser("prune", help="清除当前提示词版本以外的条目")
+    sub.add_parser("clear", help="清空缓存")
+    args = parser.parse_args(argv)
+
+    cache = AnalysisCache(args.db)
+    if args.command == "stats":
+        stats = cache.stats()
+        print(f"📦 共 {stats['entries']} 条分析缓存")
+        for version, count in stats["versions"].items():
+            print(f"   提示词版本 {version}: {count} 条")
+    elif args.command == "prune":
+        from book_analyzer import BookDeepAnalyzer
+        current = BookDeepAnalyzer(use_cache=False).prompt_version()
+        removed = cache.prune_stale(current)
+        print(f"✅ 当前提示词版本 {current}，清除 {removed} 条")
+    elif args.command == "clear":
+        print(f"✅ 已清空 {cache.invalidate()} 条分析缓存")
+    cache.close()
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+    main()
@@ -7,11 +7,17 @@ import streamlit as st
 import os
 from pathlib import Path
 import asyncio
+import time
 
 # 导入我们的模块
 from book_analyzer import BookDataFetcher, BookDeepAnalyzer
 from podcast_generator import PodcastScriptGenerator, PodcastAudioGenerator
 from knowledge_base import PersonalKnowledgeBase
+from cover_store import get_cover_store
+from circuit_breaker import breaker_states
+from singleflight import singleflight_stats
+from shared_embedder import get_embedder, READY, FAILED as EMBEDDER_FAILED
+from job_queue import JobQueue, ensure_worker, QUEUED, RUNNING, SUCCEEDED, FAILED
 
 # 页面配置
 st.set_page_config(
@@ -60,6 +66,12 @@ if "current_book" not in st.session_state:
 if "current_analysis" not in st.session_state:
     st.session_state.current_analysis = None
 
+if "analysis_job" not in st.session_state:
+    st.session_state.analysis_job = None
+
+# 启动时就在后台加载嵌入模型，打开知识库页面时通常已加载完成
+get_embedder()
+
 
 def init_knowledge_base():
     """初始化知识库"""
@@ -69,6 +81,40 @@ def init_knowledge_base():
     return st.session_state.knowledge_base
 
 
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """后台分析任务队列（所有会话共享）"""
+    return JobQueue()
+
+
+def render_analysis_job():
+    """显示后台分析任务的进度，完成后载入结果"""
+    queue = get_job_queue()
+    job = queue.get(st.session_state.analysis_job)
+    if job is None:
+        st.session_state.analysis_job = None
+        return
+
+    if job["status"] in (QUEUED, RUNNING):
+        if job["status"] == QUEUED:
+            st.info(f"⏳ 排队中，前面还有 {queue.queue_position(job['id'])} 个任务")
+        else:
+            st.progress(job["progress"], text=f"🤖 本地模型分析中：{job['message'] or ''}")
+        if st.button("⏹️ 取消分析"):
+            queue.cancel(job["id"])
+        # 定时刷新页面查看进度，不阻塞其他会话
+        time.sleep(2)
+        st.rerun()
+
+    st.session_state.analysis_job = None
+    if job["status"] == SUCCEEDED:
+        st.session_state.current_analysis = job["result"]
+    elif job["status"] == FAILED:
+        st.error(f"❌ 分析失败: {job['error']}")
+    else:
+        st.warning("⏹️ 分析已取消")
+
+
 def render_home():
     """首页"""
     st.markdown('<h1 class="main-title">📚 DeepRead 深读</h1>', unsafe_allow_html=True)
@@ -135,37 +181,66 @@ def render_book_analysis():
             fetcher = BookDataFetcher()
             book = fetcher.search_by_title(book_title)
 
-            if book:
-                st.session_state.current_book = book
-
-                # 显示书籍信息
-                col1, col2 = st.columns([1, 3])
-
-                with col1:
-                    if book.cover_url:
-                        st.image(book.cover_url, width=200)
-
-                with col2:
-                    st.markdown(f"### {book.title}")
-                    st.markdown(f"**作者**: {book.author}")
-                    if book.categories:
-                        st.markdown(f"**分类**: {', '.join(book.categories)}")
-                    if book.average_rating:
-                        st.markdown(f"**评分**: {'⭐' * int(book.average_rating)}")
-                    if book.published_date:
-                        st.markdown(f"**出版时间**: {book.published_date}")
-                    if book.description:
-                        with st.expander("📝 简介"):
-                            st.markdown(book.description)
-
-                st.markdown("---")
-
-                # 深度分析按钮
-                if st.button("🚀 开始深度分析", type="primary"):
-                    with st.spinner("AI正在深度分析中，这可能需要30-60秒..."):
-                        analyzer = BookDeepAnalyzer()
-                        analysis = analyzer.analyze_book(book)
-                        st.session_state.current_analysis = analysis
+        if book:
+            st.session_state.current_book = book
+            st.session_state.current_analysis = None
+            st.session_state.analysis_job = None
+
+    # 按钮点击会重新运行页面，书籍信息从 session_state 读取
+    if st.session_state.current_book and not st.session_state.current_analysis:
+        book = st.session_state.current_book
+        # 显示书籍信息
+        col1, col2 = st.columns([1, 3])
+
+        with col1:
+            if book.cover_url:
+                # 优先使用本地缩略图；还没有时先显示原图，后台下载供下次使用
+                store = get_cover_store()
+                cover_path = store.cached_thumbnail(book.cover_url, size=200)
+                if not cover_path:
+                    store.prefetch(book.cover_url)
+                st.image(str(cover_path) if cover_path else book.cover_url, width=200)
+
+        with col2:
+            st.markdown(f"### {book.title}")
+            st.markdown(f"**作者**: {book.author}")
+            if book.categories:
+                st.markdown(f"**分类**: {', '.join(book.categories)}")
+            if book.average_rating:
+                st.markdown(f"**评分**: {'⭐' * int(book.average_rating)}")
+            if book.published_date:
+                st.markdown(f"**出版时间**: {book.published_date}")
+            if book.description:
+                with st.expander("📝 简介"):
+                    st.markdown(book.description)
+
+        st.markdown("---")
+
+        # 深度分析按钮
+        if st.session_state.analysis_job:
+            render_analysis_job()
+        elif st.button("🚀 开始深度分析", type="primary"):
+            if st.session_state.get("use_job_queue"):
+                # 本地模型耗时较长，提交到后台任务队列
+                queue = get_job_queue()
+                ensure_worker(queue)
+                st.session_state.analysis_job = queue.submit_analysis(book, local=True)
+                st.rerun()
+
+            # 流式分析：每生成一条核心观点就立即显示
+            st.markdown("### 核心观点")
+            status = st.info("AI正在深度分析中...")
+            insights_box = st.empty()
+            insights = []
+
+            analyzer = BookDeepAnalyzer()
+            for field, value in analyzer.analyze_book_stream(book):
+                if field == "key_insights":
+                    insights.append(value)
+                    insights_box.markdown("\n".join(f"- {item}" for item in insights))
+                elif field == "complete":
+                    st.session_state.current_analysis = value
+            status.empty()
 
     # 显示分析结果
     if st.session_state.current_analysis:
@@ -296,6 +371,17 @@ def render_podcast():
     st.info("💡 提示：首次使用需要安装 edge-tts: `pip install edge-tts`")
 
 
+def render_embedder_status(embedder):
+    """嵌入模型未就绪时的提示（不阻塞页面）"""
+    if embedder.state == EMBEDDER_FAILED:
+        st.error(f"❌ 嵌入模型加载失败: {embedder.error}")
+        if st.button("🔄 重新加载嵌入模型"):
+            embedder.start()
+            st.rerun()
+    else:
+        st.info("⏳ 嵌入模型加载中，暂时只按关键词搜索，稍后刷新即可语义搜索（第一次需要下载约400MB）")
+
+
 def render_knowledge_base():
     """知识库页面"""
     st.markdown("## 🧠 个人知识库")
@@ -303,8 +389,7 @@ def render_knowledge_base():
     kb = init_knowledge_base()
 
     # 统计信息
-    all_results = kb.collection.get()
-    total_cards = len(all_results["ids"])
+    total_cards = kb.collection.count()
 
     if total_cards == 0:
         st.warning("📭 知识库还是空的，去「书籍分析」页面添加第一本书吧！")
@@ -315,7 +400,12 @@ def render_knowledge_base():
     search_query = st.text_input("搜索知识点", placeholder="例如：认知偏差、决策、心理学...")
 
     if search_query:
-        results = kb.search_knowledge(search_query, n_results=10)
+        if kb.embedder_ready:
+            results = kb.search_knowledge(search_query, n_results=10)
+        else:
+            # 嵌入模型还在加载时先用关键词索引检索
+            render_embedder_status(kb.embedder)
+            results = kb.search_knowledge(search_query, n_results=10, mode="lexical")
 
         st.markdown(f"找到 {len(results)} 条相关知识：")
 
@@ -332,12 +422,14 @@ def render_knowledge_base():
     st.markdown("---")
     st.markdown("### 📚 书籍关联")
 
+    # 读取预先计算的书籍相似度，不需要等待嵌入模型
     if st.session_state.current_book:
         related = kb.find_related_books(st.session_state.current_book.title)
 
         if related:
             for book in related:
-                st.markdown(f"**{book['title']}** - {book['author']} ({book['count']}个相关概念)")
+                st.markdown(f"**{book['title']}** - {book['author']} "
+                            f"(相似度 {book['similarity']:.0%}，{book['count']}张卡片)")
 
     # 导出功能
     st.markdown("---")
@@ -346,8 +438,14 @@ def render_knowledge_base():
     col1, col2 = st.columns(2)
 
     with col1:
+        per_book = st.checkbox("每本书单独一个文件", help="适合直接放进Obsidian仓库")
+        changed_only = st.checkbox(
+            "只导出上次导出后有更新的书籍",
+            help="未勾选“每本书单独一个文件”时写入单独的 knowledge_base_changes.md，不覆盖完整导出"
+        )
         if st.button("导出为Markdown"):
-            output_path = kb.export_to_markdown()
+            with st.spinner("正在导出..."):
+                output_path = kb.export_to_markdown(per_book=per_book, changed_only=changed_only)
             st.success(f"✅ 已导出到: {output_path}")
 
     with col2:
@@ -381,6 +479,34 @@ def main():
             os.environ["GROQ_API_KEY"] = api_key
             st.success("✅ API Key已设置")
 
+        st.checkbox(
+            "🖥️ 使用本地模型（后台分析）",
+            key="use_job_queue",
+            help="使用Ollama本地模型，分析任务在后台排队执行，页面不会卡住"
+        )
+
+        embedder = get_embedder()
+        if embedder.state == READY:
+            st.caption("🧠 嵌入模型: ✅ 已就绪")
+        elif embedder.state == EMBEDDER_FAILED:
+            st.caption("🧠 嵌入模型: ❌ 加载失败")
+        else:
+            st.caption("🧠 嵌入模型: ⏳ 加载中...")
+
+        # 外部服务熔断状态与请求合并统计
+        states = breaker_states()
+        flights = singleflight_stats()
+        if states or flights:
+            with st.expander("🩺 服务状态"):
+                for name, state in states.items():
+                    icon = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[state["state"]]
+                    st.markdown(f"{icon} **{name}** 超时 {state['timeout']}s，"
+                                f"失败 {state['failures']}/{state['calls']}")
+                for name, flight in flights.items():
+                    if flight["calls"]:
+                        st.markdown(f"🔗 **{name}** 合并请求节省 {flight['shared']}/{flight['calls']} 次调用，"
+                                    f"进行中 {flight['in_flight']}")
+
         st.markdown("---")
         st.markdown("""
 ### 📖 使用说明
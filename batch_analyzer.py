@@ -0,0 +1,305 @@
+"""
+DeepRead - 批量书籍分析
+并发分析整个书单：控制并发数、遵循接口限流响应头退避重试、
+逐本写入检查点文件（中断后可继续），并统计吞吐量与token消耗
+
+命令行用法:
+    python batch_analyzer.py books.jsonl --concurrency 4
+    python batch_analyzer.py titles.txt --local --model qwen2:7b
+
+输入文件:
+    .jsonl  每行一个 BookInfo 字段的JSON对象
+    .txt    每行一个书名（先通过 BookDataFetcher 获取书籍信息）
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from book_analyzer import BookInfo, BookDeepAnalyzer, BookDataFetcher, RateLimitError
+
+DEFAULT_CHECKPOINT_PATH = "./cache/batch_checkpoint.jsonl"
+
+
+class BatchAnalysisPipeline:
+    """批量分析流水线"""
+
+    def __init__(
+        self,
+        analyzer: Optional[BookDeepAnalyzer] = None,
+        concurrency: int = 4,
+        checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+        max_retries: int = 5,
+        base_backoff: float = 2.0,
+        max_backoff: float = 60.0,
+        max_rate_limit_retries: int = 10,
+        max_rate_limit_wait: float = 600.0
+    ):
+        """
+        analyzer: 分析器（BookDeepAnalyzer 或 LocalBookAnalyzer）
+        concurrency: 同时进行的分析数
+        checkpoint_path: 检查点文件（JSONL，每完成一本追加一行）
+        max_retries: 非限流错误的最大重试次数
+        base_backoff / max_backoff: 指数退避的初始/最大等待秒数
+        max_rate_limit_retries: 每本书遇到限流的最大重试次数，超过后记为失败
+        max_rate_limit_wait: 单次限流等待的上限（秒）；要求等待更久（如当日额度用尽）时直接记为失败
+        """
+        self.analyzer = analyzer or BookDeepAnalyzer()
+        self.concurrency = max(1, concurrency)
+        self.checkpoint_path = Path(checkpoint_path)
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.max_rate_limit_wait = max_rate_limit_wait
+
+        self._lock = threading.Lock()
+        self._pause_until = 0.0
+        self._stats = {}
+
+    # ---------- 检查点 ----------
+    def _book_key(self, book: BookInfo) -> str:
+        # 与分析缓存使用同一个键，提示词或模型变化后不会误用旧结果
+        return self.analyzer._analysis_cache_key(book)
+
+    def load_checkpoint(self) -> Dict[str, Dict]:
+        """读取检查点中已成功的结果 {书籍键: 记录}"""
+        finished = {}
+        if not self.checkpoint_path.exists():
+            return finished
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程崩溃时最后一行可能不完整
+                    continue
+                if record.get("status") == "ok":
+                    finished[record["key"]] = record
+        return finished
+
+    def _write_checkpoint(self, record: Dict):
+        with self._lock:
+            with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    # ---------- 限流 ----------
+    def _wait_for_rate_limit(self):
+        """所有工作线程共享的限流暂停"""
+        while True:
+            with self._lock:
+                delay = self._pause_until - time.time()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _pause(self, seconds: float):
+        # 等待时间有上限，额度长时间不恢复时由后续的限流错误把书记为失败，而不是无限期挂起
+        seconds = min(seconds, self.max_rate_limit_wait)
+        with self._lock:
+            self._pause_until = max(self._pause_until, time.time() + seconds)
+
+    def _respect_rate_limits(self, rate_limits: Dict, last_tokens: int):
+        """额度即将用尽时主动暂停，直到额度重置"""
+        if rate_limits.get("remaining_requests") == 0 and rate_limits.get("reset_requests"):
+            self._pause(rate_limits["reset_requests"])
+        remaining_tokens = rate_limits.get("remaining_tokens")
+        if remaining_tokens is not None and last_tokens and remaining_tokens < last_tokens * self.concurrency:
+            if rate_limits.get("reset_tokens"):
+                self._pause(rate_limits["reset_tokens"])
+
+    def _add_stat(self, name: str, value=1):
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + value
+
+    # ---------- 分析 ----------
+    def _analyze_one(self, book: BookInfo, key: str) -> Dict:
+        start = time.time()
+
+        cached = self.analyzer._get_cached_analysis(book)
+        if cached is not None:
+            self._add_stat("cached")
+            return {"key": key, "title": book.title, "status": "ok", "cached": True,
+                    "analysis": cached, "usage": {}, "seconds": 0.0}
+
+        failures = rate_limited = 0
+        while True:
+            self._wait_for_rate_limit()
+            try:
+                analysis, meta = self.analyzer.request_analysis(book)
+                if not meta.get("complete", True):
+                    # 截断后补齐的结果不能记为 ok，否则之后从检查点继续时会永久跳过这本书
+                    raise RuntimeError("模型输出被截断，分析结果不完整")
+            except RateLimitError as e:
+                self._add_stat("rate_limited")
+                rate_limited += 1
+                if rate_limited > self.max_rate_limit_retries or e.retry_after > self.max_rate_limit_wait:
+                    return {"key": key, "title": book.title, "status": "failed",
+                            "error": f"限流未恢复（已重试 {rate_limited - 1} 次）: {e}",
+                            "seconds": round(time.time() - start, 2)}
+                # 加少量随机抖动，避免所有线程同时重试
+                self._pause(e.retry_after + random.uniform(0, 1))
+                continue
+            except Exception as e:
+                failures += 1
+                self._add_stat("retries")
+                if failures > self.max_retries:
+                    return {"key": key, "title": book.title, "status": "failed",
+                            "error": str(e), "seconds": round(time.time() - start, 2)}
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** (failures - 1))
+                time.sleep(backoff * random.uniform(0.5, 1.0))
+                continue
+
+            usage = meta.get("usage") or {}
+            tokens = usage.get("total_tokens") or (
+                usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+            )
+            self._respect_rate_limits(meta.get("rate_limits") or {}, tokens)
+            if usage:
+                # 共享其他调用的结果或刚写入的缓存时没有token用量，不计入平均值
+                self._add_stat("llm_books")
+            self._add_stat("prompt_tokens", usage.get("prompt_tokens", 0))
+            self._add_stat("completion_tokens", usage.get("completion_tokens", 0))
+            return {"key": key, "title": book.title, "status": "ok", "cached": False,
+                    "analysis": analysis, "usage": usage,
+                    "seconds": round(time.time() - start, 2)}
+
+    def run(
+        self,
+        books: List[BookInfo],
+        progress_callback: Optional[Callable[[Dict, int, int], None]] = None
+    ) -> Dict:
+        """
+        批量分析
+        progress_callback(记录, 已完成数, 总数): 每完成一本调用一次
+        返回: 运行报告
+        """
+        self._stats = {}
+        start = time.time()
+        finished = self.load_checkpoint()
+
+        pending = []
+        seen = set()
+        for book in books:
+            key = self._book_key(book)
+            if key in finished or key in seen:
+                continue
+            seen.add(key)
+            pending.append((book, key))
+
+        skipped = len(books) - len(pending)
+        succeeded = failed = 0
+        total = len(pending)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self._analyze_one, book, key) for book, key in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                self._write_checkpoint(record)
+                if record["status"] == "ok":
+                    succeeded += 1
+                else:
+                    failed += 1
+                if progress_callback:
+                    progress_callback(record, done, total)
+
+        elapsed = time.time() - start
+        prompt_tokens = self._stats.get("prompt_tokens", 0)
+        completion_tokens = self._stats.get("completion_tokens", 0)
+        analyzed = self._stats.get("llm_books", 0)
+
+        return {
+            "total": len(books),
+            "skipped_from_checkpoint": skipped,
+            "succeeded": succeeded,
+            "failed": failed,
+            "cached": self._stats.get("cached", 0),
+            "retries": self._stats.get("retries", 0),
+            "rate_limited": self._stats.get("rate_limited", 0),
+            "elapsed_seconds": round(elapsed, 1),
+            "books_per_minute": round(succeeded / elapsed * 60, 2) if elapsed else 0.0,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "llm_books": analyzed,
+            "tokens_per_book": round((prompt_tokens + completion_tokens) / analyzed) if analyzed else 0,
+        }
+
+
+def load_books(path: str, lang: str = "zh", concurrency: int = 8) -> List[BookInfo]:
+    """读取书单：.jsonl 为 BookInfo 字段，其他文件按每行一个书名处理"""
+    path = Path(path)
+    lines = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+    if path.suffix == ".jsonl":
+        return [BookInfo(**json.loads(line)) for line in lines]
+
+    books = []
+    fetcher = BookDataFetcher()
+    for title, book in fetcher.search_many(lines, lang=lang, concurrency=concurrency):
+        if book:
+            books.append(book)
+        else:
+            print(f"⚠️ 未找到《{title}》，跳过")
+    return books
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="DeepRead 批量书籍分析")
+    parser.add_argument("books", help="书单文件（.jsonl 或每行一个书名的 .txt）")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="并发数（默认4）")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="检查点文件路径")
+    parser.add_argument("--max-retries", type=int, default=5, help="失败重试次数")
+    parser.add_argument("--max-rate-limit-wait", type=float, default=600.0,
+                        help="单次限流最长等待秒数，超过则把该书记为失败（默认600）")
+    parser.add_argument("--local", action="store_true", help="使用本地 Ollama 模型")
+    parser.add_argument("--model", help="模型名称")
+    args = parser.parse_args(argv)
+
+    if args.local:
+        from local_model_analyzer import LocalBookAnalyzer
+        analyzer = LocalBookAnalyzer(model_name=args.model) if args.model else LocalBookAnalyzer()
+    else:
+        analyzer = BookDeepAnalyzer(model=args.model) if args.model else BookDeepAnalyzer()
+
+    books = load_books(args.books)
+    print(f"📚 共 {len(books)} 本书，并发数 {args.concurrency}")
+
+    pipeline = BatchAnalysisPipeline(
+        analyzer,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint,
+        max_retries=args.max_retries,
+        max_rate_limit_wait=args.max_rate_limit_wait
+    )
+
+    def on_progress(record, done, total):
+        icon = "✅" if record["status"] == "ok" else "❌"
+        extra = "（缓存）" if record.get("cached") else f"{record['seconds']}s"
+        print(f"[{done}/{total}] {icon} 《{record['title']}》 {extra}")
+
+    report = pipeline.run(books, progress_callback=on_progress)
+
+    print("\n" + "=" * 50)
+    print(f"成功: {report['succeeded']}  失败: {report['failed']}  "
+          f"缓存命中: {report['cached']}  已跳过: {report['skipped_from_checkpoint']}")
+    print(f"用时: {report['elapsed_seconds']}s  吞吐: {report['books_per_minute']} 本/分钟")
+    print(f"Token: {report['total_tokens']} (输入 {report['prompt_tokens']} / "
+          f"输出 {report['completion_tokens']})，平均每本 {report['tokens_per_book']}")
+    print(f"重试: {report['retries']}  限流: {report['rate_limited']}")
+    print(f"📁 结果已写入: {args.checkpoint}")
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
@@ -0,0 +1,112 @@
+"""
+DeepRead - 书籍分析延迟基准测试
+比较整体提示词与分段并发（sectioned）两种模式的端到端耗时
+
+用法:
+    python benchmark_analysis.py --runs 3                 # 调用 Groq（需要 GROQ_API_KEY）
+    python benchmark_analysis.py --local --model qwen2:7b # 调用本地 Ollama
+    python benchmark_analysis.py --simulate               # 不调用接口，按生成速度模拟延迟
+
+测试时不读写分析缓存，每次都真实请求
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from book_analyzer import BookInfo, BookDeepAnalyzer
+
+SAMPLE_BOOK = BookInfo(
+    title="思考，快与慢",
+    author="丹尼尔·卡尼曼",
+    description="本书介绍了人类思维的两个系统：快速、直觉的系统1与缓慢、理性的系统2，"
+                "以及它们如何影响我们的判断与决策。",
+    categories=["心理学", "行为经济学"],
+    page_count=424
+)
+
+
+class SimulatedAnalyzer(BookDeepAnalyzer):
+    """
+    模拟LLM延迟的分析器：首token延迟 + 输出长度 / 生成速度
+    回复内容取降级结果中提示词要求的字段
+    """
+
+    def __init__(self, first_token_latency: float = 0.3, chars_per_second: float = 400, **kwargs):
+        super().__init__(use_cache=False, **kwargs)
+        self.first_token_latency = first_token_latency
+        self.chars_per_second = chars_per_second
+
+    def _chat_completion(self, prompt: str) -> Tuple[str, Dict, Dict]:
+        full = self._fallback_analysis(SAMPLE_BOOK)
+        requested = {field: value for field, value in full.items() if f'"{field}"' in prompt}
+        content = json.dumps(requested, ensure_ascii=False)
+        time.sleep(self.first_token_latency + len(content) / self.chars_per_second)
+        usage = {"prompt_tokens": len(prompt), "completion_tokens": len(content)}
+        return content, usage, {}
+
+
+def run_mode(analyzer: BookDeepAnalyzer, book: BookInfo, runs: int) -> Dict:
+    """重复分析同一本书，返回耗时与token统计"""
+    latencies: List[float] = []
+    prompt_tokens = completion_tokens = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        _, meta = analyzer.request_analysis(book)
+        latencies.append(time.perf_counter() - start)
+        prompt_tokens += meta["usage"].get("prompt_tokens", 0)
+        completion_tokens += meta["usage"].get("completion_tokens", 0)
+    return {
+        "mean": statistics.mean(latencies),
+        "min": min(latencies),
+        "max": max(latencies),
+        "prompt_tokens": prompt_tokens / runs,
+        "completion_tokens": completion_tokens / runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较整体与分段分析的端到端延迟")
+    parser.add_argument("--runs", type=int, default=3, help="每种模式的重复次数")
+    parser.add_argument("--local", action="store_true", help="使用本地 Ollama 模型")
+    parser.add_argument("--model", help="模型名称")
+    parser.add_argument("--simulate", action="store_true", help="模拟延迟，不调用接口")
+    args = parser.parse_args()
+
+    results = {}
+    for sectioned in (False, True):
+        kwargs = {"sectioned": sectioned}
+        if args.model:
+            kwargs["model_name" if args.local else "model"] = args.model
+
+        if args.simulate:
+            analyzer = SimulatedAnalyzer(**kwargs)
+        elif args.local:
+            from local_model_analyzer import LocalBookAnalyzer
+            analyzer = LocalBookAnalyzer(use_cache=False, **kwargs)
+        else:
+            analyzer = BookDeepAnalyzer(use_cache=False, **kwargs)
+
+        name = "分段并发" if sectioned else "整体提示词"
+        print(f"⏱️ {name}: {args.runs} 次...")
+        results[name] = run_mode(analyzer, SAMPLE_BOOK, args.runs)
+
+    print("\n" + "=" * 60)
+    print(f"{'模式':<10}{'平均(s)':>10}{'最快(s)':>10}{'最慢(s)':>10}{'输入tok':>10}{'输出tok':>10}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['mean']:>10.2f}{r['min']:>10.2f}{r['max']:>10.2f}"
+              f"{r['prompt_tokens']:>10.0f}{r['completion_tokens']:>10.0f}")
+
+    single, sectioned = results["整体提示词"], results["分段并发"]
+    print(f"\n🚀 分段并发加速比: {single['mean'] / sectioned['mean']:.2f}x")
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
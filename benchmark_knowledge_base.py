@@ -0,0 +1,98 @@
+"""
+DeepRead - 知识库写入基准测试
+比较逐张写入（每张卡片单独 encode + add）与批量写入（一次 encode + 一次 add）的速度，
+以及重建索引时使用/不使用embedding缓存的耗时
+
+用法:
+    python benchmark_knowledge_base.py --cards 60
+    python benchmark_knowledge_base.py --cards 200 --batch-size 32 --rounds 3
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+from knowledge_base import PersonalKnowledgeBase, KnowledgeCard
+
+
+def make_cards(book_title: str, count: int) -> List[KnowledgeCard]:
+    """生成一本书的模拟知识卡片（观点/金句/概念轮流）"""
+    timestamp = datetime.now().isoformat()
+    content_types = ["insight", "quote", "concept"]
+    cards = []
+    for i in range(count):
+        content_type = content_types[i % 3]
+        cards.append(KnowledgeCard(
+            id=f"{book_title}_{content_type}_{i}_{timestamp}",
+            book_title=book_title,
+            book_author="测试作者",
+            content_type=content_type,
+            content=f"第{i}条内容：关于认知偏差、决策与习惯养成的思考，编号{i}",
+            tags=[book_title],
+            created_at=timestamp
+        ))
+    return cards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库逐张写入与批量写入速度对比")
+    parser.add_argument("--cards", type=int, default=60, help="每本书的卡片数")
+    parser.add_argument("--rounds", type=int, default=3, help="每种方式写入的书籍数")
+    parser.add_argument("--batch-size", type=int, default=64, help="embedding批大小")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="deepread_kb_bench_")
+    try:
+        kb = PersonalKnowledgeBase(persist_directory=tmp_dir, embed_batch_size=args.batch_size)
+        # 预热模型，避免首次推理的开销计入结果
+        kb.embedder.encode(["预热"])
+
+        results = {}
+        for mode in ("逐张写入", "批量写入"):
+            elapsed = 0.0
+            for round_index in range(args.rounds):
+                cards = make_cards(f"{mode}_{round_index}", args.cards)
+                start = time.perf_counter()
+                if mode == "逐张写入":
+                    for card in cards:
+                        kb._add_card(card)
+                else:
+                    kb._add_cards(cards)
+                elapsed += time.perf_counter() - start
+            results[mode] = args.cards * args.rounds / elapsed
+
+        print("\n" + "=" * 50)
+        print(f"每本书 {args.cards} 张卡片，共 {args.rounds} 本")
+        for mode, rate in results.items():
+            print(f"{mode}: {rate:.1f} 张/秒")
+        print(f"🚀 加速比: {results['批量写入'] / results['逐张写入']:.2f}x")
+
+        # 重建索引：有缓存时只读磁盘向量，无缓存时全部重新推理
+        reindex_times = {}
+        for name, use_cache in (("无缓存重建", False), ("缓存重建", True)):
+            rebuild_kb = PersonalKnowledgeBase(
+                persist_directory=tmp_dir,
+                embed_batch_size=args.batch_size,
+                use_embedding_cache=use_cache
+            )
+            start = time.perf_counter()
+            total = rebuild_kb.reindex()
+            reindex_times[name] = time.perf_counter() - start
+
+        print(f"\n重建 {total} 张卡片的索引")
+        for name, elapsed in reindex_times.items():
+            print(f"{name}: {elapsed:.2f}s")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
@@ -0,0 +1,175 @@
+"""
+DeepRead - 本地模型冷/热启动基准测试
+启动一个模拟 Ollama 接口的本地服务（模拟模型加载耗时与逐token生成），
+比较冷启动、预热后两种情况下 LocalBookAnalyzer 的分析延迟与首条内容延迟
+
+用法:
+    python benchmark_local_model.py
+    python benchmark_local_model.py --load-delay 8 --token-delay 0.01
+    python benchmark_local_model.py --ollama http://localhost:11434 --model qwen2:7b   # 测试真实Ollama
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from benchmark_analysis import SAMPLE_BOOK
+from book_analyzer import BookDeepAnalyzer
+from local_model_analyzer import LocalBookAnalyzer
+
+
+def _parse_keep_alive(value) -> float:
+    """Ollama keep_alive：秒数或 "30m" 之类的时长，负数表示一直常驻"""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        value = str(value).strip()
+        scale = {"s": 1, "m": 60, "h": 3600}.get(value[-1:], None)
+        seconds = float(value[:-1]) * scale if scale else float(value)
+    return float("inf") if seconds < 0 else seconds
+
+
+class StubOllama:
+    """
+    模拟Ollama服务
+    load_delay: 模型未加载时的加载耗时（秒）
+    token_delay: 每个token的生成耗时（秒）
+    """
+
+    def __init__(self, model: str, load_delay: float = 5.0, token_delay: float = 0.005):
+        self.model = model
+        self.load_delay = load_delay
+        self.token_delay = token_delay
+        self.loaded_until = 0.0
+        self.lock = threading.Lock()
+        analysis = BookDeepAnalyzer(use_cache=False)._fallback_analysis(SAMPLE_BOOK)
+        content = json.dumps(analysis, ensure_ascii=False)
+        # 约每4个字符一个token
+        self.tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, data: Dict):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": stub.model, "size": 0}]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                stub.ensure_loaded(request.get("keep_alive"))
+
+                if not request.get("prompt"):
+                    self._send_json({"model": stub.model, "response": "", "done": True})
+                    return
+
+                final = {"done": True, "prompt_eval_count": len(request["prompt"]) // 2,
+                         "eval_count": len(stub.tokens)}
+                if not request.get("stream", True):
+                    time.sleep(stub.token_delay * len(stub.tokens))
+                    self._send_json({"response": "".join(stub.tokens), **final})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for token in stub.tokens:
+                    time.sleep(stub.token_delay)
+                    line = json.dumps({"response": token, "done": False}, ensure_ascii=False)
+                    self.wfile.write(line.encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                self.wfile.write(json.dumps(final).encode("utf-8") + b"\n")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def ensure_loaded(self, keep_alive):
+        """模型未加载（或已过期卸载）时模拟加载耗时"""
+        with self.lock:
+            if time.monotonic() >= self.loaded_until:
+                time.sleep(self.load_delay)
+            self.loaded_until = time.monotonic() + _parse_keep_alive(keep_alive)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(analyzer: LocalBookAnalyzer) -> Dict:
+    """流式分析一次，返回首条内容延迟与总耗时"""
+    start = time.perf_counter()
+    first_item = None
+    for field, _ in analyzer.analyze_book_stream(SAMPLE_BOOK):
+        if first_item is None and field != "complete":
+            first_item = time.perf_counter() - start
+    return {"first_item": first_item, "total": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LocalBookAnalyzer 冷/热启动延迟对比")
+    parser.add_argument("--model", default="llama3:8b", help="模型名称")
+    parser.add_argument("--load-delay", type=float, default=5.0, help="模拟模型加载耗时（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="模拟每token耗时（秒）")
+    parser.add_argument("--ollama", help="使用真实Ollama服务地址（需先卸载模型才能测到冷启动）")
+    args = parser.parse_args()
+
+    results = {}
+    for name, warm in (("冷启动", False), ("预热后", True)):
+        stub = None
+        if args.ollama:
+            base_url = args.ollama
+        else:
+            # 每个场景使用新的模拟服务，进程内的连接检查/预热缓存互不影响
+            stub = StubOllama(args.model, args.load_delay, args.token_delay)
+            base_url = stub.base_url
+
+        analyzer = LocalBookAnalyzer(model_name=args.model, base_url=base_url,
+                                     use_cache=False, warm_up=False)
+        if warm:
+            start = time.perf_counter()
+            analyzer.warm_up()
+            print(f"🔥 预热耗时: {time.perf_counter() - start:.2f}s")
+
+        results[name] = measure(analyzer)
+        if stub:
+            stub.close()
+
+    print("\n" + "=" * 50)
+    print(f"{'场景':<8}{'首条内容(s)':>14}{'总耗时(s)':>12}")
+    for name, r in results.items():
+        first = f"{r['first_item']:.2f}" if r["first_item"] is not None else "-"
+        print(f"{name:<8}{first:>14}{r['total']:>12.2f}")
+
+    cold, warm = results["冷启动"], results["预热后"]
+    print(f"\n🚀 预热后总耗时减少 {cold['total'] - warm['total']:.2f}s")
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
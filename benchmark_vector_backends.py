@@ -0,0 +1,119 @@
+"""
+DeepRead - 向量存储后端基准测试
+比较 ChromaDB（HNSW）与 compact 后端（量化向量 + NumPy 暴力检索）在不同卡片数下的
+打开耗时、单次查询延迟和磁盘占用，找出 ChromaDB 开始更快的卡片数
+
+用法:
+    python benchmark_vector_backends.py
+    python benchmark_vector_backends.py --sizes 1000 5000 20000 50000 --quantization float16
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from compact_index import CompactClient
+
+CONTENT_TYPES = ["insight", "quote", "concept"]
+
+
+def make_data(size: int, dim: int, seed: int = 0):
+    """生成模拟卡片：随机单位向量 + 元数据"""
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(size, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    ids = [f"card_{i}" for i in range(size)]
+    metadatas = [{"book_title": f"书{i % 50}", "content_type": CONTENT_TYPES[i % 3]} for i in range(size)]
+    documents = [f"第{i}条内容" for i in range(size)]
+    return ids, embeddings, metadatas, documents
+
+
+def open_collection(backend: str, path: Path, quantization: str):
+    if backend == "compact":
+        client = CompactClient(str(path), quantization=quantization)
+    else:
+        import chromadb
+        client = chromadb.PersistentClient(path=str(path))
+    return client, client.get_or_create_collection(name="knowledge_cards", metadata={"hnsw:space": "cosine"})
+
+
+def measure(backend: str, size: int, args) -> Dict:
+    ids, embeddings, metadatas, documents = make_data(size, args.dim)
+    queries = make_data(args.queries, args.dim, seed=1)[1]
+    path = Path(tempfile.mkdtemp(prefix=f"deepread_{backend}_"))
+    try:
+        client, collection = open_collection(backend, path, args.quantization)
+        max_batch = client.get_max_batch_size() if hasattr(client, "get_max_batch_size") else size
+        for start in range(0, size, max_batch):
+            collection.add(
+                ids=ids[start:start + max_batch],
+                embeddings=embeddings[start:start + max_batch].tolist(),
+                metadatas=metadatas[start:start + max_batch],
+                documents=documents[start:start + max_batch]
+            )
+        del client, collection
+
+        # 打开耗时：新建客户端到第一次查询返回（模拟应用冷启动）
+        start = time.perf_counter()
+        client, collection = open_collection(backend, path, args.quantization)
+        collection.query(query_embeddings=[queries[0].tolist()], n_results=10)
+        open_seconds = time.perf_counter() - start
+
+        latencies = {}
+        for name, where in (("无过滤", None), ("按类型过滤", {"content_type": "quote"})):
+            start = time.perf_counter()
+            for query in queries:
+                collection.query(query_embeddings=[query.tolist()], n_results=10, where=where)
+            latencies[name] = (time.perf_counter() - start) / len(queries) * 1000
+
+        disk = sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+        return {"open": open_seconds, "disk": disk, **latencies}
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChromaDB 与 compact 向量后端对比")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 5000, 20000], help="卡片数")
+    parser.add_argument("--dim", type=int, default=384, help="向量维度")
+    parser.add_argument("--queries", type=int, default=50, help="每种场景的查询次数")
+    parser.add_argument("--quantization", default="int8", choices=["int8", "float16"])
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        for backend in ("compact", "chroma"):
+            print(f"⏱️ {backend} {size} 张卡片...")
+            results[(backend, size)] = measure(backend, size, args)
+
+    print("\n" + "=" * 78)
+    print(f"{'卡片数':>8}{'后端':>10}{'打开(s)':>10}{'查询(ms)':>12}{'过滤查询(ms)':>14}{'磁盘(MB)':>12}")
+    for size in args.sizes:
+        for backend in ("compact", "chroma"):
+            r = results[(backend, size)]
+            print(f"{size:>8}{backend:>10}{r['open']:>10.2f}{r['无过滤']:>12.2f}"
+                  f"{r['按类型过滤']:>14.2f}{r['disk'] / 1024 / 1024:>12.1f}")
+
+    cutover = next(
+        (size for size in args.sizes
+         if results[("chroma", size)]["无过滤"] < results[("compact", size)]["无过滤"]),
+        None
+    )
+    if cutover:
+        print(f"\n📈 从 {cutover} 张卡片起 ChromaDB 查询更快，建议使用 chroma 后端")
+    else:
+        print(f"\n📉 {max(args.sizes)} 张卡片以内 compact 后端查询都不慢于 ChromaDB")
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
@@ -4,16 +4,130 @@ DeepRead - 书籍深度解析模块
 """
 
 import os
+import hashlib
 import requests
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Any, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, asdict
 import json
+import time
 from datetime import datetime
 
+from metadata_cache import BookMetadataCache, CACHE_MISS
+from offline_index import OfflineMetadataIndex, DEFAULT_INDEX_PATH
+from fuzzy_index import FuzzyTitleIndex
+from rate_limiter import HostRateLimiter, parse_rate_limit_headers
+from circuit_breaker import get_breaker
+from analysis_cache import AnalysisCache, make_analysis_key
+from streaming_json import IncrementalJSONParser, ANY_INDEX, extract_json
+from llm_telemetry import get_telemetry
+from singleflight import get_singleflight, FlightAbandoned
+
 # 推荐使用 Groq API (免费额度大，速度快)
 # 注册地址: https://groq.com
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 
+# 分析提示词版本：修改 _build_analysis_prompt 的输出格式或要求时递增，使旧的分析缓存失效
+# （提示词模板内容的指纹也会计入缓存键，忘记递增时同样不会命中旧结果）
+ANALYSIS_PROMPT_VERSION = 1
+
+# 流式分析时逐条返回的数组字段
+STREAM_ITEM_PATHS = [
+    ("key_insights", ANY_INDEX),
+    ("quotes", ANY_INDEX),
+    ("mind_map", "主要分支", ANY_INDEX),
+]
+
+# 分段分析：把整体提示词拆成互不依赖的几部分并发请求，每段输出更短，总耗时取决于最慢的一段
+# {分段名: (返回字段, JSON格式示例, 注意事项)}
+ANALYSIS_SECTIONS = {
+    "key_insights": (
+        ["key_insights"],
+        """{
+  "key_insights": [
+    "核心观点1：具体解释...",
+    "核心观点2：具体解释...",
+    "核心观点3：具体解释...",
+    "核心观点4：具体解释...",
+    "核心观点5：具体解释..."
+  ]
+}""",
+        "核心观点要具体、有洞见，不是简单的内容摘要"
+    ),
+    "mind_map": (
+        ["mind_map"],
+        """{
+  "mind_map": {
+    "中心主题": "书名或核心概念",
+    "主要分支": [
+      {
+        "分支名": "分支1",
+        "子节点": ["概念1", "概念2"]
+      },
+      {
+        "分支名": "分支2",
+        "子节点": ["概念1", "概念2"]
+      }
+    ]
+  }
+}""",
+        "分支要覆盖全书的主要结构"
+    ),
+    "quotes": (
+        ["quotes"],
+        """{
+  "quotes": [
+    "金句1（可以是书中原话或基于内容的总结性金句）",
+    "金句2",
+    "金句3",
+    "金句4",
+    "金句5"
+  ]
+}""",
+        "金句要适合分享到社交媒体"
+    ),
+    "reading_plan": (
+        ["reading_plan", "difficulty", "estimated_hours", "target_readers", "prerequisite_knowledge"],
+        """{
+  "reading_plan": {
+    "week1": "第1-2章：阅读重点说明",
+    "week2": "第3-5章：阅读重点说明",
+    "week3": "第6-8章：阅读重点说明",
+    "week4": "第9章及总结：阅读重点说明"
+  },
+  "difficulty": "初级/中级/高级",
+  "estimated_hours": 8.5,
+  "target_readers": ["读者类型1", "读者类型2"],
+  "prerequisite_knowledge": ["需要了解的基础概念1", "概念2"]
+}""",
+        "阅读计划要具体到每周重点；难度评级要准确；预计阅读时长基于普通读者（每小时20-30页）"
+    ),
+}
+
+# 完整分析结果的字段（按输出顺序）
+ANALYSIS_FIELDS = [field for fields, _, _ in ANALYSIS_SECTIONS.values() for field in fields]
+
+# 输出被截断时，恢复出这些字段才缓存修复后的结果（其余字段可用降级内容补齐）
+CORE_ANALYSIS_FIELDS = ("key_insights", "mind_map", "quotes")
+
+# 提示词要求的最少条目数（mind_map 按主要分支计）；截断后恢复的数组达不到时不缓存
+MIN_ANALYSIS_ITEMS = {"key_insights": 5, "quotes": 5, "mind_map": 2}
+
+# 降级结果的标记字段（调用方据此区分真实分析与占位内容）
+FALLBACK_MARKER = "_is_fallback"
+
+# 输出被截断、恢复的内容不足以缓存时的标记字段（缺少的部分已用降级内容补齐，不能算作成功的分析）
+INCOMPLETE_MARKER = "_is_incomplete"
+
+# 进程内共享：多个会话同时分析同一本书时只调用一次LLM
+_analysis_flight = get_singleflight("analysis")
+
+# 各书籍数据源的默认限流：(每秒请求数, 突发容量)
+DEFAULT_PROVIDER_RATE_LIMITS = {
+    "www.googleapis.com": (10.0, 10.0),
+    "openlibrary.org": (5.0, 5.0),
+}
+
 @dataclass
 class BookInfo:
     """书籍信息数据类"""
@@ -32,115 +146,444 @@ class BookInfo:
             self.categories = []
 
 
+class RateLimitError(Exception):
+    """LLM接口限流（HTTP 429）"""
+
+    def __init__(self, retry_after: float, rate_limits: Optional[Dict] = None):
+        super().__init__(f"接口限流，{retry_after:.1f}秒后重试")
+        self.retry_after = retry_after
+        self.rate_limits = rate_limits or {}
+
+
+def _merge_rate_limits(limits: List[Dict]) -> Dict:
+    """合并多次请求的限流响应头：剩余额度取最小值，等待时间取最大值"""
+    merged = {}
+    for item in limits:
+        for name, value in item.items():
+            if value is None:
+                merged.setdefault(name, None)
+                continue
+            current = merged.get(name)
+            if current is None:
+                merged[name] = value
+            elif name.startswith("remaining"):
+                merged[name] = min(current, value)
+            else:
+                merged[name] = max(current, value)
+    return merged
+
+
+def is_fallback_analysis(analysis: Optional[Dict]) -> bool:
+    """是否为LLM调用失败时返回的降级内容"""
+    return bool(analysis and analysis.get(FALLBACK_MARKER))
+
+
+def is_incomplete_analysis(analysis: Optional[Dict]) -> bool:
+    """是否为输出被截断、部分字段用降级内容补齐的结果"""
+    return bool(analysis and analysis.get(INCOMPLETE_MARKER))
+
+
+def _meets_minimums(analysis: Dict) -> bool:
+    """截断后恢复出的核心字段是否达到提示词要求的条目数"""
+    for field, minimum in MIN_ANALYSIS_ITEMS.items():
+        value = analysis.get(field)
+        if field == "mind_map":
+            value = value.get("主要分支") if isinstance(value, dict) else None
+        if not isinstance(value, list) or len(value) < minimum:
+            return False
+    return True
+
+
+def _iter_stream_items(analysis: Dict) -> Iterator[Tuple[str, Any]]:
+    """按流式输出的格式逐条产出已有分析结果中的内容"""
+    for insight in analysis.get("key_insights", []):
+        yield "key_insights", insight
+    for quote in analysis.get("quotes", []):
+        yield "quotes", quote
+    for branch in analysis.get("mind_map", {}).get("主要分支", []):
+        yield "mind_map", branch
+
+
 class BookDataFetcher:
     """书籍数据获取器 - 使用免费API"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[BookMetadataCache] = None,
+        use_cache: bool = True,
+        hedge_delay: Optional[float] = None,
+        rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        pool_size: int = 16,
+        offline_index: Optional[OfflineMetadataIndex] = None,
+        fuzzy_threshold: Optional[float] = 0.8
+    ):
+        """
+        cache: 元数据缓存实例（默认使用 ./cache/book_metadata.db）
+        use_cache: 是否启用缓存
+        hedge_delay: 对冲查询延迟（秒）
+            None - 依次查询各数据源（默认）
+            0    - 同时查询所有数据源
+            >0   - 先查 Google Books，超过该时间仍无结果时再并发查询 Open Library
+        rate_limits: 按主机限流 {主机名: (每秒请求数, 突发容量)}
+        pool_size: 每个主机保持的长连接数
+        offline_index: 离线元数据索引（默认加载 ./cache/offline_index.bin，如存在）
+        fuzzy_threshold: 近似书名匹配阈值，命中已解析过的书籍时不再联网；None 表示关闭
+        """
         self.google_books_api = "https://www.googleapis.com/books/v1/volumes"
         self.open_library_api = "https://openlibrary.org"
+        self.hedge_delay = hedge_delay
+
+        # 共享的长连接会话（连接复用）和按主机限流
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.rate_limiter = HostRateLimiter(
+            rate_limits if rate_limits is not None else DEFAULT_PROVIDER_RATE_LIMITS
+        )
+
+        # 各数据源的熔断器（进程内共享），超时上限10秒，随实际延迟自适应
+        self.google_breaker = get_breaker("google_books", max_timeout=10, min_timeout=2)
+        self.open_library_breaker = get_breaker("open_library", max_timeout=10, min_timeout=2)
+
+        if cache is None and use_cache:
+            cache = BookMetadataCache()
+        self.cache = cache
+
+        if offline_index is None and os.path.exists(DEFAULT_INDEX_PATH):
+            offline_index = OfflineMetadataIndex(DEFAULT_INDEX_PATH)
+        self.offline_index = offline_index
+
+        # 已解析过的书名的模糊索引（从缓存中恢复，与缓存条目一起过期）
+        self.fuzzy_index = None
+        if fuzzy_threshold is not None:
+            self.fuzzy_index = FuzzyTitleIndex(threshold=fuzzy_threshold)
+            if self.cache is not None:
+                for normalized_title, lang, data, expires_at in self.cache.iter_books():
+                    self.fuzzy_index.add(normalized_title, data, lang, expires_at)
+                    self.fuzzy_index.add(data["title"], data, lang, expires_at)
 
     def search_by_title(self, title: str, lang: str = "zh") -> Optional[BookInfo]:
         """
         通过书名搜索书籍信息
-        优先使用 Google Books API，降级到 Open Library
+        先查本地缓存、离线索引和近似书名，再使用 Google Books API，降级到 Open Library
         """
-        # 先尝试 Google Books
-        book_info = self._fetch_from_google_books(title, lang)
-        if book_info:
-            return book_info
+        if self.cache is not None:
+            cached = self.cache.get(title, lang)
+            if cached is not CACHE_MISS:
+                return BookInfo(**cached) if cached else None
 
-        # 降级到 Open Library
-        return self._fetch_from_open_library(title)
+        if self.offline_index is not None:
+            offline = self.offline_index.lookup_title(title)
+            if offline:
+                return BookInfo(**offline)
 
-    def _fetch_from_google_books(self, title: str, lang: str) -> Optional[BookInfo]:
-        """从 Google Books API 获取书籍信息"""
-        try:
-            params = {
-                "q": title,
-                "langRestrict": lang,
-                "maxResults": 1,
-                "printType": "books"
-            }
-            response = requests.get(self.google_books_api, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+        if self.fuzzy_index is not None:
+            match = self.fuzzy_index.search(title, lang=lang)
+            if match:
+                return BookInfo(**match[0])
 
-            if data.get("totalItems", 0) == 0:
-                return None
+        book_info, complete = self._search_providers(title, lang)
 
-            volume = data["items"][0]
-            info = volume.get("volumeInfo", {})
+        # 只有在所有数据源都正常返回时才缓存“未找到”，网络错误不缓存
+        if self.cache is not None and (book_info or complete):
+            self.cache.put(title, lang, asdict(book_info) if book_info else None)
 
-            # 提取作者信息
-            authors = info.get("authors", [])
-            author = authors[0] if authors else "未知作者"
+        if self.fuzzy_index is not None and book_info:
+            data = asdict(book_info)
+            expires_at = time.time() + self.cache.ttl if self.cache is not None else None
+            self.fuzzy_index.add(title, data, lang, expires_at)
+            self.fuzzy_index.add(book_info.title, data, lang, expires_at)
 
-            # 提取ISBN
-            identifiers = info.get("industryIdentifiers", [])
-            isbn = next(
-                (id_obj.get("identifier") for id_obj in identifiers
-                 if id_obj.get("type") in ["ISBN_10", "ISBN_13"]),
-                None
-            )
+        return book_info
 
-            return BookInfo(
-                title=info.get("title", title),
-                author=author,
-                isbn=isbn,
-                published_date=info.get("publishedDate"),
-                description=info.get("description"),
-                page_count=info.get("pageCount"),
-                categories=info.get("categories", []),
-                cover_url=info.get("imageLinks", {}).get("thumbnail"),
-                average_rating=info.get("averageRating")
-            )
+    def search_by_isbn(self, isbn: str) -> Optional[BookInfo]:
+        """
+        通过ISBN搜索书籍信息
+        优先使用离线索引，再查询 Google Books API
+        """
+        if self.offline_index is not None:
+            offline = self.offline_index.lookup_isbn(isbn)
+            if offline:
+                return BookInfo(**offline)
+
+        try:
+            return self._fetch_from_google_books(f"isbn:{isbn}", "")
         except Exception as e:
             print(f"Google Books API 错误: {e}")
             return None
 
-    def _fetch_from_open_library(self, title: str) -> Optional[BookInfo]:
-        """从 Open Library 获取书籍信息（降级方案）"""
+    def search_many(
+        self,
+        titles: Iterable[str],
+        lang: str = "zh",
+        concurrency: int = 8
+    ) -> Iterator[Tuple[str, Optional[BookInfo]]]:
+        """
+        批量搜索书籍，按完成顺序逐个返回 (书名, 书籍信息)
+        相同书名（规范化后）只查询一次
+        concurrency: 并发查询数
+        """
+        groups: Dict[str, List[str]] = {}
+        for title in titles:
+            groups.setdefault(BookMetadataCache.make_key(title, lang), []).append(title)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
         try:
-            # Open Library 搜索接口
-            search_url = f"{self.open_library_api}/search.json"
-            params = {"title": title, "limit": 1}
-            response = requests.get(search_url, params=params, timeout=10)
+            futures = {
+                executor.submit(self.search_by_title, same_titles[0], lang): same_titles
+                for same_titles in groups.values()
+            }
+            for future in as_completed(futures):
+                try:
+                    book_info = future.result()
+                except Exception as e:
+                    print(f"批量搜索错误: {e}")
+                    book_info = None
+                for title in futures[future]:
+                    yield title, book_info
+        finally:
+            # 调用方提前停止迭代时，取消排队中的查询
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get(self, url: str, breaker, **kwargs):
+        """
+        通过共享会话发送GET请求
+        先按主机限流，再经过熔断器（使用自适应超时，HTTP错误计为失败）
+        """
+        self.rate_limiter.acquire(url)
+
+        def request(timeout: float):
+            response = self.session.get(url, timeout=timeout, **kwargs)
             response.raise_for_status()
-            data = response.json()
-
-            if data.get("numFound", 0) == 0:
-                return None
-
-            docs = data.get("docs", [])[0]
-
-            # 获取完整信息
-            work_key = docs.get("key", "")
-            if work_key:
-                work_url = f"{self.open_library_api}{work_key}.json"
-                work_response = requests.get(work_url, timeout=10)
-                work_data = work_response.json.json()
-
-                return BookInfo(
-                    title=docs.get("title", title),
-                    author=docs.get("author_name", ["未知作者"])[0],
-                    isbn=docs.get("isbn", [None])[0],
-                    published_date=docs.get("first_publish_year"),
-                    description=work_data.get("description"),
-                    page_count=docs.get("number_of_pages"),
-                    categories=docs.get("subject", []),
-                    cover_url=f"https://covers.openlibrary.org/b/OLID/{work_key.split('/')[-1]}-M.jpg"
+            return response
+
+        return breaker.call(request)
+
+    def _search_providers(self, title: str, lang: str) -> Tuple[Optional[BookInfo], bool]:
+        """
+        依次查询各数据源
+        返回: (书籍信息, 是否所有数据源都正常响应)
+        """
+        providers = [
+            ("Google Books API", lambda: self._fetch_from_google_books(title, lang)),
+            ("Open Library", lambda: self._fetch_from_open_library(title)),
+        ]
+
+        if self.hedge_delay is not None:
+            return self._search_providers_hedged(providers)
+
+        complete = True
+        for name, fetch in providers:
+            try:
+                book_info = fetch()
+            except Exception as e:
+                print(f"{name} 错误: {e}")
+                complete = False
+                continue
+            if book_info:
+                return book_info, complete
+
+        return None, complete
+
+    def _search_providers_hedged(self, providers) -> Tuple[Optional[BookInfo], bool]:
+        """
+        对冲查询：按 hedge_delay 错开启动各数据源，返回最先得到的有效结果
+        前一个数据源失败或无结果时，立即启动下一个，不再等待延迟
+        注意：落后的数据源请求不会被中断（requests 无法取消进行中的请求），会在后台线程中
+        执行完毕后丢弃结果，最长耗时受各数据源熔断器的自适应超时限制（不超过10秒）；
+        它仍占用一次限流额度，并计入该数据源熔断器的成功/失败统计
+        """
+        executor = ThreadPoolExecutor(max_workers=len(providers))
+        pending = list(providers)
+        running = {}
+        complete = True
+
+        def launch_next():
+            name, fetch = pending.pop(0)
+            running[executor.submit(fetch)] = name
+
+        try:
+            launch_next()
+            while running or pending:
+                done, _ = wait(
+                    running,
+                    timeout=self.hedge_delay if pending else None,
+                    return_when=FIRST_COMPLETED
                 )
-        except Exception as e:
-            print(f"Open Library 错误: {e}")
+
+                # 超过对冲延迟仍无结果，启动下一个数据源
+                if not done:
+                    launch_next()
+                    continue
+
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        book_info = future.result()
+                    except Exception as e:
+                        print(f"{name} 错误: {e}")
+                        complete = False
+                        book_info = None
+
+                    if book_info:
+                        return book_info, complete
+
+                    if pending:
+                        launch_next()
+
+            return None, complete
+        finally:
+            # 取消尚未开始的查询；已在进行中的请求不再等待，由后台线程执行完毕后丢弃结果
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _fetch_from_google_books(self, title: str, lang: str) -> Optional[BookInfo]:
+        """从 Google Books API 获取书籍信息"""
+        params = {
+            "q": title,
+            "maxResults": 1,
+            "printType": "books"
+        }
+        if lang:
+            params["langRestrict"] = lang
+        response = self._get(self.google_books_api, self.google_breaker, params=params)
+        data = response.json()
+
+        if data.get("totalItems", 0) == 0:
             return None
 
+        volume = data["items"][0]
+        info = volume.get("volumeInfo", {})
+
+        # 提取作者信息
+        authors = info.get("authors", [])
+        author = authors[0] if authors else "未知作者"
+
+        # 提取ISBN
+        identifiers = info.get("industryIdentifiers", [])
+        isbn = next(
+            (id_obj.get("identifier") for id_obj in identifiers
+             if id_obj.get("type") in ["ISBN_10", "ISBN_13"]),
+            None
+        )
+
+        return BookInfo(
+            title=info.get("title", title),
+            author=author,
+            isbn=isbn,
+            published_date=info.get("publishedDate"),
+            description=info.get("description"),
+            page_count=info.get("pageCount"),
+            categories=info.get("categories", []),
+            cover_url=info.get("imageLinks", {}).get("thumbnail"),
+            average_rating=info.get("averageRating")
+        )
+
+    def _fetch_from_open_library(self, title: str) -> Optional[BookInfo]:
+        """从 Open Library 获取书籍信息（降级方案）"""
+        # Open Library 搜索接口
+        search_url = f"{self.open_library_api}/search.json"
+        params = {"title": title, "limit": 1}
+        response = self._get(search_url, self.open_library_breaker, params=params)
+        data = response.json()
+
+        if data.get("numFound", 0) == 0:
+            return None
+
+        docs = data.get("docs", [])[0]
+
+        # 获取完整信息
+        work_key = docs.get("key", "")
+        if work_key:
+            work_url = f"{self.open_library_api}{work_key}.json"
+            work_response = self._get(work_url, self.open_library_breaker)
+            work_data = work_response.json()
+
+            # Open Library 的简介可能是 {"type": ..., "value": ...} 结构
+            description = work_data.get("description")
+            if isinstance(description, dict):
+                description = description.get("value")
+
+            return BookInfo(
+                title=docs.get("title", title),
+                author=docs.get("author_name", ["未知作者"])[0],
+                isbn=docs.get("isbn", [None])[0],
+                published_date=docs.get("first_publish_year"),
+                description=description,
+                page_count=docs.get("number_of_pages"),
+                categories=docs.get("subject", []),
+                cover_url=f"https://covers.openlibrary.org/b/OLID/{work_key.split('/')[-1]}-M.jpg"
+            )
+        return None
+
 
 class BookDeepAnalyzer:
     """书籍深度分析器 - 使用LLM生成深度解读"""
 
-    def __init__(self, api_key: str = None):
+    # 调用记录中的服务商名称
+    provider = "groq"
+
+    def __init__(
+        self,
+        api_key: str = None,
+        model: str = "llama3-70b-8192",
+        temperature: float = 0.7,
+        cache: Optional[AnalysisCache] = None,
+        use_cache: bool = True,
+        sectioned: bool = False
+    ):
+        """
+        api_key: Groq API Key
+        model: 模型名称，例如 "llama3-70b-8192" 或 "mixtral-8x7b-32768"
+        temperature: 生成温度
+        cache: 分析结果缓存（默认使用 ./cache/analysis_cache.db）
+        use_cache: 是否启用缓存
+        sectioned: 分段并发分析（见 ANALYSIS_SECTIONS），延迟更低但输入token约为4倍
+        """
         self.api_key = api_key or GROQ_API_KEY
         self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.model = model
+        self.temperature = temperature
+        self.sectioned = sectioned
+        self.breaker = get_breaker("groq", max_timeout=60, min_timeout=15)
+        self._init_cache(cache, use_cache)
+
+    def _init_cache(self, cache: Optional[AnalysisCache], use_cache: bool):
+        """
+        初始化分析缓存
+        旧提示词版本的条目不会命中（版本计入缓存键），由 python analysis_cache.py prune 手动清理
+        """
+        if cache is None and use_cache:
+            cache = AnalysisCache()
+        self.cache = cache
+
+    def prompt_version(self) -> str:
+        """提示词版本号 + 提示词模板指纹（整体与分段提示词）"""
+        placeholder = BookInfo(title="{title}", author="{author}", description="{description}",
+                               categories=["{categories}"])
+        templates = [self._build_analysis_prompt(placeholder)]
+        templates += [self._build_section_prompt(placeholder, name) for name in ANALYSIS_SECTIONS]
+        fingerprint = hashlib.sha256("\n".join(templates).encode("utf-8")).hexdigest()[:12]
+        return f"{ANALYSIS_PROMPT_VERSION}:{fingerprint}"
+
+    def _analysis_cache_key(self, book_info: BookInfo) -> str:
+        # 分段与整体分析的结果分开缓存
+        model = f"{self.model}#sectioned" if self.sectioned else self.model
+        return make_analysis_key(self.prompt_version(), model, self.temperature, asdict(book_info))
+
+    def _get_cached_analysis(self, book_info: BookInfo) -> Optional[Dict]:
+        if self.cache is None:
+            return None
+        return self.cache.get(self._analysis_cache_key(book_info))
+
+    def _cache_analysis(self, book_info: BookInfo, analysis: Dict):
+        if self.cache is not None:
+            self.cache.put(
+                self._analysis_cache_key(book_info), analysis,
+                self.prompt_version(), self.model, book_info.title
+            )
 
     def analyze_book(self, book_info: BookInfo) -> Dict:
         """
@@ -154,9 +597,160 @@ class BookDeepAnalyzer:
             "estimated_hours": float    # 预计阅读时长
         }
         """
-        prompt = self._build_analysis_prompt(book_info)
+        cached = self._get_cached_analysis(book_info)
+        if cached is not None:
+            return cached
 
         try:
+            analysis, _ = self.request_analysis(book_info)
+            return analysis
+
+        except Exception as e:
+            print(f"LLM分析错误: {e}")
+            get_telemetry().mark_fallback(e)
+            return self._fallback_analysis(book_info)
+
+    def request_analysis(self, book_info: BookInfo) -> Tuple[Dict, Dict]:
+        """
+        调用LLM分析书籍（不降级），失败时抛出异常，限流时抛出 RateLimitError
+        进程内相同的分析同时只调用一次LLM，其余调用共享结果（共享时 usage 为空）
+        返回: (分析结果, {"usage": token用量, "rate_limits": 限流响应头, "complete": 是否完整})
+        complete 为 False 时输出被截断，结果中带 INCOMPLETE_MARKER，未写入缓存，调用方应重试或记为失败
+        """
+        key = self._analysis_cache_key(book_info)
+        (analysis, meta), shared = _analysis_flight.do(key, lambda: self._request_analysis(book_info))
+        if shared:
+            meta = {"usage": {}, "rate_limits": meta["rate_limits"], "complete": meta["complete"]}
+        return analysis, meta
+
+    def _request_analysis(self, book_info: BookInfo) -> Tuple[Dict, Dict]:
+        # 刚结束的相同请求已写入缓存时直接返回
+        cached = self._get_cached_analysis(book_info)
+        if cached is not None:
+            return cached, {"usage": {}, "rate_limits": {}, "complete": True}
+
+        if self.sectioned:
+            analysis = {}
+            usages, limits = [], []
+            complete = True
+            for _, section, meta in self._iter_sections(book_info):
+                analysis.update(section)
+                usages.append(meta["usage"])
+                limits.append(meta["rate_limits"])
+                complete = complete and meta["complete"]
+            # 保持与整体分析相同的字段顺序
+            analysis = {field: analysis[field] for field in ANALYSIS_FIELDS}
+            usage = {}
+            for item in usages:
+                for name, value in item.items():
+                    if isinstance(value, (int, float)):
+                        usage[name] = usage.get(name, 0) + value
+            rate_limits = _merge_rate_limits(limits)
+            cacheable = complete or _meets_minimums(analysis)
+        else:
+            analysis, usage, rate_limits, complete = self._complete_json(
+                self._build_analysis_prompt(book_info), book_info.title
+            )
+            analysis, cacheable = self._fill_missing_fields(book_info, analysis, complete)
+
+        analysis = self._finish_analysis(book_info, analysis, cacheable)
+        return analysis, {"usage": usage, "rate_limits": rate_limits, "complete": cacheable}
+
+    def _finish_analysis(self, book_info: BookInfo, analysis: Dict, cacheable: bool) -> Dict:
+        """完整的结果写入缓存；截断且恢复不足的结果不缓存，并加上 INCOMPLETE_MARKER"""
+        if cacheable:
+            self._cache_analysis(book_info, analysis)
+            return analysis
+        return {**analysis, INCOMPLETE_MARKER: True}
+
+    def _fill_missing_fields(
+        self,
+        book_info: BookInfo,
+        analysis: Dict,
+        complete: bool = False
+    ) -> Tuple[Dict, bool]:
+        """
+        输出被截断时，用降级内容补齐缺少的字段，保留已生成的内容
+        complete: JSON 是否完整生成（未截断）
+        返回: (补齐后的结果, 是否可以缓存)
+        缺少核心字段，或截断后恢复的核心数组达不到提示词要求的条目数时不缓存，下次重新分析
+        """
+        missing = [field for field in ANALYSIS_FIELDS if field not in analysis]
+        cacheable = not any(field in missing for field in CORE_ANALYSIS_FIELDS) and (
+            complete or _meets_minimums(analysis)
+        )
+        if not missing:
+            return analysis, cacheable
+
+        print(f"⚠️ 输出不完整，已恢复 {len(ANALYSIS_FIELDS) - len(missing)} 个字段，"
+              f"缺少的 {', '.join(missing)} 使用降级内容")
+        fallback = self._fallback_analysis(book_info)
+        analysis = dict(analysis)
+        for field in missing:
+            analysis[field] = fallback[field]
+        return analysis, cacheable
+
+    def _iter_sections(self, book_info: BookInfo) -> Iterator[Tuple[str, Dict, Dict]]:
+        """
+        并发请求各分段，按完成顺序产出 (分段名, 该段结果, {"usage", "rate_limits", "complete"})
+        任一分段失败时抛出异常
+        """
+        with ThreadPoolExecutor(max_workers=len(ANALYSIS_SECTIONS)) as executor:
+            futures = {
+                executor.submit(
+                    self._complete_json, self._build_section_prompt(book_info, name),
+                    book_info.title, f"analysis:{name}", ANALYSIS_SECTIONS[name][0]
+                ): name
+                for name in ANALYSIS_SECTIONS
+            }
+            try:
+                for future in as_completed(futures):
+                    name = futures[future]
+                    result, usage, rate_limits, complete = future.result()
+                    section = {field: result[field] for field in ANALYSIS_SECTIONS[name][0]}
+                    yield name, section, {"usage": usage, "rate_limits": rate_limits, "complete": complete}
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _complete_json(
+        self,
+        prompt: str,
+        book_title: str = "",
+        operation: str = "analysis",
+        required_fields: Iterable[str] = ()
+    ) -> Tuple[Dict, Dict, Dict, bool]:
+        """
+        请求LLM并解析JSON回复（记录到LLM调用监控）
+        required_fields: 回复中必须包含的字段，缺少时抛出 ValueError
+        返回: (解析结果, token用量, 限流响应头, JSON是否完整)
+        """
+        with get_telemetry().track(self.provider, self.model, operation, book_title) as call:
+            content, usage, rate_limits = self._chat_completion(prompt)
+            call.set_usage(usage)
+            call.json_ok = False
+            result, complete = self._parse_json(content)
+            if not isinstance(result, dict):
+                raise ValueError("无法解析JSON")
+            missing = [field for field in required_fields if field not in result]
+            if missing:
+                raise ValueError(f"回复缺少字段: {', '.join(missing)}")
+            call.json_ok = complete
+        return result, usage, rate_limits, complete
+
+    def _parse_json(self, content: str) -> Tuple[Optional[Dict], bool]:
+        """
+        解析LLM回复中的JSON
+        返回: (解析结果, 是否完整)；输出被截断时为恢复出的部分字段
+        """
+        return extract_json(content)
+
+    def _chat_completion(self, prompt: str) -> Tuple[str, Dict, Dict]:
+        """
+        调用 Groq 对话接口
+        返回: (生成内容, token用量, 限流响应头)
+        """
+        def request(timeout: float):
             response = requests.post(
                 self.api_url,
                 headers={
@@ -164,22 +758,167 @@ class BookDeepAnalyzer:
                     "Content-Type": "application/json"
                 },
                 json={
-                    "model": "llama3-70b-8192",  # 或 "mixtral-8x7b-32768"
+                    "model": self.model,
                     "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
+                    "temperature": self.temperature,
                     "response_format": {"type": "json_object"}
                 },
-                timeout=60
+                timeout=timeout
+            )
+            # 429 是限流而不是服务故障，不计入熔断
+            if response.status_code != 429:
+                response.raise_for_status()
+            return response
+
+        # 熔断时直接抛出 CircuitOpenError
+        response = self.breaker.call(request)
+        rate_limits = parse_rate_limit_headers(response.headers)
+        if response.status_code == 429:
+            raise RateLimitError(
+                rate_limits["retry_after"] or rate_limits["reset_requests"] or 1.0,
+                rate_limits
             )
-            response.raise_for_status()
 
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            return json.loads(content)
+        result = response.json()
+        content = result["choices"][0]["message"]["content"]
+        return content, result.get("usage", {}), rate_limits
 
+    def analyze_book_stream(self, book_info: BookInfo) -> Iterator[Tuple[str, Any]]:
+        """
+        流式分析书籍，每生成完一条内容就立即返回，便于页面逐条渲染
+        依次产出 (字段, 值)：
+            ("key_insights", str)   # 一条核心观点
+            ("quotes", str)         # 一条金句
+            ("mind_map", Dict)      # 思维导图的一个主要分支
+            ("complete", Dict)      # 最终完整结果（与 analyze_book 返回格式相同）
+        """
+        cached = self._get_cached_analysis(book_info)
+        if cached is not None:
+            for field, item in _iter_stream_items(cached):
+                yield field, item
+            yield "complete", cached
+            return
+
+        # 相同的分析正在进行时，等待其结果，不再重复调用LLM
+        key = self._analysis_cache_key(book_info)
+        while True:
+            call, leader = _analysis_flight.begin(key)
+            if leader:
+                break
+            try:
+                analysis, _ = _analysis_flight.wait(call)
+            except FlightAbandoned:
+                continue
+            except Exception as e:
+                print(f"LLM流式分析错误: {e}")
+                yield "complete", self._fallback_analysis(book_info)
+                return
+            for field, item in _iter_stream_items(analysis):
+                yield field, item
+            yield "complete", analysis
+            return
+
+        result, error = None, FlightAbandoned()
+        try:
+            analysis = yield from self._stream_analysis(book_info)
+            result, error = (analysis, {
+                "usage": {}, "rate_limits": {}, "complete": not is_incomplete_analysis(analysis)
+            }), None
         except Exception as e:
-            print(f"LLM分析错误: {e}")
-            return self._fallback_analysis(book_info)
+            error = e
+            print(f"LLM流式分析错误: {e}")
+            get_telemetry().mark_fallback(e)
+        finally:
+            _analysis_flight.finish(key, call, result=result, error=error)
+
+        if error is not None:
+            yield "complete", self._fallback_analysis(book_info)
+            return
+        yield "complete", analysis
+
+    def _stream_analysis(self, book_info: BookInfo) -> Generator[Tuple[str, Any], None, Dict]:
+        """流式调用LLM，逐条产出内容并返回完整结果（写入缓存），失败时抛出异常"""
+        if self.sectioned:
+            # 分段模式：每个分段完成时输出该段的条目
+            analysis = {}
+            complete = True
+            for _, section, meta in self._iter_sections(book_info):
+                analysis.update(section)
+                complete = complete and meta["complete"]
+                for field, item in _iter_stream_items(section):
+                    yield field, item
+            analysis = {field: analysis[field] for field in ANALYSIS_FIELDS}
+            return self._finish_analysis(book_info, analysis, complete or _meets_minimums(analysis))
+
+        prompt = self._build_analysis_prompt(book_info)
+        parser = IncrementalJSONParser(STREAM_ITEM_PATHS)
+
+        with get_telemetry().track(self.provider, self.model, "analysis_stream", book_info.title) as call:
+            usage = {}
+            for chunk in self._stream_completion(prompt, usage):
+                call.mark_first_token()
+                for path, _, value in parser.feed(chunk):
+                    yield path[0], value
+            call.set_usage(usage)
+            call.json_ok = complete = False
+            try:
+                analysis = parser.result()
+                call.json_ok = complete = True
+            except json.JSONDecodeError:
+                # 输出被截断：恢复已完整生成的字段
+                analysis, _ = self._parse_json(parser.text)
+                if analysis is None:
+                    raise
+
+        analysis, cacheable = self._fill_missing_fields(book_info, analysis, complete)
+        return self._finish_analysis(book_info, analysis, cacheable)
+
+    def _stream_completion(self, prompt: str, usage: Optional[Dict] = None) -> Iterator[str]:
+        """
+        调用 Groq 流式接口（Server-Sent Events），逐段返回生成的文本
+        usage: 传入字典时，结束后写入token用量
+        """
+        def request(timeout: float):
+            response = requests.post(
+                self.api_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": self.model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": self.temperature,
+                    "response_format": {"type": "json_object"},
+                    "stream": True
+                },
+                timeout=timeout,
+                stream=True
+            )
+            response.raise_for_status()
+            return response
+
+        def read(response) -> Iterator[str]:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    # Groq 在最后一个事件的 x_groq.usage 中返回用量
+                    event_usage = event.get("usage") or (event.get("x_groq") or {}).get("usage")
+                    if event_usage and usage is not None:
+                        usage.update(event_usage)
+                    if not event.get("choices"):
+                        continue
+                    delta = event["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        yield delta["content"]
+
+        # 响应体读取中途断开也计为失败（熔断器要覆盖整个流，而不只是等待响应头）
+        yield from self.breaker.stream(request, read)
 
     def _build_analysis_prompt(self, book_info: BookInfo) -> str:
         """构建分析提示词"""
@@ -239,6 +978,22 @@ class BookDeepAnalyzer:
 4. 难度评级要准确
 5. 预计阅读时长基于普通读者（每小时20-30页）"""
 
+    def _build_section_prompt(self, book_info: BookInfo, section: str) -> str:
+        """构建分段分析提示词（只要求返回该分段的字段）"""
+        _, schema, notes = ANALYSIS_SECTIONS[section]
+        return f"""你是一位专业的阅读顾问和书籍分析师。请对以下书籍进行深度分析，并以JSON格式返回结果。
+
+书籍信息：
+- 书名：{book_info.title}
+- 作者：{book_info.author}
+- 分类：{', '.join(book_info.categories)}
+- 简介：{book_info.description or '暂无简介'}
+
+请只提供以下分析（必须是JSON格式，不要包含其他字段）：
+{schema}
+
+注意：{notes}"""
+
     def _fallback_analysis(self, book_info: BookInfo) -> Dict:
         """降级方案：当API失败时返回基础分析"""
         return {
@@ -270,7 +1025,8 @@ class BookDeepAnalyzer:
             "difficulty": "中级",
             "estimated_hours": book_info.page_count / 25 if book_info.page_count else 10,
             "target_readers": ["对该领域感兴趣的读者"],
-            "prerequisite_knowledge": []
+            "prerequisite_knowledge": [],
+            FALLBACK_MARKER: True
         }
 
 
@@ -0,0 +1,203 @@
+"""
+DeepRead - 书籍向量中心与相似度矩阵
+每本书保存卡片embedding（归一化后）的向量和与卡片数，中心 = 向量和 / 卡片数
+书×书余弦相似度矩阵常驻内存，添加卡片时只更新该书对应的一行一列
+查相关书籍只需读取矩阵的一行，结果与各书卡片数量无关
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class BookCentroidIndex:
+    """
+    书籍中心向量索引（SQLite 持久化向量和，相似度矩阵启动时计算一次）
+    累加在写事务内基于数据库中的当前值进行；其他实例/进程提交的修改通过 data_version 发现后整体重载
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # isolation_level=None：手动控制事务，累加时使用 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS book_centroids (
+                book_title TEXT PRIMARY KEY,
+                book_author TEXT,
+                card_count INTEGER NOT NULL,
+                vector_sum BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+        self._titles: List[str] = []
+        self._authors: List[str] = []
+        self._position: Dict[str, int] = {}
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._sums: Optional[np.ndarray] = None
+        self._units: Optional[np.ndarray] = None
+        self._similarity = np.zeros((0, 0), dtype=np.float32)
+        self._data_version = None
+        self._refresh()
+
+    def _refresh(self):
+        """其他连接提交过修改时（PRAGMA data_version 变化）从数据库整体重载，调用方需持有 self._lock"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        rows = self._conn.execute(
+            "SELECT book_title, book_author, card_count, vector_sum FROM book_centroids ORDER BY book_title"
+        ).fetchall()
+        self._titles = [r[0] for r in rows]
+        self._authors = [r[1] or "" for r in rows]
+        self._position = {title: i for i, title in enumerate(self._titles)}
+        self._counts = np.array([r[2] for r in rows], dtype=np.int64)
+        if rows:
+            self._sums = np.stack([np.frombuffer(r[3], dtype=np.float64) for r in rows])
+            self._units = self._normalize(self._sums)
+            self._similarity = (self._units @ self._units.T).astype(np.float32)
+        else:
+            self._sums = self._units = None
+            self._similarity = np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    @property
+    def total_cards(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._counts.sum())
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._titles)
+
+    def add_cards(
+        self,
+        book_title: str,
+        book_author: str,
+        embeddings,
+        updated_at: Optional[float] = None
+    ) -> None:
+        """
+        把一本书新增卡片的embedding累加进中心，并更新相似度矩阵的对应行列
+        updated_at: 记录的更新时间，默认为当前时间（重建索引时传入原来的时间）
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        if embeddings.ndim != 2 or len(embeddings) == 0:
+            return
+        # 每张卡片先归一化，避免个别长文本卡片主导中心
+        vector_sum = self._normalize(embeddings).sum(axis=0)
+
+        with self._lock:
+            # 在写事务内读取数据库中的当前累加值再加上本次的，并发会话不会互相覆盖
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                if self._sums is not None and self._sums.shape[1] != vector_sum.shape[0]:
+                    raise ValueError(f"向量维度应为 {self._sums.shape[1]}，实际为 {vector_sum.shape[0]}")
+                i = self._position.get(book_title)
+                count = len(embeddings) + (int(self._counts[i]) if i is not None else 0)
+                total = vector_sum + (self._sums[i] if i is not None else 0)
+                author = book_author or (self._authors[i] if i is not None else "")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO book_centroids "
+                    "(book_title, book_author, card_count, vector_sum, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (book_title, author, count, total.tobytes(),
+                     time.time() if updated_at is None else updated_at)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            # 提交成功后更新内存中的中心与相似度矩阵
+            if i is None:
+                i = len(self._titles)
+                self._position[book_title] = i
+                self._titles.append(book_title)
+                self._authors.append(author)
+                self._counts = np.append(self._counts, 0)
+                empty = np.zeros((1, vector_sum.shape[0]))
+                self._sums = empty if self._sums is None else np.vstack([self._sums, empty])
+                self._units = empty.copy() if self._units is None else np.vstack([self._units, empty])
+                similarity = np.zeros((i + 1, i + 1), dtype=np.float32)
+                similarity[:i, :i] = self._similarity
+                self._similarity = similarity
+
+            self._sums[i] = total
+            self._counts[i] = count
+            self._authors[i] = author
+            self._units[i] = self._normalize(self._sums[i])
+
+            # 只重算第 i 行/列：O(书籍数 × 维度)
+            row = (self._units @ self._units[i]).astype(np.float32)
+            self._similarity[i, :] = row
+            self._similarity[:, i] = row
+
+    def books(self, updated_since: Optional[float] = None) -> List[Dict]:
+        """书籍列表（按书名排序）；updated_since 只返回该时间戳之后有新卡片的书"""
+        sql = "SELECT book_title, book_author, card_count, updated_at FROM book_centroids"
+        params = ()
+        if updated_since is not None:
+            sql += " WHERE updated_at > ?"
+            params = (updated_since,)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY book_title", params).fetchall()
+        return [
+            {"title": r[0], "author": r[1] or "", "count": r[2], "updated_at": r[3]}
+            for r in rows
+        ]
+
+    def touch(self, book_titles: List[str], updated_at: Optional[float] = None):
+        """把这些书标记为有更新（增量导出会包含它们）"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE book_centroids SET updated_at = ? WHERE book_title = ?",
+                [(time.time() if updated_at is None else updated_at, title) for title in book_titles]
+            )
+
+    def related(self, book_title: str, n_results: int = 3) -> List[Dict]:
+        """读取相似度矩阵的一行，返回最相似的其他书籍"""
+        with self._lock:
+            self._refresh()
+            i = self._position.get(book_title)
+            if i is None:
+                return []
+            row = self._similarity[i]
+            # 排除本书自身和没有有效中心的书（如零向量），其他书不足 n_results 本时返回更少
+            candidates = np.nonzero(np.isfinite(row) & (np.arange(len(row)) != i))[0]
+            order = candidates[np.argsort(-row[candidates], kind="stable")][:n_results]
+            return [
+                {
+                    "title": self._titles[j],
+                    "author": self._authors[j],
+                    "similarity": float(row[j]),
+                    "count": int(self._counts[j]),
+                }
+                for j in order
+            ]
+
+    def clear(self):
+        """清空索引（重建前调用）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM book_centroids")
+            self._titles, self._authors, self._position = [], [], {}
+            self._counts = np.zeros(0, dtype=np.int64)
+            self._sums = self._units = None
+            self._similarity = np.zeros((0, 0), dtype=np.float32)
@@ -0,0 +1,238 @@
+"""
+DeepRead - 外部服务熔断器
+连续失败达到阈值后熔断，直接走降级方案，不再等待超时；
+超时时间根据近期响应延迟的 p95 自适应调整
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+CLOSED = "closed"          # 正常
+OPEN = "open"              # 熔断中，直接失败
+HALF_OPEN = "half_open"    # 试探恢复，只放行一个请求
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时抛出，调用方应直接走降级方案"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} 已熔断，{retry_in:.0f}秒后重试")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    单个外部服务的熔断器（线程安全）
+    - 连续失败 failure_threshold 次后打开，recovery_timeout 秒后半开试探
+    - 超时 = clamp(近期成功请求延迟 p95 × timeout_multiplier, min_timeout, max_timeout)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_timeout: float,
+        min_timeout: float = 1.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        timeout_multiplier: float = 2.0,
+        window: int = 50,
+        min_samples: int = 10
+    ):
+        """
+        name: 服务名称
+        max_timeout: 超时上限（即原来的固定超时）
+        min_timeout: 超时下限
+        failure_threshold: 连续失败多少次后熔断
+        recovery_timeout: 熔断后多少秒进入半开状态
+        timeout_multiplier: 超时相对 p95 延迟的倍数
+        window: 统计延迟的最近请求数
+        min_samples: 样本数不足时使用 max_timeout
+        """
+        self.name = name
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "rejected": 0, "trips": 0}
+
+    # ---------- 状态 ----------
+    def _p95(self) -> Optional[float]:
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def current_timeout(self) -> float:
+        """当前应使用的超时时间（秒）"""
+        with self._lock:
+            p95 = self._p95()
+        if p95 is None:
+            return self.max_timeout
+        return max(self.min_timeout, min(self.max_timeout, p95 * self.timeout_multiplier))
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def _before_call(self):
+        with self._lock:
+            self._stats["calls"] += 1
+            if self._state == OPEN:
+                elapsed = time.monotonic() - self._opened_at
+                if elapsed < self.recovery_timeout:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+                self._state = HALF_OPEN
+
+            if self._state == HALF_OPEN:
+                if self._trial_in_flight:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.recovery_timeout)
+                self._trial_in_flight = True
+
+    def record_success(self, latency: Optional[float] = None):
+        """
+        记录一次成功调用
+        latency: 调用耗时；为 None 时不计入延迟统计
+        """
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self._consecutive_failures = 0
+            self._state = CLOSED
+            self._trial_in_flight = False
+            self._stats["successes"] += 1
+
+    def record_failure(self, latency: Optional[float] = None):
+        """
+        记录一次失败调用，达到阈值时熔断
+        latency: 失败前等待的时间；超时也计入延迟统计，使超时能随服务变慢而放宽
+        """
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self._consecutive_failures += 1
+            self._stats["failures"] += 1
+            was_trial = self._state == HALF_OPEN
+            self._trial_in_flight = False
+            if was_trial or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats["trips"] += 1
+                    print(f"⚠️ {self.name} 连续失败，已熔断 {self.recovery_timeout:.0f} 秒")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _release_trial(self):
+        """放弃本次调用（不计成功也不计失败），释放半开试探名额"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def call(self, func: Callable[[float], T]) -> T:
+        """
+        通过熔断器调用外部服务
+        func: 接收超时时间（秒）作为参数的函数，抛出异常即视为失败
+        熔断时抛出 CircuitOpenError
+        """
+        self._before_call()
+        timeout = self.current_timeout()
+        start = time.monotonic()
+        finished = False
+        try:
+            result = func(timeout)
+            finished = True
+        except Exception:
+            finished = True
+            self.record_failure(time.monotonic() - start)
+            raise
+        finally:
+            if not finished:
+                # KeyboardInterrupt 等不代表服务故障，不计成败，但要释放半开试探名额，否则熔断器永远停在半开
+                self._release_trial()
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def stream(self, func: Callable[[float], T], read: Callable[[T], Iterator[U]]) -> Iterator[U]:
+        """
+        通过熔断器调用流式接口：响应体读完才算成功，读取中途出错也计为失败
+        func: 接收超时时间（秒）作为参数、返回响应的函数
+        read: 从响应中逐段读取内容的生成器函数
+        流式调用不计入延迟统计：响应头很快返回，计入后会把同一熔断器上阻塞调用的超时压到下限
+        调用方中途停止读取时不计成败
+        """
+        self._before_call()
+        timeout = self.current_timeout()
+        finished = False
+        try:
+            yield from read(func(timeout))
+            finished = True
+        except Exception:
+            finished = True
+            self.record_failure()
+            raise
+        finally:
+            if not finished:
+                # GeneratorExit（调用方提前关闭生成器）、KeyboardInterrupt 等：只释放半开试探名额
+                self._release_trial()
+        self.record_success()
+
+    def reset(self):
+        """手动恢复为正常状态"""
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def snapshot(self) -> Dict:
+        """监控用的状态快照"""
+        state = self.state
+        timeout = self.current_timeout()
+        with self._lock:
+            p95 = self._p95()
+            return {
+                "name": self.name,
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "timeout": round(timeout, 2),
+                "p95_latency": round(p95, 3) if p95 is not None else None,
+                **self._stats,
+            }
+
+
+# ==================== 全局注册表 ====================
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str, max_timeout: float, **kwargs) -> CircuitBreaker:
+    """获取（首次调用时创建）进程内共享的熔断器"""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, max_timeout=max_timeout, **kwargs)
+            _breakers[name] = breaker
+        return breaker
+
+
+def breaker_states() -> Dict[str, Dict]:
+    """所有熔断器的状态（用于监控页面）"""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
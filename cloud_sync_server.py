@@ -12,6 +12,8 @@ DeepRead Cloud Sync Server
 
 from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import sqlite3
@@ -93,6 +95,16 @@ def init_server_database():
         )
     ''')
 
+    # 访问token表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_tokens (
+            token TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
     # 同步历史表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS sync_history (
@@ -134,15 +146,21 @@ def generate_token(user_id: str) -> str:
     return hashlib.sha256(token_data.encode()).hexdigest()
 
 
+def store_token(cursor, user_id: str, token: str):
+    """保存登录/注册时签发的token"""
+    cursor.execute('INSERT OR REPLACE INTO user_tokens (token, user_id) VALUES (?, ?)', (token, user_id))
+
+
 def verify_token(token: str) -> Optional[str]:
-    """验证token并返回user_id"""
-    # 简化版本，实际应该查询数据库
+    """验证token并返回user_id（无效时返回None）"""
+    if not token:
+        return None
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT id FROM users WHERE id = (SELECT user_id FROM user_tokens WHERE token = ?)', (token,))
-    # 这里简化处理，实际应该有专门的token表
+    row = cursor.fetchone()
     conn.close()
-    return None  # 暂时返回None，需要实现token存储和验证
+    return row['id'] if row else None
 
 
 # ==================== 认证依赖 ====================
@@ -193,6 +211,7 @@ async def register(user: UserRegister):
 
         # 生成token
         token = generate_token(user_id)
+        store_token(cursor, user_id, token)
 
         conn.commit()
         conn.close()
@@ -235,6 +254,7 @@ async def login(user: UserLogin):
 
         # 生成token
         token = generate_token(user_id)
+        store_token(cursor, user_id, token)
 
         # 更新最后登录时间
         cursor.execute('UPDATE users SET last_sync = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
@@ -377,6 +397,53 @@ async def sync_status():
     }
 
 
+# ==================== 封面图片 ====================
+@app.get("/covers/{digest}/{size}.webp")
+async def get_cover(digest: str, size: int):
+    """
+    返回本地封面缩略图
+    文件按内容哈希寻址、内容永不变化，因此允许浏览器长期缓存
+    """
+    from cover_store import get_cover_store, COVER_CACHE_CONTROL
+
+    if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        raise HTTPException(status_code=400, detail="Invalid cover digest")
+
+    path = get_cover_store().path_for(digest, size)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Cover not found")
+
+    return FileResponse(
+        path,
+        media_type="image/webp",
+        headers={"Cache-Control": COVER_CACHE_CONTROL}
+    )
+
+
+@app.get("/covers")
+async def get_cover_by_url(url: str, size: int = 128, token: str = Header(...)):
+    """
+    下载（首次）并重定向到内容寻址的封面地址
+    需要登录token，且只接受 Open Library / 豆瓣 / Google Books 的封面地址
+    """
+    from cover_store import get_cover_store, is_allowed_cover_url
+
+    if not await run_in_threadpool(verify_token, token):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not is_allowed_cover_url(url):
+        raise HTTPException(status_code=400, detail="Cover host not allowed")
+
+    store = get_cover_store()
+    digest = await run_in_threadpool(store.ingest, url)
+    if not digest:
+        raise HTTPException(status_code=404, detail="Cover not available")
+
+    return RedirectResponse(
+        url=f"/covers/{digest}/{store.pick_size(size)}.webp",
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+
 # ==================== 启动服务器 ====================
 if __name__ == "__main__":
     import uvicorn
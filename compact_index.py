@@ -0,0 +1,419 @@
+"""
+DeepRead - 轻量向量索引
+面向几千张卡片的个人知识库：量化embedding（float16 / int8）存成内存映射文件，
+查询时用 NumPy 分块点积暴力检索，不依赖 chromadb / HNSW
+接口与 ChromaDB 的 PersistentClient / Collection 常用子集一致，可直接替换
+"""
+
+import json
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# int8 反量化比 float16 快一个数量级（NumPy 的 float16 转换没有向量化），默认使用 int8
+QUANTIZATIONS = ("int8", "float16")
+
+# 查询时每次反量化的行数（限制临时内存）
+SCAN_CHUNK_ROWS = 8192
+
+
+def _match(metadata: Dict, where: Optional[Dict]) -> bool:
+    """ChromaDB 风格的 where 过滤（支持 $and/$or 及 $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte）"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_match(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(_match(metadata, sub) for sub in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, target in condition.items():
+                if op == "$eq":
+                    ok = value == target
+                elif op == "$ne":
+                    ok = value != target
+                elif op == "$in":
+                    ok = value in target
+                elif op == "$nin":
+                    ok = value not in target
+                elif op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    ok = {
+                        "$gt": value > target, "$gte": value >= target,
+                        "$lt": value < target, "$lte": value <= target,
+                    }[op]
+                else:
+                    raise ValueError(f"不支持的过滤操作: {op}")
+                if not ok:
+                    return False
+    return True
+
+
+class CompactCollection:
+    """
+    单个collection：vectors.<量化类型>（内存映射）+ scales.f32（int8 每行缩放）+ rows.db（id/文档/元数据）
+    向量写入前做L2归一化，距离与 ChromaDB 的 cosine 空间一致（1 - 余弦相似度）
+    行数据常驻内存；写入时在 rows.db 的写事务内先读入其他实例/进程新写的行，
+    再从已提交的最后一行之后追加，不会覆盖别人写入的向量
+    """
+
+    def __init__(self, path: Path, name: str, quantization: str = "int8", client=None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization 只能是 {QUANTIZATIONS}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        self._client = client
+
+        self._lock = threading.Lock()
+        # isolation_level=None：手动控制事务，追加向量时使用 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            str(self.path / "rows.db"), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                document TEXT,
+                metadata TEXT
+            )
+        ''')
+
+        info = dict(self._conn.execute("SELECT key, value FROM info").fetchall())
+        self.quantization = info.get("quantization", quantization)
+        self.dim = int(info["dim"]) if "dim" in info else None
+        self._dtype = np.float16 if self.quantization == "float16" else np.int8
+
+        # id / 文档 / 元数据常驻内存（几千张卡片只占几MB），向量走内存映射
+        self._ids: List[str] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Dict] = []
+        self._row_of: Dict[str, int] = {}
+        self._vectors = None
+        self._scales = None
+        # where 条件 -> 匹配行号（写入新行后清空）
+        self._where_cache: Dict[str, np.ndarray] = {}
+        self._refresh()
+
+    def _refresh(self):
+        """读入 rows 表中本实例还没有的行（其他实例/进程写入的），调用方需持有 self._lock"""
+        new_rows = self._conn.execute(
+            "SELECT row, id, document, metadata FROM rows WHERE row >= ? ORDER BY row", (len(self._ids),)
+        ).fetchall()
+        if not new_rows:
+            return
+        if self.dim is None:
+            dim = self._conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+            self.dim = int(dim[0]) if dim else None
+        for row, card_id, document, metadata in new_rows:
+            self._row_of[card_id] = row
+            self._ids.append(card_id)
+            self._documents.append(document)
+            self._metadatas.append(json.loads(metadata) if metadata else {})
+        self._where_cache.clear()
+
+    @property
+    def _vector_path(self) -> Path:
+        return self.path / f"vectors.{self.quantization}"
+
+    def _mapped(self):
+        """按当前行数内存映射向量（及 int8 缩放系数）"""
+        n = len(self._ids)
+        if n == 0:
+            return None, None
+        if self._vectors is None or len(self._vectors) != n:
+            self._vectors = np.memmap(self._vector_path, dtype=self._dtype, mode="r", shape=(n, self.dim))
+            if self.quantization == "int8":
+                self._scales = np.memmap(self.path / "scales.f32", dtype=np.float32, mode="r", shape=(n,))
+        return self._vectors, self._scales
+
+    def _quantize(self, embeddings: np.ndarray):
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1, norms)
+        if self.quantization == "float16":
+            return embeddings.astype(np.float16), None
+        scales = np.abs(embeddings).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(embeddings / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    @staticmethod
+    def _write_at(path: Path, offset: int, data: np.ndarray):
+        """
+        从 offset（已提交行的末尾）开始写入；offset 之后只可能是中断写入留下的残余字节，直接覆盖
+        不截断文件：已提交的行永远不会被改写
+        """
+        with open(path, "r+b" if path.exists() else "wb") as f:
+            f.seek(offset)
+            f.write(data.tobytes())
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[Dict]] = None,
+        documents: Optional[List[str]] = None
+    ):
+        """追加写入（已存在的id跳过，与ChromaDB行为一致）"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+        if not (len(ids) == len(embeddings) == len(metadatas) == len(documents)):
+            raise ValueError("ids / embeddings / metadatas / documents 长度不一致")
+
+        with self._lock:
+            # 写事务串行化所有实例/进程的追加；事务内先同步别人已提交的行，再从真实末尾追加
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                keep, seen = [], set()
+                for i, card_id in enumerate(ids):
+                    if card_id not in self._row_of and card_id not in seen:
+                        keep.append(i)
+                        seen.add(card_id)
+                if not keep:
+                    self._conn.execute("COMMIT")
+                    return
+
+                dim = self.dim
+                if dim is None:
+                    dim = embeddings.shape[1]
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                        [("dim", str(dim)), ("quantization", self.quantization)]
+                    )
+                elif embeddings.shape[1] != dim:
+                    raise ValueError(f"向量维度应为 {dim}，实际为 {embeddings.shape[1]}")
+
+                quantized, scales = self._quantize(embeddings[keep])
+                start = len(self._ids)
+                row_bytes = dim * np.dtype(self._dtype).itemsize
+                self._write_at(self._vector_path, start * row_bytes, quantized)
+                if scales is not None:
+                    self._write_at(self.path / "scales.f32", start * 4, scales)
+
+                self._conn.executemany(
+                    "INSERT INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(start + n, ids[i], documents[i], json.dumps(metadatas[i], ensure_ascii=False))
+                     for n, i in enumerate(keep)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            # 提交成功后才更新内存状态
+            self.dim = dim
+            self._where_cache.clear()
+            for i in keep:
+                self._row_of[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+                self._documents.append(documents[i])
+                self._metadatas.append(metadatas[i])
+
+    def _select_rows(self, where: Optional[Dict]) -> np.ndarray:
+        if not where:
+            return np.arange(len(self._ids))
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        if key not in self._where_cache:
+            self._where_cache[key] = np.array(
+                [i for i, m in enumerate(self._metadatas) if _match(m, where)], dtype=np.int64
+            )
+        return self._where_cache[key]
+
+    def _dequantize(self, rows) -> np.ndarray:
+        """rows: 行号数组或切片（连续行用切片，避免花式索引的额外拷贝）"""
+        vectors, scales = self._mapped()
+        chunk = np.asarray(vectors[rows], dtype=np.float32)
+        if scales is not None:
+            chunk *= scales[rows][:, None]
+        return chunk
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict:
+        """按id/过滤条件读取（按写入顺序，支持分页）"""
+        include = include if include is not None else ["documents", "metadatas"]
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = np.array([self._row_of[i] for i in ids if i in self._row_of], dtype=np.int64)
+                if where:
+                    rows = np.array([r for r in rows if _match(self._metadatas[r], where)], dtype=np.int64)
+            else:
+                rows = self._select_rows(where)
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+
+            result = {"ids": [self._ids[r] for r in rows]}
+            result["documents"] = [self._documents[r] for r in rows] if "documents" in include else None
+            result["metadatas"] = [self._metadatas[r] for r in rows] if "metadatas" in include else None
+            result["embeddings"] = (
+                self._dequantize(rows) if "embeddings" in include and len(rows) else
+                (np.zeros((0, self.dim or 0), dtype=np.float32) if "embeddings" in include else None)
+            )
+        return result
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict:
+        """余弦相似度暴力检索，返回与 ChromaDB 相同结构（每个查询一个列表）"""
+        include = include if include is not None else ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self._refresh()
+            rows = self._select_rows(where)
+            k = min(n_results, len(rows))
+            if k == 0:
+                top_rows = [np.zeros(0, dtype=np.int64) for _ in queries]
+                top_scores = [np.zeros(0, dtype=np.float32) for _ in queries]
+            else:
+                # 分块反量化 + 矩阵乘，内存占用与 SCAN_CHUNK_ROWS 成正比
+                scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+                for start in range(0, len(rows), SCAN_CHUNK_ROWS):
+                    end = min(start + SCAN_CHUNK_ROWS, len(rows))
+                    chunk_rows = slice(start, end) if not where else rows[start:end]
+                    scores[:, start:end] = queries @ self._dequantize(chunk_rows).T
+
+                top_rows, top_scores = [], []
+                for q in range(len(queries)):
+                    best = np.argpartition(-scores[q], k - 1)[:k]
+                    best = best[np.argsort(-scores[q][best])]
+                    top_rows.append(rows[best])
+                    top_scores.append(scores[q][best])
+
+            result = {"ids": [[self._ids[r] for r in r_list] for r_list in top_rows]}
+            result["documents"] = (
+                [[self._documents[r] for r in r_list] for r_list in top_rows] if "documents" in include else None
+            )
+            result["metadatas"] = (
+                [[self._metadatas[r] for r in r_list] for r_list in top_rows] if "metadatas" in include else None
+            )
+            result["distances"] = (
+                [(1 - s).tolist() for s in top_scores] if "distances" in include else None
+            )
+            result["embeddings"] = (
+                [self._dequantize(r_list) for r_list in top_rows] if "embeddings" in include else None
+            )
+        return result
+
+    def modify(self, name: Optional[str] = None, metadata: Optional[Dict] = None):
+        """重命名collection（由所属 CompactClient 移动目录）"""
+        if name and name != self.name:
+            self._client._rename(self, name)
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._scales = None
+            self._conn.close()
+
+
+class CompactClient:
+    """
+    与 chromadb.PersistentClient 接口一致的轻量客户端
+    每个collection一个子目录
+    """
+
+    def __init__(self, path: str, quantization: str = "int8"):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization 只能是 {QUANTIZATIONS}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.quantization = quantization
+        self._collections: Dict[str, CompactCollection] = {}
+        self._lock = threading.Lock()
+
+    def _open(self, name: str) -> CompactCollection:
+        if name not in self._collections:
+            self._collections[name] = CompactCollection(self.path / name, name, self.quantization, self)
+        return self._collections[name]
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict] = None) -> CompactCollection:
+        with self._lock:
+            return self._open(name)
+
+    def create_collection(self, name: str, metadata: Optional[Dict] = None) -> CompactCollection:
+        with self._lock:
+            if name in self._collections or (self.path / name).exists():
+                raise ValueError(f"Collection {name} 已存在")
+            return self._open(name)
+
+    def get_collection(self, name: str) -> CompactCollection:
+        with self._lock:
+            if name not in self._collections and not (self.path / name).exists():
+                raise ValueError(f"Collection {name} 不存在")
+            return self._open(name)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            if name not in self._collections and not (self.path / name).exists():
+                raise ValueError(f"Collection {name} 不存在")
+            collection = self._collections.pop(name, None)
+            if collection:
+                collection.close()
+            shutil.rmtree(self.path / name, ignore_errors=True)
+
+    def list_collections(self) -> List[str]:
+        return sorted(p.name for p in self.path.iterdir() if p.is_dir())
+
+    def _rename(self, collection: CompactCollection, new_name: str):
+        with self._lock:
+            if (self.path / new_name).exists():
+                raise ValueError(f"Collection {new_name} 已存在")
+            old_name = collection.name
+            collection.close()
+            (self.path / old_name).rename(self.path / new_name)
+            self._collections.pop(old_name, None)
+            # 重新打开，保证 collection 对象在改名后仍可用
+            reopened = CompactCollection(self.path / new_name, new_name, self.quantization, self)
+            collection.__dict__.update(reopened.__dict__)
+            self._collections[new_name] = collection
+
+
+_compact_clients: Dict[str, CompactClient] = {}
+_registry_lock = threading.Lock()
+
+
+def get_compact_client(path: str, quantization: str = "int8") -> CompactClient:
+    """同一目录在进程内共享一个客户端（各会话的知识库共用同一组 collection 对象）"""
+    key = str(Path(path).resolve())
+    with _registry_lock:
+        if key not in _compact_clients:
+            _compact_clients[key] = CompactClient(path, quantization=quantization)
+        return _compact_clients[key]
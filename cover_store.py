@@ -0,0 +1,237 @@
+"""
+DeepRead - 书籍封面本地存储
+每个封面只下载一次，生成固定尺寸的WebP缩略图，按内容哈希存放在本地
+页面直接使用本地图片，不再每次从 Google / Open Library 加载
+"""
+
+import hashlib
+import io
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urljoin, urlparse
+
+import requests
+from PIL import Image
+
+DEFAULT_COVER_DIR = "./cache/covers"
+
+# 缩略图宽度（像素）
+COVER_SIZES = (64, 128, 256)
+
+# 内容寻址的文件永不变化，可长期缓存
+COVER_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 只从这些封面来源下载（含子域名）；Open Library 的封面会重定向到 archive.org
+COVER_HOSTS = (
+    "openlibrary.org", "archive.org",
+    "doubanio.com", "douban.com",
+    "googleapis.com", "books.google.com", "googleusercontent.com",
+)
+
+# 原图大小上限（字节）与像素上限，防止超大响应和解压炸弹
+MAX_COVER_BYTES = 5 * 1024 * 1024
+MAX_COVER_PIXELS = 25_000_000
+MAX_COVER_REDIRECTS = 3
+
+
+def is_allowed_cover_url(url: str) -> bool:
+    """只允许 http(s) 且主机属于 COVER_HOSTS 的封面地址"""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return False
+    host = (parsed.hostname or "").lower()
+    return parsed.scheme in ("http", "https") and any(
+        host == allowed or host.endswith("." + allowed) for allowed in COVER_HOSTS
+    )
+
+
+class CoverStore:
+    """
+    封面图片存储
+    - 以原图的 SHA-256 作为内容地址，相同图片只生成一份缩略图（原图不保存）
+    - 每张封面生成 COVER_SIZES 中各尺寸的WebP缩略图
+    - 封面URL到内容哈希的映射保存在SQLite中
+    """
+
+    def __init__(self, root: str = DEFAULT_COVER_DIR, sizes=COVER_SIZES, quality: int = 80):
+        """
+        root: 存储目录
+        sizes: 缩略图宽度列表
+        quality: WebP压缩质量
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.sizes = tuple(sorted(sizes))
+        self.quality = quality
+
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+
+        self._conn = sqlite3.connect(str(self.root / "covers.db"), check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS cover_urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def path_for(self, digest: str, size: int) -> Path:
+        """缩略图文件路径: <root>/ab/abcdef.../<size>.webp"""
+        return self.root / digest[:2] / digest / f"{size}.webp"
+
+    def pick_size(self, size: int) -> int:
+        """选择不小于所需宽度的最小缩略图尺寸"""
+        for candidate in self.sizes:
+            if candidate >= size:
+                return candidate
+        return self.sizes[-1]
+
+    def digest_for_url(self, cover_url: str) -> Optional[str]:
+        """查询已下载封面的内容哈希"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM cover_urls WHERE url = ?", (cover_url,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def ingest(self, cover_url: str) -> Optional[str]:
+        """
+        下载封面并生成缩略图（已下载过则直接返回）
+        返回: 内容哈希；地址不在允许的来源、下载或解码失败返回None
+        """
+        digest = self.digest_for_url(cover_url)
+        if digest:
+            return digest
+        if not is_allowed_cover_url(cover_url):
+            print(f"封面地址不在允许的来源中: {cover_url}")
+            return None
+
+        # 同一URL并发请求时只下载一次
+        with self._lock:
+            url_lock = self._url_locks.setdefault(cover_url, threading.Lock())
+
+        try:
+            with url_lock:
+                digest = self.digest_for_url(cover_url)
+                if digest:
+                    return digest
+
+                try:
+                    original = self._download(cover_url)
+                    digest = hashlib.sha256(original).hexdigest()
+
+                    if not self.path_for(digest, self.sizes[-1]).exists():
+                        self._write_thumbnails(digest, original)
+                except Exception as e:
+                    print(f"封面下载失败 {cover_url}: {e}")
+                    return None
+
+                # 写入映射后才释放该URL的锁，等待中的请求能直接查到结果
+                with self._lock:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO cover_urls (url, digest, fetched_at) VALUES (?, ?, ?)",
+                        (cover_url, digest, time.time())
+                    )
+                    self._conn.commit()
+                return digest
+        finally:
+            with self._lock:
+                self._url_locks.pop(cover_url, None)
+
+    def _download(self, cover_url: str) -> bytes:
+        """流式下载原图：每次重定向都检查来源，超过 MAX_COVER_BYTES 立即中止"""
+        url = cover_url
+        for _ in range(MAX_COVER_REDIRECTS + 1):
+            with self.session.get(url, timeout=10, stream=True, allow_redirects=False) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers["Location"])
+                    if not is_allowed_cover_url(url):
+                        raise ValueError(f"重定向到不允许的来源: {url}")
+                    continue
+                response.raise_for_status()
+                if int(response.headers.get("Content-Length") or 0) > MAX_COVER_BYTES:
+                    raise ValueError("封面文件过大")
+                chunks, size = [], 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > MAX_COVER_BYTES:
+                        raise ValueError("封面文件过大")
+                    chunks.append(chunk)
+                return b"".join(chunks)
+        raise ValueError("重定向次数过多")
+
+    def _write_thumbnails(self, digest: str, original: bytes):
+        """生成各尺寸WebP缩略图（先写临时文件再改名，避免读到半成品）"""
+        image = Image.open(io.BytesIO(original))
+        # 只读了文件头，解码前先检查像素数（不修改全局的 Image.MAX_IMAGE_PIXELS，以免影响其他图片处理）
+        if image.width * image.height > MAX_COVER_PIXELS:
+            raise ValueError(f"封面像素过多: {image.width}x{image.height}")
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+        for size in self.sizes:
+            thumb = image.copy()
+            # 宽度固定，高度按比例（封面一般为竖版，上限取1.6倍宽度）
+            thumb.thumbnail((size, int(size * 1.6)), Image.LANCZOS)
+
+            path = self.path_for(digest, size)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 临时文件名唯一，并发生成同一封面时不会互相覆盖
+            tmp_path = path.with_name(f"{size}.{uuid.uuid4().hex}.tmp")
+            thumb.save(tmp_path, "WEBP", quality=self.quality, method=4)
+            tmp_path.replace(path)
+
+    def cached_thumbnail(self, cover_url: Optional[str], size: int = 128) -> Optional[Path]:
+        """只查本地已有的缩略图，不触发下载"""
+        if not cover_url:
+            return None
+        digest = self.digest_for_url(cover_url)
+        if not digest:
+            return None
+        path = self.path_for(digest, self.pick_size(size))
+        return path if path.exists() else None
+
+    def prefetch(self, cover_url: Optional[str]):
+        """在后台线程下载封面（页面渲染时使用，不阻塞）"""
+        if not cover_url or not is_allowed_cover_url(cover_url):
+            return
+        with self._lock:
+            if cover_url in self._url_locks:
+                return
+        threading.Thread(target=self.ingest, args=(cover_url,), daemon=True).start()
+
+    def get_thumbnail(self, cover_url: Optional[str], size: int = 128) -> Optional[Path]:
+        """
+        获取封面缩略图的本地路径（必要时先下载）
+        size: 所需宽度，返回不小于该宽度的最小缩略图
+        """
+        if not cover_url:
+            return None
+        digest = self.ingest(cover_url)
+        if not digest:
+            return None
+        path = self.path_for(digest, self.pick_size(size))
+        return path if path.exists() else None
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: Optional[CoverStore] = None
+
+
+def get_cover_store() -> CoverStore:
+    """获取进程内共享的封面存储"""
+    global _default_store
+    if _default_store is None:
+        _default_store = CoverStore()
+    return _default_store
@@ -0,0 +1,211 @@
+"""
+DeepRead - 文本向量缓存
+按 (嵌入模型, 文本哈希) 缓存embedding，重建知识库索引时不必重新跑模型
+存储格式：每个模型一个 float32 定长向量文件（内存映射读取）+ SQLite 哈希索引
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_EMBEDDING_CACHE_DIR = "./cache/embeddings"
+
+
+def text_digest(text: str) -> str:
+    """文本内容哈希（SHA-256）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    embedding 磁盘缓存
+    向量只追加写入 <模型哈希>.f32，索引表记录 (模型, 文本哈希) -> 行号
+    多进程共用同一目录时，通过索引库的写事务串行化追加
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_EMBEDDING_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._maps: Dict[str, np.memmap] = {}
+        self._stats = {"hits": 0, "misses": 0, "writes": 0}
+
+        # isolation_level=None：手动控制事务，追加向量时使用 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            str(self.cache_dir / "index.db"), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (model, digest)
+            )
+        ''')
+
+    def _vector_path(self, model: str) -> Path:
+        return self.cache_dir / f"{text_digest(model)[:16]}.f32"
+
+    def _model_dim(self, model: str) -> Optional[int]:
+        row = self._conn.execute("SELECT dim FROM models WHERE model = ?", (model,)).fetchone()
+        return row[0] if row else None
+
+    def _vectors(self, model: str, dim: int, min_rows: int) -> np.memmap:
+        """内存映射向量文件；文件变长后重新映射"""
+        vectors = self._maps.get(model)
+        if vectors is None or len(vectors) < min_rows:
+            path = self._vector_path(model)
+            rows = path.stat().st_size // (dim * 4)
+            vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+            self._maps[model] = vectors
+        return vectors
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """批量查询，未命中的位置为None"""
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        if not texts:
+            return results
+
+        digests = [text_digest(text) for text in texts]
+        with self._lock:
+            dim = self._model_dim(model)
+            rows = {}
+            if dim is not None:
+                unique = list(set(digests))
+                # SQLite 单条语句的参数个数有限，分批查询
+                for start in range(0, len(unique), 500):
+                    chunk = unique[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows.update(self._conn.execute(
+                        f"SELECT digest, row FROM embeddings WHERE model = ? AND digest IN ({placeholders})",
+                        (model, *chunk)
+                    ).fetchall())
+
+            if rows:
+                vectors = self._vectors(model, dim, max(rows.values()) + 1)
+                for i, digest in enumerate(digests):
+                    if digest in rows:
+                        results[i] = np.array(vectors[rows[digest]])
+
+            hits = sum(1 for r in results if r is not None)
+            self._stats["hits"] += hits
+            self._stats["misses"] += len(texts) - hits
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors):
+        """批量写入（已缓存的文本跳过）"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError(f"向量形状 {vectors.shape} 与文本数 {len(texts)} 不匹配")
+        dim = vectors.shape[1]
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cached_dim = self._model_dim(model)
+                if cached_dim is None:
+                    self._conn.execute("INSERT INTO models (model, dim) VALUES (?, ?)", (model, dim))
+                elif cached_dim != dim:
+                    raise ValueError(f"模型 {model} 的向量维度从 {cached_dim} 变为 {dim}")
+
+                new = {}
+                for text, vector in zip(texts, vectors):
+                    digest = text_digest(text)
+                    if digest in new:
+                        continue
+                    exists = self._conn.execute(
+                        "SELECT 1 FROM embeddings WHERE model = ? AND digest = ?", (model, digest)
+                    ).fetchone()
+                    if not exists:
+                        new[digest] = vector
+
+                if new:
+                    path = self._vector_path(model)
+                    row_bytes = dim * 4
+                    with open(path, "ab") as f:
+                        # 上次写入中断留下的不完整行直接截掉
+                        size = f.seek(0, 2)
+                        if size % row_bytes:
+                            f.truncate(size - size % row_bytes)
+                        first_row = size // row_bytes
+                        f.write(np.stack(list(new.values())).tobytes())
+                    self._conn.executemany(
+                        "INSERT INTO embeddings (model, digest, row) VALUES (?, ?, ?)",
+                        [(model, digest, first_row + i) for i, digest in enumerate(new)]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._stats["writes"] += len(new)
+
+    def encode(self, embedder, model: str, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+        """
+        先查缓存，只把未命中的文本交给模型，结果写回缓存
+        返回: (len(texts), dim) 的 float32 数组
+        """
+        texts = list(texts)
+        vectors = self.get_many(model, texts)
+
+        missing = list(dict.fromkeys(text for text, v in zip(texts, vectors) if v is None))
+        if missing:
+            encoded = np.asarray(embedder.encode(missing, batch_size=batch_size), dtype=np.float32)
+            self.put_many(model, missing, encoded)
+            by_text = dict(zip(missing, encoded))
+            vectors = [v if v is not None else by_text[text] for text, v in zip(texts, vectors)]
+
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    def clear(self, model: Optional[str] = None) -> int:
+        """
+        清除缓存
+        model: 只清除该模型的向量；None 表示全部清除
+        返回: 删除的条目数
+        """
+        with self._lock:
+            models = [model] if model else [r[0] for r in self._conn.execute("SELECT model FROM models")]
+            deleted = 0
+            for name in models:
+                deleted += self._conn.execute(
+                    "DELETE FROM embeddings WHERE model = ?", (name,)
+                ).rowcount
+                self._conn.execute("DELETE FROM models WHERE model = ?", (name,))
+                self._maps.pop(name, None)
+                self._vector_path(name).unlink(missing_ok=True)
+        return deleted
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size = sum(p.stat().st_size for p in self.cache_dir.glob("*.f32"))
+            return {"entries": entries, "bytes": size, **self._stats}
+
+
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+_registry_lock = threading.Lock()
+
+
+def get_embedding_cache(cache_dir: str = DEFAULT_EMBEDDING_CACHE_DIR) -> EmbeddingCache:
+    """同一目录在进程内共享一个缓存实例"""
+    key = str(Path(cache_dir).resolve())
+    with _registry_lock:
+        if key not in _embedding_caches:
+            _embedding_caches[key] = EmbeddingCache(cache_dir)
+        return _embedding_caches[key]
@@ -0,0 +1,328 @@
+"""
+DeepRead - 书名模糊匹配索引
+基于字符 n-gram（可选拼音）的倒排索引，支持繁简体、标点差异和少量错字
+用于在请求外部API之前，把近似书名匹配到已解析过的书籍
+
+性能测试（10万书名）:
+    python fuzzy_index.py --benchmark 100000
+"""
+
+import argparse
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from metadata_cache import normalize_title
+
+# 繁简转换：优先使用 OpenCC（可选依赖），否则使用内置常用字对照表
+try:
+    from opencc import OpenCC
+    _opencc = OpenCC("t2s")
+except Exception:
+    _opencc = None
+
+# 拼音（可选依赖）
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+# 内置繁简对照（书名中的常用字）
+_TRAD_SIMP_PAIRS = (
+    "與与為为們们來来個个會会學学對对說说時时實实從从現现種种動动問问經经間间"
+    "長长發发關关點点開开無无過过應应於于後后這这麼么頭头見见話话樣样變变體体"
+    "國国當当員员書书讀读習习慣惯愛爱歷历誰谁結结紅红夢梦樓楼記记錄录論论語语"
+    "詩诗譯译電电腦脑氣气業业產产濟济資资權权錢钱貨货買买賣卖價价質质數数據据"
+    "術术藝艺聖圣島岛劍剑俠侠傳传飛飞鳥鸟馬马魚鱼龍龙鳳凤雲云風风陽阳陰阴萬万"
+    "億亿歲岁華华東东車车門门紀纪義义區区極极圖图團团園园處处聽听觀观覺觉親亲"
+    "戰战爭争勝胜敗败難难漢汉滿满溫温測测準准決决際际連连運运進进遠远還还邊边"
+    "選选遊游達达適适遲迟鐵铁銀银鋼钢錯错鍵键閱阅隊队陸陆隨随雙双雜杂離离靈灵"
+    "響响順顺題题顏颜願愿類类顯显飯饭館馆驗验驚惊髮发鬥斗鹽盐麗丽黃黄齊齐齡龄"
+    "壓压報报塊块場场壞坏夠够夥伙奮奋婦妇孫孙寶宝將将專专導导層层屬属嶺岭幣币"
+    "帶带師师幫帮廣广廳厅張张強强彈弹歸归徑径復复徵征態态懷怀戲戏擇择擊击損损"
+    "換换揮挥擁拥攝摄敵敌斷断晉晋暫暂曉晓條条構构標标樹树橋桥機机檢检歡欢殺杀"
+    "殘残沒没況况淺浅減减潔洁濃浓災灾烏乌煙烟熱热燈灯爺爷牆墙狀状獨独獲获環环"
+    "畫画異异療疗盡尽監监盤盘眾众確确禮礼禪禅穩稳窮穷競竞筆笔節节範范簡简糧粮"
+    "純纯紙纸細细組组終终給给統统絕绝維维網网緒绪線线練练總总績绩織织繼继續续"
+    "罷罢聯联聲声職职肅肃脫脱腳脚興兴舊旧舉举藥药蘭兰號号蟲虫補补裝装複复規规"
+    "視视計计訊讯討讨訓训設设許许診诊評评詞词試试詳详認认誤误課课調调談谈請请"
+    "諸诸謀谋講讲謝谢識识證证護护讓让貝贝負负財财責责貧贫費费貴贵貿贸賽赛趕赶"
+    "趨趋跡迹蹤踪輕轻輪轮輸输轉转辦办農农迴回週周遺遗郵邮鄉乡醫医釋释針针鏡镜"
+    "閉闭闆板陣阵隱隐雞鸡靜静預预領领頻频養养餘余駕驾騎骑鬆松魯鲁鴻鸿黨党齒齿"
+    "啟启創创劃划劇剧務务勞劳勢势匯汇協协單单衛卫參参嘆叹嚴严夢梦奪夺獎奖媽妈"
+    "寧宁審审寫写寬宽尋寻屆届幾几庫库廢废徹彻憂忧憶忆懶懒戀恋擔担擴扩斬斩暢畅"
+    "曆历棄弃槍枪樂乐歐欧殼壳潛潜灣湾燒烧爾尔獄狱瑪玛瘋疯癒愈盜盗碼码磚砖禍祸"
+    "稱称積积窩窝競竞籃篮紐纽紀纪級级約约紗纱訂订訪访詐诈該该誠诚誇夸諾诺謊谎"
+    "豐丰豬猪貓猫貼贴賀贺賓宾賞赏賴赖贊赞贏赢趙赵躍跃軍军軟软載载輔辅輩辈辭辞"
+    "邏逻鄰邻醜丑釣钓鈴铃錦锦鍋锅鎖锁鐘钟閃闪闊阔闖闯陳陈陰阴隻只雖虽雞鸡韓韩"
+    "頁页項项順顺須须頓顿頗颇頭头額额顧顾飄飘飽饱餅饼騙骗騰腾驅驱驚惊鬧闹"
+    "鳴鸣麥麦龜龟獵猎貍狸鵝鹅鴨鸭鶴鹤鷹鹰麼么氣气態态慮虑慶庆憑凭懸悬"
+)
+assert len(_TRAD_SIMP_PAIRS) % 2 == 0
+_TRAD_TO_SIMP = str.maketrans({
+    _TRAD_SIMP_PAIRS[i]: _TRAD_SIMP_PAIRS[i + 1]
+    for i in range(0, len(_TRAD_SIMP_PAIRS), 2)
+})
+
+
+def to_simplified(text: str) -> str:
+    """繁体转简体"""
+    if _opencc is not None:
+        return _opencc.convert(text)
+    return text.translate(_TRAD_TO_SIMP)
+
+
+def normalize_for_match(title: str) -> str:
+    """模糊匹配用的规范化：标点/空白/大小写统一后再转简体"""
+    return to_simplified(normalize_title(title))
+
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_ROMAN = {"ii": 2, "iii": 3, "iv": 4, "vi": 6, "vii": 7, "viii": 8, "ix": 9, "xi": 11, "xii": 12}
+
+# 卷次/序号：阿拉伯数字、"第三部"/"卷三"、"上册"、独立的罗马数字（单个 i/v/x 易与单词混淆，不计入）
+_VOLUME_PATTERN = re.compile(
+    r"\d+"
+    r"|第?[零〇一二两三四五六七八九十]+(?=[卷册部集季辑篇])"
+    r"|(?<=[卷册部集])[零〇一二两三四五六七八九十]+"
+    r"|[上中下](?=[卷册部集篇])"
+    r"|(?<![a-z])(?:viii|vii|iii|xii|ii|iv|vi|ix|xi)(?![a-z])"
+)
+
+
+def _cn_number(text: str) -> int:
+    """中文数字（一百以内）转整数"""
+    if "十" not in text:
+        value = 0
+        for ch in text:
+            value = value * 10 + _CN_DIGITS[ch]
+        return value
+    tens, _, ones = text.partition("十")
+    return (_CN_DIGITS[tens] if tens else 1) * 10 + (_CN_DIGITS[ones] if ones else 0)
+
+
+def volume_tokens(title: str) -> Tuple[str, ...]:
+    """
+    书名中的卷次/序号（统一成阿拉伯数字或上/中/下），用于区分同一系列的不同册
+    例如 "明朝那些事儿2" -> ("2",)，"三体Ⅱ" -> ("2",)，"平凡的世界（第三部）" -> ("3",)
+    """
+    text = unicodedata.normalize("NFKC", title or "").casefold()
+    tokens = []
+    for token in _VOLUME_PATTERN.findall(text):
+        token = token.lstrip("第")
+        if token.isdigit():
+            tokens.append(str(int(token)))
+        elif token in _ROMAN:
+            tokens.append(str(_ROMAN[token]))
+        elif token in "上中下":
+            tokens.append(token)
+        else:
+            tokens.append(str(_cn_number(token)))
+    return tuple(sorted(tokens))
+
+
+def _char_grams(text: str, n: int = 2) -> List[str]:
+    """字符 n-gram；过短的书名退化为单字"""
+    if len(text) < n:
+        return [text] if text else []
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+class FuzzyTitleIndex:
+    """
+    书名模糊匹配索引
+    - 字符二元组倒排索引，按 Dice 系数打分
+    - 可选拼音二元组，匹配同音错字
+    - 卷次/序号不同的书名不算匹配（"明朝那些事儿2" 不会命中 "明朝那些事儿1"）
+    - 条目按语言区分，可设置过期时间（与元数据缓存一起过期）
+    """
+
+    def __init__(self, threshold: float = 0.8, use_pinyin: bool = False):
+        """
+        threshold: 相似度阈值（0-1），低于阈值视为未命中
+        use_pinyin: 是否加入拼音特征（需要安装 pypinyin）
+        """
+        self.threshold = threshold
+        self.use_pinyin = use_pinyin and lazy_pinyin is not None
+
+        self._lock = threading.Lock()
+        self._keys: List[str] = []
+        self._books: List[Dict] = []
+        self._sizes: List[int] = []
+        self._langs: List[str] = []
+        self._volumes: List[Tuple[str, ...]] = []
+        self._expires: List[Optional[float]] = []
+        self._key_to_id: Dict[Tuple[str, str], int] = {}
+        self._postings: Dict[str, List[int]] = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _features(self, key: str) -> Counter:
+        features = Counter(_char_grams(key))
+        if self.use_pinyin:
+            syllables = lazy_pinyin(key)
+            grams = [f"{a} {b}" for a, b in zip(syllables, syllables[1:])] or syllables
+            features.update("py:" + gram for gram in grams)
+        return features
+
+    def add(self, title: str, book: Dict, lang: str = "", expires_at: Optional[float] = None):
+        """
+        加入一个书名及其书籍信息（同一语言下同名覆盖）
+        expires_at: 过期时间戳，None 表示不过期
+        """
+        key = normalize_for_match(title)
+        if not key:
+            return
+
+        with self._lock:
+            doc_id = self._key_to_id.get((lang, key))
+            if doc_id is not None:
+                self._books[doc_id] = book
+                self._expires[doc_id] = expires_at
+                return
+
+            features = self._features(key)
+            doc_id = len(self._keys)
+            self._keys.append(key)
+            self._books.append(book)
+            self._sizes.append(sum(features.values()))
+            self._langs.append(lang)
+            self._volumes.append(volume_tokens(title))
+            self._expires.append(expires_at)
+            self._key_to_id[(lang, key)] = doc_id
+            for feature in features:
+                self._postings.setdefault(feature, []).append(doc_id)
+
+    def _expired(self, doc_id: int, now: float) -> bool:
+        expires_at = self._expires[doc_id]
+        return expires_at is not None and expires_at <= now
+
+    def search(
+        self,
+        title: str,
+        threshold: Optional[float] = None,
+        lang: str = ""
+    ) -> Optional[Tuple[Dict, float]]:
+        """
+        在同一语言的未过期条目中查找最相似、且卷次/序号相同的书名
+        返回: (书籍信息, 相似度)；没有达到阈值的结果时返回None
+        """
+        threshold = self.threshold if threshold is None else threshold
+        key = normalize_for_match(title)
+        if not key:
+            return None
+        now = time.time()
+
+        with self._lock:
+            doc_id = self._key_to_id.get((lang, key))
+            if doc_id is not None:
+                return (self._books[doc_id], 1.0) if not self._expired(doc_id, now) else None
+            volumes = volume_tokens(title)
+
+            features = self._features(key)
+            query_size = sum(features.values())
+            # Dice 系数达到阈值时，候选书名的特征数必须落在该范围内
+            min_size = query_size * threshold / (2 - threshold)
+            max_size = query_size * (2 - threshold) / threshold
+
+            overlaps: Counter = Counter()
+            for feature in features:
+                for candidate in self._postings.get(feature, ()):
+                    overlaps[candidate] += 1
+
+            best_id, best_score = None, 0.0
+            for candidate, overlap in overlaps.items():
+                size = self._sizes[candidate]
+                if size < min_size or size > max_size:
+                    continue
+                if (self._langs[candidate] != lang or self._volumes[candidate] != volumes
+                        or self._expired(candidate, now)):
+                    continue
+                score = 2.0 * overlap / (query_size + size)
+                if score > best_score:
+                    best_id, best_score = candidate, score
+
+            if best_id is None or best_score < threshold:
+                return None
+            return self._books[best_id], best_score
+
+
+# ==================== 性能测试 ====================
+def _random_title(rng: random.Random) -> str:
+    return "".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(4, 12)))
+
+
+def _misspell(title: str, rng: random.Random) -> str:
+    """模拟用户输入：插入标点，或替换一个字"""
+    chars = list(title)
+    if rng.random() < 0.5:
+        chars.insert(rng.randint(1, len(chars) - 1), "，")
+    else:
+        chars[rng.randrange(len(chars))] = chr(rng.randint(0x4E00, 0x9FA5))
+    return "".join(chars)
+
+
+def run_benchmark(size: int = 100000, queries: int = 2000, seed: int = 42) -> Dict:
+    """在 size 个随机书名上测试建索引与查询延迟"""
+    rng = random.Random(seed)
+    titles = [_random_title(rng) for _ in range(size)]
+
+    index = FuzzyTitleIndex(threshold=0.6)
+    start = time.perf_counter()
+    for title in titles:
+        index.add(title, {"title": title})
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    correct = 0
+    for _ in range(queries):
+        target = rng.choice(titles)
+        query = _misspell(target, rng)
+        t0 = time.perf_counter()
+        match = index.search(query)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if match and match[0]["title"] == target:
+            correct += 1
+
+    latencies.sort()
+    return {
+        "titles": size,
+        "build_seconds": round(build_seconds, 2),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "recall": round(correct / queries, 3),
+    }
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+    parser = argparse.ArgumentParser(description="书名模糊匹配索引")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="在N个随机书名上运行性能测试")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(f"⏱️ 模糊索引性能测试（{args.benchmark} 个书名）...")
+        result = run_benchmark(args.benchmark)
+        print(f"   建索引耗时: {result['build_seconds']}s")
+        print(f"   查询延迟 p50: {result['p50_ms']}ms, p99: {result['p99_ms']}ms")
+        print(f"   召回率: {result['recall']:.1%}")
+    else:
+        index = FuzzyTitleIndex()
+        index.add("思考，快与慢", {"title": "思考，快与慢", "author": "丹尼尔·卡尼曼"})
+        for query in ["思考快与慢", "思考,快与慢", "思考，快與慢", "思考 快与慢！"]:
+            match = index.search(query)
+            if match:
+                print(f"{query} -> {match[0]['title']} ({match[1]:.2f})")
+            else:
+                print(f"{query} -> 未命中")
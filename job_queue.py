@@ -0,0 +1,479 @@
+"""
+DeepRead - 后台分析任务队列
+本地模型分析需要1-3分钟，页面提交任务后由独立的工作进程执行，页面只需轮询状态；
+任务状态、进度和结果保存在SQLite中，重启后依然可以查看
+
+命令行用法:
+    python job_queue.py worker --concurrency 2    # 启动工作进程
+    python job_queue.py list                      # 查看任务
+    python job_queue.py cancel <任务ID>            # 取消任务
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Dict, List, Optional
+
+from book_analyzer import BookInfo, is_fallback_analysis, is_incomplete_analysis
+
+DEFAULT_JOB_DB_PATH = "./cache/jobs.db"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# 流式分析大约产出的条目数（5条观点 + 5条金句 + 若干思维导图分支），用于估算进度
+EXPECTED_STREAM_ITEMS = 12
+
+# 等待模型输出时检查取消请求（并汇报心跳）的间隔（秒）
+CANCEL_CHECK_INTERVAL = 2.0
+
+
+class JobQueue:
+    """任务队列（SQLite，可被多个进程同时使用）"""
+
+    def __init__(self, db_path: str = DEFAULT_JOB_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None：手动控制事务，领取任务时使用 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                dedupe_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat REAL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key, status)")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS workers (
+                id TEXT PRIMARY KEY,
+                pid INTEGER,
+                host TEXT,
+                heartbeat REAL NOT NULL
+            )
+        ''')
+
+    @staticmethod
+    def _row_to_job(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    # ---------- 提交与查询（页面使用） ----------
+    def submit_analysis(
+        self,
+        book_info: BookInfo,
+        local: bool = True,
+        model: Optional[str] = None,
+        sectioned: bool = False
+    ) -> str:
+        """
+        提交书籍分析任务
+        local: 使用本地Ollama模型，否则使用Groq
+        相同的任务正在排队或执行时，直接返回已有任务的ID
+        返回: 任务ID
+        """
+        payload = {
+            "book": asdict(book_info),
+            "local": local,
+            "model": model,
+            "sectioned": sectioned,
+        }
+        dedupe_key = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?)",
+                    (dedupe_key, QUEUED, RUNNING)
+                ).fetchone()
+                if row:
+                    job_id = row["id"]
+                else:
+                    job_id = uuid.uuid4().hex[:12]
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, kind, dedupe_key, payload, status, message, created_at) "
+                        "VALUES (?, 'analysis', ?, ?, ?, '排队中', ?)",
+                        (job_id, dedupe_key, json.dumps(payload, ensure_ascii=False), QUEUED, time.time())
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """查询任务"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """最近的任务"""
+        with self._lock:
+            if status:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def queue_position(self, job_id: str) -> int:
+        """排队任务前面还有几个任务（不在排队时返回0）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < "
+                "(SELECT created_at FROM jobs WHERE id = ? AND status = ?)",
+                (QUEUED, job_id, QUEUED)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        取消任务：排队中的任务立即取消，执行中的任务由工作进程在 CANCEL_CHECK_INTERVAL 秒内停止
+        返回: 是否已发出取消
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, message = '已取消', finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+            if cursor.rowcount:
+                return True
+            cursor = self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, message = '正在取消' WHERE id = ? AND status = ?",
+                (job_id, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    # ---------- 工作进程使用 ----------
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """领取最早排队的任务（多个工作进程同时领取时只有一个成功）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat = ?, "
+                    "message = '开始分析' WHERE id = ?",
+                    (RUNNING, worker_id, now, now, row["id"])
+                )
+                job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row_to_job(job)
+
+    def update_progress(self, job_id: str, progress: float, message: str = "") -> bool:
+        """
+        汇报进度（同时作为任务心跳）
+        返回: 是否已请求取消
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, message = ?, heartbeat = ? WHERE id = ?",
+                (min(max(progress, 0.0), 1.0), message, time.time(), job_id)
+            )
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict] = None,
+               error: str = "", message: str = ""):
+        """结束任务"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, message = ?, finished_at = ?, "
+                "progress = CASE WHEN ? = ? THEN 1.0 ELSE progress END WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, message, time.time(), status, SUCCEEDED, job_id)
+            )
+
+    def requeue_stale(self, max_age: float = 120.0) -> int:
+        """工作进程崩溃后，把心跳超时的执行中任务放回队列"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, message = '工作进程中断，重新排队' "
+                "WHERE status = ? AND heartbeat < ?",
+                (QUEUED, RUNNING, time.time() - max_age)
+            )
+        return cursor.rowcount
+
+    def worker_heartbeat(self, worker_id: str):
+        """工作进程心跳，同时刷新其执行中任务的心跳（模型加载期间没有进度汇报）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (id, pid, host, heartbeat) VALUES (?, ?, ?, ?)",
+                (worker_id, os.getpid(), socket.gethostname(), now)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE worker = ? AND status = ?",
+                (now, worker_id, RUNNING)
+            )
+
+    def remove_worker(self, worker_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def live_workers(self, max_age: float = 30.0) -> List[Dict]:
+        """近期有心跳的工作进程"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM workers WHERE heartbeat >= ?", (time.time() - max_age,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class JobWorker:
+    """执行分析任务的工作进程"""
+
+    def __init__(self, queue: Optional[JobQueue] = None, concurrency: int = 1, poll_interval: float = 1.0):
+        """
+        concurrency: 同时执行的任务数（本地模型通常为1-2）
+        poll_interval: 队列为空时的轮询间隔（秒）
+        """
+        self.queue = queue or JobQueue()
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._analyzers = {}
+        self._analyzers_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _get_analyzer(self, payload: Dict):
+        """相同配置的任务复用分析器"""
+        key = (payload["local"], payload.get("model"), payload.get("sectioned", False))
+        with self._analyzers_lock:
+            analyzer = self._analyzers.get(key)
+            if analyzer is None:
+                kwargs = {"sectioned": payload.get("sectioned", False)}
+                if payload["local"]:
+                    from local_model_analyzer import LocalBookAnalyzer
+                    if payload.get("model"):
+                        kwargs["model_name"] = payload["model"]
+                    analyzer = LocalBookAnalyzer(**kwargs)
+                else:
+                    from book_analyzer import BookDeepAnalyzer
+                    if payload.get("model"):
+                        kwargs["model"] = payload["model"]
+                    analyzer = BookDeepAnalyzer(**kwargs)
+                self._analyzers[key] = analyzer
+            return analyzer
+
+    def run_job(self, job: Dict):
+        """
+        执行一个分析任务
+        流式输出在单独的线程中读取，本线程每 CANCEL_CHECK_INTERVAL 秒检查一次取消请求，
+        模型加载或分段请求迟迟没有输出时也能及时取消
+        """
+        job_id = job["id"]
+        payload = job["payload"]
+        book = BookInfo(**payload["book"])
+        print(f"▶️ [{job_id}] 开始分析《{book.title}》")
+
+        items: Queue = Queue()
+        abandoned = threading.Event()
+
+        def pump():
+            # 生成器只能在创建它的线程里关闭，取消后由本线程在下一条输出时结束它
+            try:
+                stream = self._get_analyzer(payload).analyze_book_stream(book)
+                try:
+                    for item in stream:
+                        if abandoned.is_set():
+                            break
+                        items.put(("item", item))
+                finally:
+                    stream.close()
+                items.put(("done", None))
+            except Exception as e:
+                items.put(("error", e))
+
+        threading.Thread(target=pump, daemon=True).start()
+
+        count = 0
+        progress, message = 0.0, "等待模型输出"
+        analysis = None
+        try:
+            while True:
+                try:
+                    kind, value = items.get(timeout=CANCEL_CHECK_INTERVAL)
+                except Empty:
+                    kind, value = None, None
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    break
+                if kind == "item":
+                    field, item = value
+                    if field == "complete":
+                        analysis = item
+                        break
+                    count += 1
+                    progress = min(0.95, count / EXPECTED_STREAM_ITEMS)
+                    message = f"已生成 {count} 条内容"
+                if self.queue.update_progress(job_id, progress, message):
+                    abandoned.set()
+                    self.queue.finish(job_id, CANCELLED, message="已取消")
+                    print(f"⏹️ [{job_id}] 已取消")
+                    return
+
+            # 分析器在LLM出错时不抛异常而是返回降级内容，这种结果不能算作成功
+            if analysis is None or is_fallback_analysis(analysis):
+                raise RuntimeError("模型调用失败，只得到降级内容")
+            if is_incomplete_analysis(analysis):
+                raise RuntimeError("模型输出被截断，分析结果不完整")
+            self.queue.finish(job_id, SUCCEEDED, result=analysis, message="分析完成")
+            print(f"✅ [{job_id}] 完成《{book.title}》")
+        except Exception as e:
+            abandoned.set()
+            self.queue.finish(job_id, FAILED, error=str(e), message="分析失败")
+            print(f"❌ [{job_id}] 失败: {e}")
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(10):
+            self.queue.worker_heartbeat(self.worker_id)
+            self.queue.requeue_stale()
+
+    def run_forever(self):
+        """持续领取并执行任务，Ctrl+C 停止"""
+        self.queue.worker_heartbeat(self.worker_id)
+        self.queue.requeue_stale()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+        print(f"👷 工作进程 {self.worker_id} 已启动，并发数 {self.concurrency}")
+
+        running: List[threading.Thread] = []
+        try:
+            while not self._stop.is_set():
+                running = [t for t in running if t.is_alive()]
+                job = self.queue.claim(self.worker_id) if len(running) < self.concurrency else None
+                if job is None:
+                    time.sleep(self.poll_interval)
+                    continue
+                thread = threading.Thread(target=self.run_job, args=(job,), daemon=True)
+                thread.start()
+                running.append(thread)
+        except KeyboardInterrupt:
+            print("\n🛑 正在停止，等待执行中的任务完成...")
+        finally:
+            self._stop.set()
+            for thread in running:
+                thread.join()
+            self.queue.remove_worker(self.worker_id)
+
+
+def ensure_worker(queue: Optional[JobQueue] = None, concurrency: int = 1) -> bool:
+    """
+    没有存活的工作进程时，在后台启动一个
+    返回: 是否新启动了工作进程
+    """
+    queue = queue or JobQueue()
+    if queue.live_workers():
+        return False
+    script = Path(__file__).resolve()
+    subprocess.Popen(
+        [sys.executable, str(script), "--db", str(queue.db_path.resolve()),
+         "worker", "--concurrency", str(concurrency)],
+        cwd=str(script.parent),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    # 立即登记占位心跳，避免并发的页面重复启动工作进程
+    queue.worker_heartbeat(f"starting:{os.getpid()}")
+    return True
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="DeepRead 后台分析任务")
+    parser.add_argument("--db", default=DEFAULT_JOB_DB_PATH, help="任务数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    worker_parser = sub.add_parser("worker", help="启动工作进程")
+    worker_parser.add_argument("-c", "--concurrency", type=int, default=1, help="同时执行的任务数")
+
+    list_parser = sub.add_parser("list", help="查看任务")
+    list_parser.add_argument("--status", choices=[QUEUED, RUNNING, *FINISHED_STATES])
+    list_parser.add_argument("-n", type=int, default=20, help="条数")
+
+    cancel_parser = sub.add_parser("cancel", help="取消任务")
+    cancel_parser.add_argument("job_id")
+
+    args = parser.parse_args(argv)
+    queue = JobQueue(args.db)
+
+    if args.command == "worker":
+        JobWorker(queue, concurrency=args.concurrency).run_forever()
+
+    elif args.command == "list":
+        icons = {QUEUED: "⏳", RUNNING: "🔄", SUCCEEDED: "✅", FAILED: "❌", CANCELLED: "⏹️"}
+        for job in queue.list_jobs(args.status, args.n):
+            title = job["payload"]["book"]["title"]
+            print(f"{icons[job['status']]} {job['id']} 《{title}》 {job['progress']:.0%} {job['message'] or ''}")
+
+    elif args.command == "cancel":
+        print("✅ 已取消" if queue.cancel(args.job_id) else "⚠️ 任务不存在或已结束")
+
+    queue.close()
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
@@ -1,21 +1,36 @@
 """
 DeepRead - 知识库系统
 使用ChromaDB实现本地向量存储和知识关联
+小型知识库可改用 compact 后端（NumPy 暴力检索，不需要 chromadb）
 """
 
 import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 from dataclasses import dataclass, asdict
 import json
 from pathlib import Path
 from datetime import datetime
 
-# 向量数据库
-import chromadb
-from chromadb.config import Settings
+# 文本嵌入（使用Hugging Face免费模型，进程内共享、后台加载）
+from shared_embedder import get_embedder, DEFAULT_EMBEDDING_MODEL
+from embedding_cache import get_embedding_cache
+from book_centroids import BookCentroidIndex
+from knowledge_graph import get_graph_index
+from lexical_index import get_lexical_index, reciprocal_rank_fusion
 
-# 文本嵌入（使用Hugging Face免费模型）
-from sentence_transformers import SentenceTransformer
+# search_knowledge 的检索方式
+SEARCH_MODES = ("auto", "hybrid", "vector", "lexical")
+
+# 向量存储后端："chroma"（ChromaDB + HNSW）或 "compact"（量化向量 + NumPy 暴力检索）
+KB_BACKENDS = ("chroma", "compact")
+DEFAULT_KB_BACKEND = os.getenv("DEEPREAD_KB_BACKEND", "chroma")
+
+# 卡片collection，以及 reindex 时先写入的临时collection
+COLLECTION_NAME = "knowledge_cards"
+REBUILD_COLLECTION_NAME = "knowledge_cards_rebuild"
 
 
 @dataclass
@@ -40,29 +55,136 @@ class KnowledgeCard:
 class PersonalKnowledgeBase:
     """个人知识库 - 本地向量存储"""
 
-    def __init__(self, persist_directory: str = "./knowledge_db"):
+    def __init__(
+        self,
+        persist_directory: str = "./knowledge_db",
+        embed_batch_size: int = 64,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        use_embedding_cache: bool = True,
+        query_cache_size: int = 256,
+        backend: str = DEFAULT_KB_BACKEND,
+        quantization: str = "int8",
+        graph_neighbors: int = 5,
+        graph_min_similarity: float = 0.5
+    ):
         """
         初始化知识库
         persist_directory: 数据库存储路径
+        embed_batch_size: 批量生成embedding时每批的文本数
+        embedding_model: 嵌入模型名称（同名模型在进程内只加载一次）
+        use_embedding_cache: 是否把embedding缓存到磁盘（重建索引时免去模型推理）
+        query_cache_size: 内存中缓存的查询embedding条数（LRU），0 表示不缓存
+        backend: 向量存储后端，"chroma" 或 "compact"（几千张卡片以内启动更快、更省内存）
+        quantization: compact 后端的向量量化方式，"int8"（默认）或 "float16"
+        graph_neighbors: 知识图谱中每张卡片连接的语义近邻数
+        graph_min_similarity: 知识图谱连边的最低余弦相似度
         """
+        if backend not in KB_BACKENDS:
+            raise ValueError(f"backend 只能是 {KB_BACKENDS}")
         self.persist_dir = Path(persist_directory)
+        self.embed_batch_size = embed_batch_size
+        self.embedding_model = embedding_model
         self.persist_dir.mkdir(parents=True, exist_ok=True)
 
-        # 初始化ChromaDB（持久化到本地）
-        self.chroma_client = chromadb.PersistentClient(
-            path=str(self.persist_dir / "chroma")
+        self.embedding_cache = (
+            get_embedding_cache(str(self.persist_dir / "embeddings")) if use_embedding_cache else None
         )
 
-        # 创建或获取collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="knowledge_cards",
+        # 查询embedding的LRU缓存（页面重复运行同一搜索时不再调用模型）
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+
+        # 初始化向量数据库（持久化到本地；两种后端接口一致）
+        self.backend = backend
+        if backend == "compact":
+            from compact_index import get_compact_client
+            self.chroma_client = get_compact_client(
+                path=str(self.persist_dir / "compact"),
+                quantization=quantization
+            )
+        else:
+            import chromadb
+            self.chroma_client = chromadb.PersistentClient(
+                path=str(self.persist_dir / "chroma")
+            )
+
+        # 创建或获取collection（其他实例 reindex 替换collection后，通过代号文件发现并重新打开）
+        self._generation_path = self.persist_dir / f"collection_generation_{backend}"
+        self._collection_lock = threading.Lock()
+        self._open_collection()
+
+        # 嵌入模型在后台线程加载，不阻塞初始化；encode 时会等待加载完成
+        self.embedder = get_embedder(embedding_model)
+
+        # 书籍中心向量与相似度矩阵（与collection不一致时从已存储的embedding重建）
+        self.book_index = BookCentroidIndex(str(self.persist_dir / f"book_centroids_{backend}.db"))
+        if self.book_index.total_cards != self.collection.count():
+            self.rebuild_book_index()
+
+        # 关键词索引（BM25），与collection不一致时从已存储的文档补齐（有多余的旧卡片时先清空）
+        self.lexical_index = get_lexical_index(str(self.persist_dir / f"lexical_index_{backend}.db"))
+        card_count = self.collection.count()
+        if len(self.lexical_index) > card_count:
+            self.lexical_index.clear()
+        if len(self.lexical_index) != card_count:
+            self.sync_lexical_index()
+
+        # 卡片语义近邻图（添加卡片时增量更新；缺失的卡片在第一次读图时补齐）
+        self.graph_index = get_graph_index(
+            str(self.persist_dir / f"graph_{backend}"),
+            k=graph_neighbors,
+            min_similarity=graph_min_similarity
+        )
+
+    def _collection_names(self) -> List[str]:
+        # 旧版 chromadb 的 list_collections 返回 Collection 对象
+        return [getattr(c, "name", c) for c in self.chroma_client.list_collections()]
+
+    def _read_generation(self) -> int:
+        try:
+            return int(self._generation_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _open_collection(self):
+        """打开卡片collection；上次 reindex 在删除旧collection后、改名前中断时，先完成改名"""
+        self._generation = self._read_generation()
+        names = self._collection_names()
+        if REBUILD_COLLECTION_NAME in names and COLLECTION_NAME not in names:
+            print("⚠️ 上次重建索引未完成替换，正在恢复")
+            self.chroma_client.get_collection(REBUILD_COLLECTION_NAME).modify(name=COLLECTION_NAME)
+        self._collection = self.chroma_client.get_or_create_collection(
+            name=COLLECTION_NAME,
             metadata={"hnsw:space": "cosine"}  # 使用余弦相似度
         )
 
-        # 初始化嵌入模型（第一次下载后会缓存到本地）
-        print("📦 加载嵌入模型（第一次会下载，约400MB）...")
-        self.embedder = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        print("✅ 模型加载完成")
+    @property
+    def collection(self):
+        """卡片collection；其他实例 reindex 替换过collection时重新打开"""
+        if self._read_generation() != self._generation:
+            with self._collection_lock:
+                if self._read_generation() != self._generation:
+                    self._open_collection()
+        return self._collection
+
+    @property
+    def embedder_ready(self) -> bool:
+        """嵌入模型是否已加载完成（未完成时搜索/添加会等待）"""
+        return self.embedder.ready
+
+    @staticmethod
+    def _card_text(content_type: str, content: str) -> str:
+        """生成embedding所用的文本"""
+        return f"{content_type}: {content}"
+
+    def _embed(self, texts: List[str]):
+        """批量生成embedding（优先读磁盘缓存），返回 numpy 数组"""
+        if self.embedding_cache is None:
+            return self.embedder.encode(texts, batch_size=self.embed_batch_size)
+        return self.embedding_cache.encode(
+            self.embedder, self.embedding_model, texts, batch_size=self.embed_batch_size
+        )
 
     def add_book_knowledge(
         self,
@@ -72,9 +194,10 @@ class PersonalKnowledgeBase:
     ) -> List[str]:
         """
         将书籍分析结果添加到知识库
+        所有卡片先收集起来，批量生成embedding后一次写入
         返回：添加的卡片ID列表
         """
-        card_ids = []
+        cards = []
         timestamp = datetime.now().isoformat()
 
         # 添加核心观点
@@ -88,8 +211,7 @@ class PersonalKnowledgeBase:
                 tags=[book_title, "核心观点", "深度思考"],
                 created_at=timestamp
             )
-            self._add_card(card)
-            card_ids.append(card.id)
+            cards.append(card)
 
         # 添加金句
         for i, quote in enumerate(analysis.get("quotes", [])):
@@ -102,8 +224,7 @@ class PersonalKnowledgeBase:
                 tags=[book_title, "金句", "可分享"],
                 created_at=timestamp
             )
-            self._add_card(card)
-            card_ids.append(card.id)
+            cards.append(card)
 
         # 添加概念（从思维导图提取）
         mind_map = analysis.get("mind_map", {})
@@ -119,68 +240,312 @@ class PersonalKnowledgeBase:
                     tags=[book_title, "概念", branch_name],
                     created_at=timestamp
                 )
-                self._add_card(card)
-                card_ids.append(card.id)
+                cards.append(card)
 
+        card_ids = self._add_cards(cards)
         print(f"✅ 已添加 {len(card_ids)} 张知识卡片到知识库")
         return card_ids
 
     def _add_card(self, card: KnowledgeCard):
         """添加单张卡片到向量数据库"""
-        # 生成embedding
-        text_to_embed = f"{card.content_type}: {card.content}"
-        embedding = self.embedder.encode(text_to_embed).tolist()
-
-        # 添加到ChromaDB
-        self.collection.add(
-            ids=[card.id],
-            embeddings=[embedding],
-            metadatas=[{
-                "book_title": card.book_title,
-                "book_author": card.book_author,
-                "content_type": card.content_type,
-                "tags": json.dumps(card.tags),
-                "created_at": card.created_at
-            }],
-            documents=[card.content]
+        self._add_cards([card])
+
+    def _add_cards(self, cards: List[KnowledgeCard]) -> List[str]:
+        """
+        批量添加卡片：一次 encode 生成全部embedding，一次 add 写入
+        返回：写入的卡片ID列表（重复ID只保留第一张，已在库中的卡片跳过）
+        """
+        unique = {}
+        for card in cards:
+            unique.setdefault(card.id, card)
+        existing = set(self.collection.get(ids=list(unique), include=[])["ids"]) if unique else set()
+        cards = [card for card_id, card in unique.items() if card_id not in existing]
+        if not cards:
+            return []
+
+        # 批量生成embedding
+        texts = [self._card_text(card.content_type, card.content) for card in cards]
+        embeddings = self._embed(texts).tolist()
+
+        ids = [card.id for card in cards]
+        documents = [card.content for card in cards]
+        metadatas = [{
+            "book_title": card.book_title,
+            "book_author": card.book_author,
+            "content_type": card.content_type,
+            "tags": json.dumps(card.tags),
+            "created_at": card.created_at
+        } for card in cards]
+
+        # 添加到ChromaDB（超过单次写入上限时分批）
+        max_batch = len(cards)
+        if hasattr(self.chroma_client, "get_max_batch_size"):
+            max_batch = min(max_batch, self.chroma_client.get_max_batch_size())
+        for start in range(0, len(cards), max_batch):
+            self.collection.add(
+                ids=ids[start:start + max_batch],
+                embeddings=embeddings[start:start + max_batch],
+                metadatas=metadatas[start:start + max_batch],
+                documents=documents[start:start + max_batch]
+            )
+
+        # 同步关键词索引
+        self.lexical_index.add(ids, documents, metadatas)
+
+        # 增量更新语义近邻图
+        self.graph_index.add(
+            ids,
+            embeddings,
+            [card.book_title for card in cards],
+            [card.content_type for card in cards],
+            [self._graph_label(card.content) for card in cards]
         )
 
+        # 增量更新书籍中心
+        by_book: Dict[str, List[int]] = {}
+        for i, card in enumerate(cards):
+            by_book.setdefault(card.book_title, []).append(i)
+        for book_title, indexes in by_book.items():
+            self.book_index.add_cards(
+                book_title,
+                cards[indexes[0]].book_author,
+                [embeddings[i] for i in indexes]
+            )
+        return [card.id for card in cards]
+
+    def rebuild_book_index(self, page_size: int = 500) -> int:
+        """
+        从collection中已存储的embedding重建书籍中心（不调用模型）
+        保留各书原来的更新时间，只有卡片数变化（或新出现）的书才标记为有更新，不影响增量导出
+        返回：参与计算的卡片数
+        """
+        previous = {book["title"]: book for book in self.book_index.books()}
+        self.book_index.clear()
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(
+                limit=page_size,
+                offset=offset,
+                include=["embeddings", "metadatas"]
+            )
+            by_book: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(page["metadatas"]):
+                by_book.setdefault(metadata["book_title"], []).append(i)
+            for book_title, indexes in by_book.items():
+                self.book_index.add_cards(
+                    book_title,
+                    page["metadatas"][indexes[0]].get("book_author", ""),
+                    [page["embeddings"][i] for i in indexes],
+                    updated_at=previous[book_title]["updated_at"] if book_title in previous else None
+                )
+        self.book_index.touch([
+            book["title"] for book in self.book_index.books()
+            if book["title"] in previous and book["count"] != previous[book["title"]]["count"]
+        ])
+        print(f"✅ 已重建 {len(self.book_index)} 本书的向量中心")
+        return total
+
+    def sync_lexical_index(self, page_size: int = 500) -> int:
+        """
+        把collection中还不在关键词索引里的卡片补进索引（不调用模型）
+        返回：补入的卡片数
+        """
+        added = 0
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(
+                limit=page_size,
+                offset=offset,
+                include=["documents", "metadatas"]
+            )
+            added += self.lexical_index.add(page["ids"], page["documents"], page["metadatas"])
+        if added:
+            print(f"✅ 已将 {added} 张卡片补入关键词索引")
+        return added
+
+    def reindex(self, page_size: int = 500) -> int:
+        """
+        重建向量索引（索引损坏或更换索引参数时使用）
+        embedding 优先读磁盘缓存，内容没变的卡片不需要重新跑模型
+        先写入临时collection，全部完成后再替换原collection
+        返回：重建的卡片数
+        """
+        names = self._collection_names()
+        if REBUILD_COLLECTION_NAME in names:
+            if COLLECTION_NAME not in names:
+                # 上次在删除旧collection后中断：临时collection是唯一完整的副本，先完成替换
+                self._open_collection()
+            else:
+                # 清理上次中断留下的临时collection（原collection仍在）
+                self.chroma_client.delete_collection(REBUILD_COLLECTION_NAME)
+        rebuild = self.chroma_client.create_collection(
+            name=REBUILD_COLLECTION_NAME,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+        source = self.collection
+        total = source.count()
+        for offset in range(0, total, page_size):
+            page = source.get(
+                limit=page_size,
+                offset=offset,
+                include=["documents", "metadatas"]
+            )
+            texts = [
+                self._card_text(metadata["content_type"], document)
+                for metadata, document in zip(page["metadatas"], page["documents"])
+            ]
+            rebuild.add(
+                ids=page["ids"],
+                embeddings=self._embed(texts).tolist(),
+                metadatas=page["metadatas"],
+                documents=page["documents"]
+            )
+
+        # 删除后、改名前中断时，下次打开知识库会完成改名（见 _open_collection）
+        with self._collection_lock:
+            self.chroma_client.delete_collection(COLLECTION_NAME)
+            rebuild.modify(name=COLLECTION_NAME)
+            self._collection = rebuild
+            # 递增代号，其他实例下次访问 collection 时重新打开
+            self._generation = self._read_generation() + 1
+            with self._atomic_write(self._generation_path) as f:
+                f.write(str(self._generation))
+        # 关键词索引按新collection重建，不保留已不存在的卡片
+        self.lexical_index.clear()
+        self.sync_lexical_index(page_size)
+        print(f"✅ 已重建 {total} 张知识卡片的向量索引")
+        return total
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """查询embedding：先查内存LRU，未命中的查询一次批量生成"""
+        embeddings: Dict[str, List[float]] = {}
+        with self._query_cache_lock:
+            for query in queries:
+                if query in self._query_cache:
+                    self._query_cache.move_to_end(query)
+                    embeddings[query] = self._query_cache[query]
+
+        missing = list(dict.fromkeys(q for q in queries if q not in embeddings))
+        if missing:
+            # 查询文本大多只出现一次，不写入磁盘embedding缓存（只追加，会无限增长），只用上面的内存LRU
+            vectors = self.embedder.encode(missing, batch_size=self.embed_batch_size).tolist()
+            for query, vector in zip(missing, vectors):
+                embeddings[query] = vector
+            if self.query_cache_size > 0:
+                with self._query_cache_lock:
+                    for query in missing:
+                        self._query_cache[query] = embeddings[query]
+                        self._query_cache.move_to_end(query)
+                    while len(self._query_cache) > self.query_cache_size:
+                        self._query_cache.popitem(last=False)
+
+        return [embeddings[query] for query in queries]
+
     def search_knowledge(
         self,
         query: str,
         n_results: int = 5,
-        content_type: Optional[str] = None
+        content_type: Optional[str] = None,
+        mode: str = "auto"
     ) -> List[Dict]:
         """
-        语义搜索知识库
-        query: 搜索查询（自然语言）
+        搜索知识库
+        query: 搜索查询（自然语言或术语）
         n_results: 返回结果数量
         content_type: 过滤内容类型（可选）
+        mode: 检索方式
+            "auto"    - 查询是一个术语时，原文包含它的卡片排在最前（够 n_results 张时不做语义检索），
+                        其余名额同 hybrid
+            "hybrid"  - 语义检索与关键词检索结果按倒数排名融合（RRF）
+            "vector"  - 只用语义检索
+            "lexical" - 只用关键词检索（不需要嵌入模型）
+        """
+        return self.search_many([query], n_results=n_results, content_type=content_type, mode=mode)[0]
+
+    @staticmethod
+    def _is_term_query(query: str) -> bool:
+        """像"锚定效应"这样的短术语（无空白、2~12个字符）"""
+        query = query.strip()
+        return 2 <= len(query) <= 12 and not any(c.isspace() for c in query)
+
+    def search_many(
+        self,
+        queries: List[str],
+        n_results: int = 5,
+        content_type: Optional[str] = None,
+        mode: str = "auto"
+    ) -> List[List[Dict]]:
+        """
+        批量搜索：需要语义检索的查询一次生成embedding、一次查询ChromaDB
+        mode 含义同 search_knowledge
+        返回：与 queries 一一对应的结果列表
         """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode 只能是 {SEARCH_MODES}")
+        if not queries:
+            return []
+
+        # 融合时两路各多取一些候选
+        depth = n_results if mode == "vector" else n_results * 2
+        all_cards: List[Optional[List[Dict]]] = [None] * len(queries)
+        lexical: List[List[Dict]] = [[] for _ in queries]
+        # auto 模式下原文包含术语的卡片排在最前；不足 n_results 张时其余名额由 hybrid 结果补齐
+        exact: List[List[Dict]] = [[] for _ in queries]
+        for q, query in enumerate(queries):
+            if mode == "vector":
+                continue
+            if mode == "auto" and self._is_term_query(query):
+                exact[q] = self.lexical_index.search(query, n_results, content_type, exact=True)
+                if len(exact[q]) >= n_results:
+                    all_cards[q] = exact[q]
+                    continue
+            lexical[q] = self.lexical_index.search(query, depth, content_type)
+            if mode == "lexical":
+                all_cards[q] = lexical[q][:n_results]
+
+        pending = [q for q in range(len(queries)) if all_cards[q] is None]
+        if not pending:
+            return all_cards
+
         # 生成查询embedding
-        query_embedding = self.embedder.encode(query).tolist()
+        query_embeddings = self._embed_queries([queries[q] for q in pending])
 
         # 构建过滤条件
         where = {"content_type": content_type} if content_type else None
 
         # 搜索
         results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
+            query_embeddings=query_embeddings,
+            n_results=depth,
             where=where
         )
 
-        # 格式化结果
-        cards = []
-        for i in range(len(results["ids"][0])):
-            cards.append({
-                "id": results["ids"][0][i],
-                "content": results["documents"][0][i],
-                "metadata": results["metadatas"][0][i],
-                "distance": results["distances"][0][i] if "distances" in results else None
-            })
-
-        return cards
+        # 格式化结果，有关键词结果时按倒数排名融合
+        distances = results.get("distances")
+        for p, q in enumerate(pending):
+            cards = []
+            for i in range(len(results["ids"][p])):
+                cards.append({
+                    "id": results["ids"][p][i],
+                    "content": results["documents"][p][i],
+                    "metadata": results["metadatas"][p][i],
+                    "distance": distances[p][i] if distances else None
+                })
+            if lexical[q]:
+                by_id = {card["id"]: card for card in lexical[q]}
+                by_id.update({card["id"]: card for card in cards})
+                fused = reciprocal_rank_fusion([
+                    [card["id"] for card in cards],
+                    [card["id"] for card in lexical[q]]
+                ])
+                cards = [dict(by_id[card_id], score=score) for card_id, score in fused]
+            if exact[q]:
+                exact_ids = {card["id"] for card in exact[q]}
+                cards = exact[q] + [card for card in cards if card["id"] not in exact_ids]
+            all_cards[q] = cards[:n_results]
+
+        return all_cards
 
     def find_related_books(
         self,
@@ -189,161 +554,177 @@ class PersonalKnowledgeBase:
     ) -> List[Dict]:
         """
         找到与某本书相关的其他书籍
-        基于知识卡的语义相似度
+        基于书籍中心向量的余弦相似度（读取预先计算的相似度矩阵的一行）
+        返回：[{"title", "author", "similarity", "count"(该书卡片数), "related_concepts"(该书的几张卡片内容)}]
         """
-        # 搜索这本书的所有知识卡
-        results = self.search_knowledge(
-            query=f"这本书的核心观点和思想：{book_title}",
-            n_results=20
-        )
-
-        # 统计其他书籍的出现频率
-        book_mentions = {}
-        for card in results:
-            card_book_title = card["metadata"]["book_title"]
-            if card_book_title != book_title:
-                if card_book_title not in book_mentions:
-                    book_mentions[card_book_title] = {
-                        "title": card_book_title,
-                        "author": card["metadata"]["book_author"],
-                        "count": 0,
-                        "related_concepts": []
-                    }
-                book_mentions[card_book_title]["count"] += 1
-                book_mentions[card_book_title]["related_concepts"].append(card["content"])
-
-        # 排序并返回Top N
-        sorted_books = sorted(
-            book_mentions.values(),
-            key=lambda x: x["count"],
-            reverse=True
-        )
-
-        return sorted_books[:n_results]
+        related = self.book_index.related(book_title, n_results)
+        for book in related:
+            cards = self.collection.get(
+                where={"book_title": book["title"]},
+                limit=3,
+                include=["documents"]
+            )
+            book["related_concepts"] = cards["documents"]
+        return related
 
     def export_to_markdown(
         self,
-        output_path: Optional[str] = None
+        output_path: Optional[str] = None,
+        per_book: bool = False,
+        changed_only: bool = False,
+        page_size: int = 500
     ) -> str:
         """
         导出知识库为Markdown格式（兼容Obsidian）
+        按书籍、按内容类型分页读取并边读边写，内存占用与知识库大小无关
+        output_path: 输出文件；per_book=True 时为输出目录
+        per_book: 每本书导出为单独的文件
+        changed_only: 只导出上次导出之后有新卡片的书籍；
+            per_book=False 时默认写到单独的 knowledge_base_changes.md，不覆盖完整导出
+        page_size: 每次从collection读取的卡片数
+        返回：输出文件（或目录）路径
         """
         if output_path is None:
-            output_path = self.persist_dir / "knowledge_base.md"
-
+            if per_book:
+                output_path = self.persist_dir / "knowledge_base"
+            elif changed_only:
+                output_path = self.persist_dir / "knowledge_base_changes.md"
+            else:
+                output_path = self.persist_dir / "knowledge_base.md"
         output_path = Path(output_path)
 
-        # 获取所有知识卡
-        all_results = self.collection.get()
-
-        # 按书籍分组
-        books = {}
-        for i, doc_id in enumerate(all_results["ids"]):
-            metadata = all_results["metadatas"][i]
-            book_title = metadata["book_title"]
-
-            if book_title not in books:
-                books[book_title] = {
-                    "author": metadata["book_author"],
-                    "insights": [],
-                    "quotes": [],
-                    "concepts": []
-                }
+        state_path = self.persist_dir / "export_state.json"
+        state = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+        # 以开始时间作为本次导出时间，导出过程中新增的卡片留到下次
+        export_started = datetime.now().timestamp()
+        books = self.book_index.books(
+            updated_since=state.get("last_export_at") if changed_only else None
+        )
 
-            content_type = metadata["content_type"]
-            content = all_results["documents"][i]
-
-            if content_type == "insight":
-                books[book_title]["insights"].append(content)
-            elif content_type == "quote":
-                books[book_title]["quotes"].append(content)
-            elif content_type == "concept":
-                books[book_title]["concepts"].append(content)
-
-        # 生成Markdown
-        markdown = "# 我的知识库\n\n"
-        markdown += f"导出时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        markdown += "---\n\n"
-
-        for book_title, book_data in books.items():
-            markdown += f## {book_title}\n\n
-            markdown += f"**作者**: {book_data['author']}\n\n"
-
-            if book_data["insights"]:
-                markdown += "### 核心观点\n\n"
-                for insight in book_data["insights"]:
-                    markdown += f"- {insight}\n"
-                markdown += "\n"
-
-            if book_data["quotes"]:
-                markdown += "### 金句卡片\n\n"
-                for quote in book_data["quotes"]:
-                    markdown += f"> {quote}\n\n"
-                markdown += "\n"
-
-            if book_data["concepts"]:
-                markdown += "### 关键概念\n\n"
-                for concept in book_data["concepts"]:
-                    markdown += f"- {concept}\n"
-                markdown += "\n"
-
-            markdown += "---\n\n"
-
-        # 写入文件
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(markdown)
-
-        print(f"✅ 知识库已导出到: {output_path}")
+        exported_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if per_book:
+            output_path.mkdir(parents=True, exist_ok=True)
+            for book in books:
+                book_path = output_path / f"{self._safe_filename(book['title'])}.md"
+                with self._atomic_write(book_path) as f:
+                    f.write(f"# {book['title']}\n\n")
+                    f.write(f"导出时间: {exported_at}\n\n")
+                    self._write_book_markdown(f, book, page_size, heading="##")
+        else:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._atomic_write(output_path) as f:
+                f.write("# 我的知识库\n\n")
+                f.write(f"导出时间: {exported_at}\n\n")
+                if changed_only:
+                    f.write(f"增量导出: {len(books)} 本有更新的书籍\n\n")
+                f.write("---\n\n")
+                for book in books:
+                    f.write(f"## {book['title']}\n\n")
+                    self._write_book_markdown(f, book, page_size, heading="###")
+                    f.write("---\n\n")
+
+        state["last_export_at"] = export_started
+        state_path.write_text(json.dumps(state), encoding="utf-8")
+
+        print(f"✅ 知识库已导出到: {output_path}（{len(books)} 本书）")
         return str(output_path)
 
-    def get_knowledge_graph_data(self) -> Dict:
+    def _write_book_markdown(self, f, book: Dict, page_size: int, heading: str):
+        """写入一本书的作者与各类卡片（每类卡片分页读取）"""
+        f.write(f"**作者**: {book['author']}\n\n")
+
+        sections = (
+            ("insight", "核心观点", "- {}\n"),
+            ("quote", "金句卡片", "> {}\n\n"),
+            ("concept", "关键概念", "- {}\n"),
+        )
+        for content_type, title, line_format in sections:
+            where = {"$and": [{"book_title": book["title"]}, {"content_type": content_type}]}
+            offset = 0
+            while True:
+                page = self.collection.get(
+                    where=where,
+                    limit=page_size,
+                    offset=offset,
+                    include=["documents"]
+                )
+                documents = page["documents"]
+                if not documents:
+                    break
+                if offset == 0:
+                    f.write(f"{heading} {title}\n\n")
+                f.writelines(line_format.format(document) for document in documents)
+                offset += len(documents)
+                if len(documents) < page_size:
+                    break
+            if offset:
+                f.write("\n")
+
+    @staticmethod
+    def _safe_filename(name: str) -> str:
+        """去掉文件名中不允许的字符"""
+        return "".join("_" if c in '\\/:*?"<>|' else c for c in name).strip() or "未命名"
+
+    @staticmethod
+    @contextmanager
+    def _atomic_write(path: Path):
+        """先写临时文件，完成后替换，导出中断不会留下半个文件"""
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                yield f
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    @staticmethod
+    def _graph_label(content: str) -> str:
+        return content[:30] + "..." if len(content) > 30 else content
+
+    def sync_graph(self, page_size: int = 500) -> int:
         """
-        获取知识图谱数据（用于可视化）
-        返回可用于可视化库（如pyvis、networkx）的数据
+        把collection中还不在图里的卡片补进语义近邻图（使用已存储的embedding，不调用模型）
+        返回：补入的卡片数
         """
-        all_results = self.collection.get()
-
-        nodes = []
-        edges = []
-        books = set()
-
-        # 构建节点
-        for i, doc_id in enumerate(all_results["ids"]):
-            metadata = all_results["metadatas"][i]
-            content = all_results["documents"][i]
-
-            book_title = metadata["book_title"]
-            books.add(book_title)
-
-            nodes.append({
-                "id": doc_id,
-                "label": content[:30] + "..." if len(content) > 30 else content,
-                "type": metadata["content_type"],
-                "book": book_title
-            })
-
-        # 添加书籍节点
-        for book in books:
-            nodes.append({
-                "id": f"book_{book}",
-                "label": f"📖 {book}",
-                "type": "book",
-                "book": book
-            })
-
-        # 构建边（知识卡 -> 书籍）
-        for node in nodes:
-            if node["type"] != "book":
-                edges.append({
-                    "from": node["id"],
-                    "to": f"book_{node['book']}",
-                    "label": "来自"
-                })
+        added = 0
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(
+                limit=page_size,
+                offset=offset,
+                include=["embeddings", "metadatas", "documents"]
+            )
+            missing = [i for i, card_id in enumerate(page["ids"]) if card_id not in self.graph_index]
+            if not missing:
+                continue
+            added += self.graph_index.add(
+                [page["ids"][i] for i in missing],
+                [page["embeddings"][i] for i in missing],
+                [page["metadatas"][i]["book_title"] for i in missing],
+                [page["metadatas"][i]["content_type"] for i in missing],
+                [self._graph_label(page["documents"][i]) for i in missing]
+            )
+        if added:
+            print(f"✅ 已将 {added} 张卡片补入知识图谱")
+        return added
 
-        return {
-            "nodes": nodes,
-            "edges": edges
-        }
+    def get_knowledge_graph_data(
+        self,
+        books: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Dict:
+        """
+        获取知识图谱数据（用于可视化）
+        返回可用于可视化库（如pyvis、networkx）的数据：
+        卡片 -> 书籍的"来自"边，以及卡片之间的"相似"边（语义k近邻）
+        books: 只取这些书的卡片；为None时按书名分页，取第 offset 本起的 limit 本
+        结果中的 total_books 为书籍总数，便于翻页
+        """
+        if len(self.graph_index) != self.collection.count():
+            self.sync_graph()
+        return self.graph_index.graph(books=books, offset=offset, limit=limit)
 
 
 # 使用示例
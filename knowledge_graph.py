@@ -0,0 +1,368 @@
+"""
+DeepRead - 知识卡片语义关联图
+为每张卡片保存语义最相近的 k 张卡片（kNN边），添加卡片时增量更新：
+新卡片与全部已有卡片做分块矩阵乘得到自己的近邻，同时顺带更新被新卡片"挤进"近邻的旧卡片
+存储：归一化向量（float32 内存映射）+ SQLite 节点/边表，读图时按书籍分页
+"""
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# 分块计算相似度时每块的卡片数
+SCAN_CHUNK_ROWS = 8192
+
+# 每个索引缓存的图数据页数（LRU）
+GRAPH_CACHE_SIZE = 32
+
+
+class CardGraphIndex:
+    """
+    卡片 kNN 图索引
+    k: 每张卡片保留的近邻数
+    min_similarity: 低于该余弦相似度的卡片不连边
+    写入在 graph.db 的写事务内进行：先读入其他实例/进程已提交的节点，再从已提交的最后一行之后追加向量
+    """
+
+    def __init__(self, directory: str, k: int = 5, min_similarity: float = 0.5):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.k = k
+        self.min_similarity = min_similarity
+
+        self._lock = threading.Lock()
+        # isolation_level=None：手动控制事务，写入时使用 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            str(self.directory / "graph.db"), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS nodes (
+                row INTEGER PRIMARY KEY,
+                card_id TEXT UNIQUE NOT NULL,
+                book_title TEXT NOT NULL,
+                content_type TEXT,
+                label TEXT,
+                kth_similarity REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS edges (
+                source INTEGER NOT NULL,
+                target INTEGER NOT NULL,
+                similarity REAL NOT NULL,
+                PRIMARY KEY (source, target)
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_nodes_book ON nodes (book_title)")
+
+        info = dict(self._conn.execute("SELECT key, value FROM info").fetchall())
+        saved = json.loads(info.get("params", "null"))
+        if saved and (saved["k"], saved["min_similarity"]) != (k, min_similarity):
+            # 参数变了，旧的边不再适用，清空后重新构建
+            self._reset()
+            info = {}
+        self.dim = int(info["dim"]) if "dim" in info else None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO info (key, value) VALUES ('params', ?)",
+            (json.dumps({"k": k, "min_similarity": min_similarity}),)
+        )
+
+        # 卡片ID -> 行号，以及每张卡片第 k 近邻的相似度（新卡片超过它才需要更新该卡片）
+        self._row_of: Dict[str, int] = {}
+        self._kth = np.zeros(0, dtype=np.float32)
+        self._vectors = None
+        self._graph_cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._refresh()
+
+    def _refresh(self, reload_kth: bool = False):
+        """
+        读入本实例还没有的节点（其他实例/进程写入的），调用方需持有 self._lock
+        reload_kth: 同时重读全部节点的第 k 近邻相似度（写入前调用，别人可能更新过旧节点）
+        """
+        new_rows = self._conn.execute(
+            "SELECT row, card_id FROM nodes WHERE row >= ? ORDER BY row", (len(self._row_of),)
+        ).fetchall()
+        if new_rows:
+            if self.dim is None:
+                dim = self._conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+                self.dim = int(dim[0]) if dim else None
+            for row, card_id in new_rows:
+                self._row_of[card_id] = row
+            self._graph_cache.clear()
+        if new_rows or reload_kth:
+            self._kth = np.array(
+                [r[0] for r in self._conn.execute("SELECT kth_similarity FROM nodes ORDER BY row")],
+                dtype=np.float32
+            )
+
+    @property
+    def _vector_path(self) -> Path:
+        return self.directory / "vectors.f32"
+
+    def _reset(self):
+        for table in ("info", "nodes", "edges"):
+            self._conn.execute(f"DELETE FROM {table}")
+        self._vector_path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._row_of
+
+    def _mapped(self) -> Optional[np.ndarray]:
+        n = len(self._row_of)
+        if n == 0:
+            return None
+        if self._vectors is None or len(self._vectors) != n:
+            self._vectors = np.memmap(self._vector_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        return self._vectors
+
+    def _merge_top_k(self, best_sim, best_idx, sims, offset):
+        """把一块相似度合并进每行当前的 top-k"""
+        sims_all = np.concatenate([best_sim, sims], axis=1)
+        idx_all = np.concatenate(
+            [best_idx, np.broadcast_to(np.arange(offset, offset + sims.shape[1]), sims.shape)], axis=1
+        )
+        k = best_sim.shape[1]
+        top = np.argpartition(-sims_all, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(sims_all, top, axis=1), np.take_along_axis(idx_all, top, axis=1)
+
+    def add(
+        self,
+        ids: Sequence[str],
+        embeddings,
+        book_titles: Sequence[str],
+        content_types: Sequence[str],
+        labels: Sequence[str]
+    ) -> int:
+        """
+        批量加入卡片并增量更新kNN边（已在图中的卡片跳过）
+        返回：新加入的卡片数
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            # 写事务串行化所有实例/进程的写入；事务内先同步别人已提交的节点
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh(reload_kth=True)
+                added = self._add_locked(ids, embeddings, book_titles, content_types, labels)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                # 内存中的近邻阈值可能已改动，按数据库重新读取
+                self._refresh(reload_kth=True)
+                raise
+            if added is None:
+                return 0
+
+            # 提交成功后才更新内存状态
+            new_ids, new_kth, dim = added
+            existing = len(self._row_of)
+            self.dim = dim
+            for n_i, card_id in enumerate(new_ids):
+                self._row_of[card_id] = existing + n_i
+            self._kth = np.concatenate([self._kth, new_kth])
+            self._graph_cache.clear()
+            return len(new_ids)
+
+    def _add_locked(self, ids, embeddings, book_titles, content_types, labels):
+        """在写事务内计算并写入新卡片的近邻；没有新卡片时返回 None"""
+        keep, seen = [], set()
+        for i, card_id in enumerate(ids):
+            if card_id not in self._row_of and card_id not in seen:
+                keep.append(i)
+                seen.add(card_id)
+        if not keep:
+            return None
+
+        vectors = embeddings[keep]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        dim = self.dim
+        if dim is None:
+            dim = vectors.shape[1]
+            self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(dim),))
+        elif vectors.shape[1] != dim:
+            raise ValueError(f"向量维度应为 {dim}，实际为 {vectors.shape[1]}")
+
+        n, existing = len(vectors), len(self._row_of)
+        best_sim = np.full((n, self.k), -np.inf, dtype=np.float32)
+        best_idx = np.full((n, self.k), -1, dtype=np.int64)
+        # 旧卡片行号 -> [(新卡片行号, 相似度)]
+        gained: Dict[int, List] = {}
+
+        # 新卡片 × 已有卡片：分块矩阵乘
+        mapped = self._mapped()
+        for start in range(0, existing, SCAN_CHUNK_ROWS):
+            end = min(start + SCAN_CHUNK_ROWS, existing)
+            sims = vectors @ np.asarray(mapped[start:end]).T
+            best_sim, best_idx = self._merge_top_k(best_sim, best_idx, sims, start)
+
+            threshold = np.maximum(self._kth[start:end], self.min_similarity)
+            new_i, old_j = np.nonzero(sims > threshold[None, :])
+            for i, j in zip(new_i, old_j):
+                gained.setdefault(start + int(j), []).append((existing + int(i), float(sims[i, j])))
+
+        # 新卡片之间
+        sims = vectors @ vectors.T
+        np.fill_diagonal(sims, -np.inf)
+        best_sim, best_idx = self._merge_top_k(best_sim, best_idx, sims, existing)
+
+        order = np.argsort(-best_sim, axis=1)
+        best_sim = np.take_along_axis(best_sim, order, axis=1)
+        best_idx = np.take_along_axis(best_idx, order, axis=1)
+        valid = (best_idx >= 0) & (best_sim >= self.min_similarity)
+        new_kth = np.where(valid.all(axis=1), best_sim[:, -1], -1.0).astype(np.float32)
+
+        # 写入向量：从已提交节点的末尾开始写，之后只可能是中断写入留下的残余字节
+        # 不截断文件，已提交节点的向量永远不会被改写
+        with open(self._vector_path, "r+b" if self._vector_path.exists() else "wb") as f:
+            f.seek(existing * dim * 4)
+            f.write(vectors.tobytes())
+        node_rows = []
+        for n_i, i in enumerate(keep):
+            row = existing + n_i
+            node_rows.append((row, ids[i], book_titles[i], content_types[i], labels[i], float(new_kth[n_i])))
+        self._conn.executemany(
+            "INSERT INTO nodes (row, card_id, book_title, content_type, label, kth_similarity) "
+            "VALUES (?, ?, ?, ?, ?, ?)", node_rows
+        )
+        self._conn.executemany(
+            "INSERT INTO edges (source, target, similarity) VALUES (?, ?, ?)",
+            [(existing + int(i), int(best_idx[i, t]), float(best_sim[i, t]))
+             for i, t in zip(*np.nonzero(valid))]
+        )
+
+        # 被新卡片挤进近邻的旧卡片：合并后只保留 top-k
+        for row, candidates in gained.items():
+            current = self._conn.execute(
+                "SELECT target, similarity FROM edges WHERE source = ?", (row,)
+            ).fetchall()
+            merged = sorted(current + candidates, key=lambda e: -e[1])[:self.k]
+            self._conn.execute("DELETE FROM edges WHERE source = ?", (row,))
+            self._conn.executemany(
+                "INSERT INTO edges (source, target, similarity) VALUES (?, ?, ?)",
+                [(row, target, similarity) for target, similarity in merged]
+            )
+            kth_similarity = merged[-1][1] if len(merged) == self.k else -1.0
+            self._kth[row] = kth_similarity
+            self._conn.execute(
+                "UPDATE nodes SET kth_similarity = ? WHERE row = ?", (kth_similarity, row)
+            )
+
+        return [ids[i] for i in keep], new_kth, dim
+
+    def _books(self) -> List[str]:
+        return [r[0] for r in self._conn.execute("SELECT DISTINCT book_title FROM nodes ORDER BY book_title")]
+
+    def books(self) -> List[str]:
+        """图中所有书籍（按书名排序）"""
+        with self._lock:
+            return self._books()
+
+    def graph(
+        self,
+        books: Optional[List[str]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Dict:
+        """
+        读取图数据（结果缓存到下次添加卡片）
+        books: 只取这些书的卡片；None 时按书名排序后取 [offset, offset+limit)
+        跨书的相似边会带上另一端的卡片节点
+        """
+        with self._lock:
+            self._refresh()
+            all_books = self._books()
+            if books is None:
+                books = all_books[offset:offset + limit] if limit is not None else all_books[offset:]
+            cache_key = json.dumps(books, ensure_ascii=False)
+            if cache_key in self._graph_cache:
+                self._graph_cache.move_to_end(cache_key)
+                return self._graph_cache[cache_key]
+
+            placeholders = ",".join("?" * len(books))
+            rows = self._conn.execute(
+                f"SELECT row, card_id, book_title, content_type, label FROM nodes "
+                f"WHERE book_title IN ({placeholders}) ORDER BY row", books
+            ).fetchall() if books else []
+            page_rows = {r[0] for r in rows}
+
+            edge_rows = self._conn.execute(
+                f"SELECT e.source, e.target, e.similarity FROM edges e JOIN nodes n ON e.source = n.row "
+                f"WHERE n.book_title IN ({placeholders})", books
+            ).fetchall() if books else []
+
+            # 另一端不在本页的卡片也加入节点
+            outside = sorted({t for _, t, _ in edge_rows} - page_rows)
+            for start in range(0, len(outside), 500):
+                chunk = outside[start:start + 500]
+                rows += self._conn.execute(
+                    f"SELECT row, card_id, book_title, content_type, label FROM nodes "
+                    f"WHERE row IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+
+            graph = self._build_graph(rows, edge_rows)
+            graph.update({"books": books, "total_books": len(all_books)})
+            self._graph_cache[cache_key] = graph
+            if len(self._graph_cache) > GRAPH_CACHE_SIZE:
+                self._graph_cache.popitem(last=False)
+            return graph
+
+    @staticmethod
+    def _build_graph(rows: List, edge_rows: List) -> Dict:
+        """节点/边转换为可视化库使用的格式"""
+        card_id_of = {row: card_id for row, card_id, _, _, _ in rows}
+        nodes, edges, graph_books = [], [], []
+        for row, card_id, book_title, content_type, label in rows:
+            nodes.append({"id": card_id, "label": label, "type": content_type, "book": book_title})
+            edges.append({"from": card_id, "to": f"book_{book_title}", "label": "来自"})
+            if book_title not in graph_books:
+                graph_books.append(book_title)
+        for book in graph_books:
+            nodes.append({"id": f"book_{book}", "label": f"📖 {book}", "type": "book", "book": book})
+
+        # kNN 是有向的，两张卡片互为近邻时只保留一条边
+        seen = set()
+        for source, target, similarity in edge_rows:
+            pair = (min(source, target), max(source, target))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            edges.append({
+                "from": card_id_of[source],
+                "to": card_id_of[target],
+                "label": "相似",
+                "similarity": round(similarity, 4)
+            })
+
+        return {"nodes": nodes, "edges": edges}
+
+
+_graph_indexes: Dict[str, CardGraphIndex] = {}
+_registry_lock = threading.Lock()
+
+
+def get_graph_index(directory: str, k: int = 5, min_similarity: float = 0.5) -> CardGraphIndex:
+    """同一目录在进程内共享一个图索引实例（参数变化时按新参数重新打开）"""
+    key = str(Path(directory).resolve())
+    with _registry_lock:
+        index = _graph_indexes.get(key)
+        if index is None or (index.k, index.min_similarity) != (k, min_similarity):
+            index = _graph_indexes[key] = CardGraphIndex(directory, k=k, min_similarity=min_similarity)
+        return index
@@ -0,0 +1,263 @@
+"""
+DeepRead - 知识卡片关键词索引
+中文按字二元组（bigram）切分、英文/数字按整词切分，BM25 打分
+与向量检索互补：精确术语（如"锚定效应"）不需要跑嵌入模型即可命中
+倒排表常驻内存，卡片文本与元数据持久化在 SQLite
+"""
+
+import json
+import math
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 倒数排名融合（RRF）常数
+RRF_K = 60
+
+_CJK = r"㐀-䶿一-鿿豈-﫿"
+_TOKEN_RUN = re.compile(rf"[{_CJK}]+|[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """中文连续片段切成字二元组（单字片段保留单字），英文/数字取整词"""
+    tokens = []
+    for run in _TOKEN_RUN.findall(text.lower()):
+        if run[0].isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """倒数排名融合：score(id) = Σ 1 / (k + 名次)，返回按分数降序的 (id, score)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引
+    行号由 SQLite 分配；写入在写事务内先读入其他实例/进程新增的卡片，提交成功后才更新内存倒排表
+    clear() 递增数据库中的代号，其他实例/进程发现代号变化后丢弃内存中的倒排表重新读入
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # isolation_level=None：手动控制事务，写入时使用 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                row INTEGER PRIMARY KEY,
+                card_id TEXT UNIQUE NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS index_state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+
+        self._generation = None
+        self._reset_memory()
+        self._refresh()
+
+    def _reset_memory(self):
+        """清空内存中的倒排表"""
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._row_of: Dict[str, int] = {}
+        self._lengths: List[int] = []
+        # 词 -> ([行号], [词频])
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._total_length = 0
+        # 查询用的 numpy 数组缓存（写入后失效）
+        self._lengths_array: Optional[np.ndarray] = None
+        self._posting_arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # 已读入内存的最大数据库行号
+        self._last_row = 0
+
+    def _refresh(self):
+        """读入数据库中本实例还没有的卡片（其他实例/进程写入的），调用方需持有 self._lock 或处于初始化中"""
+        row = self._conn.execute("SELECT value FROM index_state WHERE key = 'generation'").fetchone()
+        generation = row[0] if row else 0
+        if generation != self._generation:
+            # 索引被清空过（行号可能被重新使用），整体重新读入
+            self._reset_memory()
+            self._generation = generation
+        rows = self._conn.execute(
+            "SELECT row, card_id, document, metadata FROM documents WHERE row > ? ORDER BY row",
+            (self._last_row,)
+        ).fetchall()
+        for row, card_id, document, metadata in rows:
+            if card_id not in self._row_of:
+                self._index(card_id, document, json.loads(metadata) if metadata else {})
+            self._last_row = row
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self._row_of
+
+    def _index(self, card_id: str, document: str, metadata: Dict):
+        row = len(self._ids)
+        self._row_of[card_id] = row
+        self._ids.append(card_id)
+        self._documents.append(document)
+        self._metadatas.append(metadata)
+
+        tokens = tokenize(document)
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            rows, tfs = self._postings.setdefault(token, ([], []))
+            rows.append(row)
+            tfs.append(tf)
+            self._posting_arrays.pop(token, None)
+        self._lengths_array = None
+
+    def add(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict]) -> int:
+        """加入卡片（已存在的ID跳过），返回新加入的数量"""
+        with self._lock:
+            with self._transaction():
+                self._refresh()
+                new, seen = [], set()
+                for card_id, document, metadata in zip(ids, documents, metadatas):
+                    if card_id in self._row_of or card_id in seen:
+                        continue
+                    seen.add(card_id)
+                    new.append((card_id, document, metadata))
+                self._conn.executemany(
+                    "INSERT INTO documents (card_id, document, metadata) VALUES (?, ?, ?)",
+                    [(card_id, document, json.dumps(metadata, ensure_ascii=False))
+                     for card_id, document, metadata in new]
+                )
+            # 提交成功后再更新内存倒排表（连同本次新增的行号一起读回）
+            self._refresh()
+            return len(new)
+
+    def clear(self):
+        """清空索引（reindex 或删除卡片后调用，再从collection重新补齐）"""
+        with self._lock:
+            with self._transaction():
+                self._conn.execute("DELETE FROM documents")
+                self._conn.execute(
+                    "INSERT INTO index_state (key, value) VALUES ('generation', 1) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+                )
+            self._refresh()
+
+    @contextmanager
+    def _transaction(self):
+        """写事务：异常时回滚，不会留下未结束的事务锁住数据库"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _scores(self, tokens: List[str]) -> np.ndarray:
+        """BM25 分数（每张卡片一个分数）"""
+        n = len(self._ids)
+        scores = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return scores
+        if self._lengths_array is None:
+            self._lengths_array = np.asarray(self._lengths, dtype=np.float32)
+        lengths = self._lengths_array
+        avg_length = self._total_length / n or 1.0
+        for token in set(tokens):
+            if token not in self._postings:
+                continue
+            if token not in self._posting_arrays:
+                rows, tfs = self._postings[token]
+                self._posting_arrays[token] = (np.asarray(rows), np.asarray(tfs, dtype=np.float32))
+            rows, tfs = self._posting_arrays[token]
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / avg_length)
+            scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+        return scores
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        content_type: Optional[str] = None,
+        exact: bool = False
+    ) -> List[Dict]:
+        """
+        BM25 检索，返回与 search_knowledge 相同结构的结果（外加 score）
+        exact: 只返回原文包含整个查询词的卡片
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            self._refresh()
+            scores = self._scores(tokens)
+            candidates = np.nonzero(scores > 0)[0]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+            needle = query.strip().lower()
+            results = []
+            for row in candidates:
+                metadata = self._metadatas[row]
+                if content_type and metadata.get("content_type") != content_type:
+                    continue
+                if exact and needle not in self._documents[row].lower():
+                    continue
+                results.append({
+                    "id": self._ids[row],
+                    "content": self._documents[row],
+                    "metadata": metadata,
+                    "distance": None,
+                    "score": float(scores[row])
+                })
+                if len(results) >= n_results:
+                    break
+            return results
+
+
+_lexical_indexes: Dict[str, LexicalIndex] = {}
+_registry_lock = threading.Lock()
+
+
+def get_lexical_index(db_path: str) -> LexicalIndex:
+    """同一数据库文件在进程内共享一个索引实例"""
+    key = str(Path(db_path).resolve())
+    with _registry_lock:
+        if key not in _lexical_indexes:
+            _lexical_indexes[key] = LexicalIndex(db_path)
+        return _lexical_indexes[key]
@@ -0,0 +1,318 @@
+"""
+DeepRead - LLM调用监控
+记录每次LLM调用的服务商、模型、token用量、耗时、JSON解析结果及是否降级，
+并统计 p50/p95/p99 延迟与每本书的token消耗
+
+命令行用法:
+    python llm_telemetry.py report --days 7 --by day
+    python llm_telemetry.py report --by model
+    python llm_telemetry.py recent -n 20
+
+设置环境变量 DEEPREAD_TELEMETRY=0 可关闭记录
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_TELEMETRY_PATH = "./cache/llm_telemetry.db"
+
+# report 支持的分组方式
+GROUP_BY = {
+    "day": "date(ts, 'unixepoch', 'localtime')",
+    "model": "provider || '/' || model",
+    "operation": "operation",
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LLMCall:
+    """
+    一次LLM调用的记录，由 LLMTelemetry.track() 创建
+    调用方在执行过程中填写 token 用量、JSON解析结果等
+    """
+
+    def __init__(self, telemetry: "LLMTelemetry", provider: str, model: str,
+                 operation: str, book_title: str = ""):
+        self.telemetry = telemetry
+        self.provider = provider
+        self.model = model
+        self.operation = operation
+        self.book_title = book_title
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.json_ok: Optional[bool] = None
+        self.first_token_ms: Optional[float] = None
+        self.status = "ok"
+        self.error = ""
+        self.id: Optional[int] = None
+        self._start = 0.0
+
+    def set_usage(self, usage: Optional[Dict]):
+        """记录token用量（OpenAI兼容格式）"""
+        usage = usage or {}
+        if "prompt_tokens" in usage:
+            self.prompt_tokens = usage["prompt_tokens"]
+        if "completion_tokens" in usage:
+            self.completion_tokens = usage["completion_tokens"]
+
+    def mark_first_token(self):
+        """流式调用收到第一段内容时调用"""
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.perf_counter() - self._start) * 1000
+
+    def __enter__(self) -> "LLMCall":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        latency_ms = (time.perf_counter() - self._start) * 1000
+        if exc is not None:
+            self.status = _classify_error(exc)
+            self.error = str(exc)[:500]
+        self.id = self.telemetry.record(self, latency_ms)
+        if exc is not None and self.id is not None:
+            # 调用方降级时用这个id标记 fallback
+            try:
+                exc.telemetry_id = self.id
+            except AttributeError:
+                pass
+        return False
+
+
+def _classify_error(exc: BaseException) -> str:
+    """按异常类型归类调用结果（按类名判断，避免循环导入）"""
+    name = type(exc).__name__
+    if isinstance(exc, GeneratorExit):
+        # 流式调用被调用方中途放弃
+        return "cancelled"
+    if name == "RateLimitError":
+        return "rate_limited"
+    if name == "CircuitOpenError":
+        return "circuit_open"
+    if isinstance(exc, ValueError):
+        # json.JSONDecodeError 是 ValueError 的子类
+        return "bad_json"
+    if "Timeout" in name:
+        return "timeout"
+    return "error"
+
+
+class LLMTelemetry:
+    """LLM调用记录（SQLite，线程安全）"""
+
+    def __init__(self, db_path: str = DEFAULT_TELEMETRY_PATH, enabled: bool = True):
+        self.db_path = Path(db_path)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        if not enabled:
+            return
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                book_title TEXT,
+                latency_ms REAL NOT NULL,
+                first_token_ms REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                status TEXT NOT NULL,
+                json_ok INTEGER,
+                fallback INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls(ts)")
+        self._conn.commit()
+
+    def track(self, provider: str, model: str, operation: str, book_title: str = "") -> LLMCall:
+        """
+        记录一次调用（上下文管理器）
+
+        用法:
+            with telemetry.track("groq", model, "analysis", title) as call:
+                content, usage = ...
+                call.set_usage(usage)
+                call.json_ok = False
+                data = json.loads(content)
+                call.json_ok = True
+        """
+        return LLMCall(self, provider, model, operation, book_title)
+
+    def record(self, call: LLMCall, latency_ms: float) -> Optional[int]:
+        """写入一条记录，返回记录id；监控失败不影响业务"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "INSERT INTO llm_calls (ts, provider, model, operation, book_title, latency_ms, "
+                    "first_token_ms, prompt_tokens, completion_tokens, status, json_ok, error) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), call.provider, call.model, call.operation, call.book_title,
+                     latency_ms, call.first_token_ms, call.prompt_tokens, call.completion_tokens,
+                     call.status, None if call.json_ok is None else int(call.json_ok), call.error)
+                )
+                self._conn.commit()
+                return cursor.lastrowid
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM调用记录失败: {e}")
+            return None
+
+    def mark_fallback(self, exc: BaseException):
+        """调用失败并使用降级结果时调用，标记对应记录"""
+        call_id = getattr(exc, "telemetry_id", None)
+        if not self.enabled or call_id is None:
+            return
+        try:
+            with self._lock:
+                self._conn.execute("UPDATE llm_calls SET fallback = 1 WHERE id = ?", (call_id,))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM调用记录失败: {e}")
+
+    def report(self, days: Optional[float] = None, by: str = "day") -> List[Dict]:
+        """
+        统计报告
+        days: 只统计最近几天；None 表示全部
+        by: 分组方式 day / model / operation
+        """
+        if not self.enabled:
+            return []
+        since = time.time() - days * 86400 if days else 0
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {GROUP_BY[by]} AS grp, latency_ms, prompt_tokens, completion_tokens, "
+                "status, json_ok, fallback, book_title FROM llm_calls WHERE ts >= ? ORDER BY grp",
+                (since,)
+            ).fetchall()
+
+        groups: Dict[str, List] = {}
+        for row in rows:
+            groups.setdefault(row[0], []).append(row[1:])
+
+        report = []
+        for group, items in groups.items():
+            latencies = [item[0] for item in items if item[3] == "ok"]
+            tokens = sum((item[1] or 0) + (item[2] or 0) for item in items)
+            books = {item[6] for item in items if item[6]}
+            json_checked = [item[4] for item in items if item[4] is not None]
+            report.append({
+                "group": group,
+                "calls": len(items),
+                "errors": sum(1 for item in items if item[3] != "ok"),
+                "fallbacks": sum(item[5] for item in items),
+                "json_fail_rate": (json_checked.count(0) / len(json_checked)) if json_checked else 0.0,
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "total_tokens": tokens,
+                "books": len(books),
+                "tokens_per_book": round(tokens / len(books)) if books else None,
+            })
+        return report
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        """最近的调用记录"""
+        if not self.enabled:
+            return []
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT * FROM llm_calls ORDER BY id DESC LIMIT ?", (limit,)
+            )
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+
+
+_default_telemetry: Optional[LLMTelemetry] = None
+_default_lock = threading.Lock()
+
+
+def get_telemetry() -> LLMTelemetry:
+    """获取进程内共享的调用记录器"""
+    global _default_telemetry
+    with _default_lock:
+        if _default_telemetry is None:
+            enabled = os.getenv("DEEPREAD_TELEMETRY", "1") != "0"
+            _default_telemetry = LLMTelemetry(enabled=enabled)
+        return _default_telemetry
+
+
+def _fmt_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="DeepRead LLM调用统计")
+    parser.add_argument("--db", default=DEFAULT_TELEMETRY_PATH, help="数据库路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = sub.add_parser("report", help="延迟与token统计")
+    report_parser.add_argument("--days", type=float, help="只统计最近几天")
+    report_parser.add_argument("--by", choices=list(GROUP_BY), default="day", help="分组方式")
+
+    recent_parser = sub.add_parser("recent", help="最近的调用记录")
+    recent_parser.add_argument("-n", type=int, default=20, help="条数")
+
+    args = parser.parse_args(argv)
+    telemetry = LLMTelemetry(args.db)
+
+    if args.command == "report":
+        rows = telemetry.report(days=args.days, by=args.by)
+        if not rows:
+            print("📭 暂无调用记录")
+            return
+        print(f"{'分组':<28}{'调用':>6}{'失败':>6}{'降级':>6}{'JSON失败':>9}"
+              f"{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'书籍':>6}{'tok/本':>9}")
+        for r in rows:
+            print(f"{str(r['group']):<28}{r['calls']:>6}{r['errors']:>6}{r['fallbacks']:>6}"
+                  f"{r['json_fail_rate']:>9.1%}{_fmt_ms(r['p50_ms']):>9}{_fmt_ms(r['p95_ms']):>9}"
+                  f"{_fmt_ms(r['p99_ms']):>9}{r['books']:>6}{str(r['tokens_per_book'] or '-'):>9}")
+
+    elif args.command == "recent":
+        for r in telemetry.recent(args.n):
+            when = datetime.fromtimestamp(r["ts"]).strftime("%m-%d %H:%M:%S")
+            icon = "✅" if r["status"] == "ok" else "❌"
+            tokens = (r["prompt_tokens"] or 0) + (r["completion_tokens"] or 0)
+            extra = "（已降级）" if r["fallback"] else ""
+            print(f"{when} {icon} {r['provider']}/{r['model']} {r['operation']} "
+                  f"《{r['book_title']}》 {r['latency_ms']:.0f}ms {tokens}tok {r['status']}{extra}")
+
+    telemetry.close()
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
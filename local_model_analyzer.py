@@ -5,11 +5,24 @@ DeepRead - 本地模型分析器（无需API Key）
 
 import requests
 import json
-from typing import Dict, List
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
 
 # 导入基础类
 from book_analyzer import BookInfo, BookDeepAnalyzer
+from circuit_breaker import get_breaker
+from analysis_cache import AnalysisCache
+from llm_telemetry import get_telemetry
+
+# 模型在Ollama中常驻的时长，避免每次分析都重新加载模型
+DEFAULT_KEEP_ALIVE = "30m"
+
+# 进程内缓存：连接检查结果 {服务地址: 已安装的模型列表（无法连接时为None）}
+_connection_checks: Dict[str, Optional[List[str]]] = {}
+# 已预热的模型 {(服务地址, 模型名)}
+_warmed_models = set()
+_process_lock = threading.Lock()
 
 
 class LocalBookAnalyzer(BookDeepAnalyzer):
@@ -18,13 +31,31 @@ class LocalBookAnalyzer(BookDeepAnalyzer):
     完全免费，无需API Key
     """
 
-    def __init__(self, model_name: str = "llama3:8b", base_url: str = "http://localhost:11434"):
+    provider = "ollama"
+
+    def __init__(
+        self,
+        model_name: str = "llama3:8b",
+        base_url: str = "http://localhost:11434",
+        temperature: float = 0.7,
+        cache: Optional[AnalysisCache] = None,
+        use_cache: bool = True,
+        sectioned: bool = False,
+        keep_alive: str = DEFAULT_KEEP_ALIVE,
+        warm_up: bool = True
+    ):
         """
         初始化本地模型分析器
 
         Args:
             model_name: Ollama模型名称，推荐 "llama3:8b" 或 "qwen2:7b"
             base_url: Ollama服务地址
+            temperature: 生成温度
+            cache: 分析结果缓存（默认使用 ./cache/analysis_cache.db）
+            use_cache: 是否启用缓存
+            sectioned: 分段并发分析（需要Ollama允许并行请求，见 OLLAMA_NUM_PARALLEL）
+            keep_alive: 模型常驻时长，如 "30m"、"-1"（一直常驻）
+            warm_up: 是否在后台预先加载模型（每个进程只执行一次）
 
         使用前需要：
         1. 安装Ollama: https://ollama.com/download
@@ -32,14 +63,34 @@ class LocalBookAnalyzer(BookDeepAnalyzer):
         3. 启动服务: ollama serve
         """
         self.model_name = model_name
+        self.model = f"ollama:{model_name}"
+        self.temperature = temperature
+        self.sectioned = sectioned
         self.base_url = base_url
         self.api_url = f"{base_url}/api/generate"
+        self.keep_alive = keep_alive
+        self.breaker = get_breaker(f"ollama:{base_url}", max_timeout=300, min_timeout=60)
+        self._init_cache(cache, use_cache)
 
-        # 测试连接
-        self._check_connection()
+        # 测试连接（每个进程每个服务地址只检查一次）
+        installed = self._check_connection()
 
-    def _check_connection(self):
-        """检查Ollama服务是否运行"""
+        # 后台加载模型，第一次分析时不必等待模型加载
+        if warm_up and installed and self.model_name in installed:
+            threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def _check_connection(self) -> Optional[List[str]]:
+        """
+        检查Ollama服务是否运行（结果在进程内缓存）
+        返回: 已安装的模型列表，无法连接时返回None
+        缓存的列表中没有所需模型时重新检查（可能刚执行过 ollama pull）
+        """
+        with _process_lock:
+            cached = _connection_checks.get(self.base_url)
+        if cached is not None and self.model_name in cached:
+            return cached
+
+        model_names = None
         try:
             response = requests.get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
@@ -59,51 +110,117 @@ class LocalBookAnalyzer(BookDeepAnalyzer):
             print(f"❌ 连接错误: {e}")
             print("💡 请先安装并启动Ollama")
 
-    def analyze_book(self, book_info: BookInfo) -> Dict:
+        # 无法连接时不缓存，下次创建分析器时重新检查
+        if model_names is not None:
+            with _process_lock:
+                _connection_checks[self.base_url] = model_names
+        return model_names
+
+    def warm_up(self) -> bool:
         """
-        使用本地模型分析书籍
-        注意：本地模型可能比API慢，但完全免费
+        预先加载模型并按 keep_alive 常驻（每个进程每个模型只执行一次）
+        返回: 是否已预热
         """
-        prompt = self._build_analysis_prompt(book_info)
+        key = (self.base_url, self.model_name)
+        with _process_lock:
+            if key in _warmed_models:
+                return True
+            _warmed_models.add(key)
 
         try:
-            print(f"🤖 使用本地模型 {self.model_name} 分析中...")
-            print("⏳ 这可能需要1-3分钟，请稍候...")
+            # 空提示词只加载模型，不生成内容
+            response = requests.post(
+                self.api_url,
+                json={"model": self.model_name, "prompt": "", "keep_alive": self.keep_alive},
+                timeout=300
+            )
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            print(f"⚠️ 模型预热失败: {e}")
+            with _process_lock:
+                _warmed_models.discard(key)
+            return False
 
+    def _generate(self, prompt: str) -> Tuple[str, Dict]:
+        """
+        调用Ollama生成完整回复
+        返回: (生成内容, token用量)
+        """
+        usage = {}
+        content = "".join(self._stream_completion(prompt, usage))
+        return content, usage
+
+    def _stream_completion(self, prompt: str, usage: Optional[Dict] = None) -> Iterator[str]:
+        """
+        调用Ollama流式接口（每行一个JSON），逐段返回生成的文本
+        要求输出JSON格式，并让模型按 keep_alive 常驻
+        usage: 传入字典时，结束后写入token用量
+        """
+        def request(timeout: float):
             response = requests.post(
                 self.api_url,
                 json={
                     "model": self.model_name,
                     "prompt": prompt,
-                    "stream": False,
+                    "stream": True,
+                    "format": "json",
+                    "keep_alive": self.keep_alive,
                     "options": {
-                        "temperature": 0.7,
+                        "temperature": self.temperature,
                         "num_predict": 4096
                     }
                 },
-                timeout=300  # 5分钟超时
+                timeout=timeout,  # 首个token最长等待5分钟，随实际耗时自适应
+                stream=True
             )
             response.raise_for_status()
+            return response
 
-            result = response.json()
-            content = result.get("response", "")
+        def read(response) -> Iterator[str]:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event.get("error"):
+                        raise RuntimeError(f"Ollama错误: {event['error']}")
+                    if event.get("response"):
+                        yield event["response"]
+                    if event.get("done"):
+                        if usage is not None:
+                            usage["prompt_tokens"] = event.get("prompt_eval_count", 0)
+                            usage["completion_tokens"] = event.get("eval_count", 0)
+                        break
 
-            # 尝试解析JSON（Ollama可能返回JSON前后的文字）
-            # 查找JSON部分
-            json_start = content.find("{")
-            json_end = content.rfind("}") + 1
+        # 生成中途出错（连接断开、模型报错）也计为失败
+        yield from self.breaker.stream(request, read)
 
-            if json_start >= 0 and json_end > json_start:
-                json_str = content[json_start:json_end]
-                analysis = json.loads(json_str)
-                print("✅ 分析完成！")
-                return analysis
-            else:
-                print("⚠️ 无法解析JSON，使用降级方案")
-                return self._fallback_analysis(book_info)
+    def _chat_completion(self, prompt: str) -> Tuple[str, Dict, Dict]:
+        """调用本地模型，返回: (生成内容, token用量, {})"""
+        content, usage = self._generate(prompt)
+        return content, usage, {}
+
+    def analyze_book(self, book_info: BookInfo) -> Dict:
+        """
+        使用本地模型分析书籍
+        注意：本地模型可能比API慢，但完全免费
+        """
+        cached = self._get_cached_analysis(book_info)
+        if cached is not None:
+            return cached
+
+        try:
+            print(f"🤖 使用本地模型 {self.model_name} 分析中...")
+            print("⏳ 这可能需要1-3分钟，请稍候...")
+
+            analysis, _ = self.request_analysis(book_info)
+            print("✅ 分析完成！")
+            return analysis
 
         except Exception as e:
             print(f"❌ 本地模型分析错误: {e}")
+            get_telemetry().mark_fallback(e)
             return self._fallback_analysis(book_info)
 
 
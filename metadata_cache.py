@@ -0,0 +1,195 @@
+"""
+DeepRead - 书籍元数据缓存
+使用SQLite在本地持久化书名检索结果，避免重复请求 Google Books / Open Library
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+# 默认缓存位置与有效期
+DEFAULT_CACHE_PATH = "./cache/book_metadata.db"
+DEFAULT_TTL = 30 * 24 * 3600          # 命中结果保留30天
+DEFAULT_NEGATIVE_TTL = 24 * 3600      # “未找到”结果保留1天
+
+# 缓存未命中标记（区别于“已缓存的未找到”即 None）
+CACHE_MISS = object()
+
+
+def normalize_title(title: str) -> str:
+    """
+    规范化书名，作为缓存键
+    全角/半角统一、忽略大小写、去掉空白和标点
+    例如 "思考，快与慢" 与 "思考,快与慢" 得到相同的键
+    """
+    text = unicodedata.normalize("NFKC", title or "").casefold()
+    return "".join(
+        ch for ch in text
+        if not unicodedata.category(ch).startswith(("P", "Z", "C"))
+    )
+
+
+class BookMetadataCache:
+    """
+    书籍元数据缓存（SQLite + 进程内热缓存）
+    - 以 规范化书名 + 语言 为键
+    - 支持TTL过期和负缓存（未找到的书）
+    - 记录命中/未命中次数
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_CACHE_PATH,
+        ttl: float = DEFAULT_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL
+    ):
+        """
+        db_path: SQLite数据库路径
+        ttl: 命中结果有效期（秒）
+        negative_ttl: 未找到结果的有效期（秒），设为0则不做负缓存
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self._lock = threading.Lock()
+        self._memory: Dict[str, tuple] = {}
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "expired": 0, "writes": 0}
+
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS book_metadata (
+                cache_key TEXT PRIMARY KEY,
+                data_json TEXT,
+                expires_at REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(title: str, lang: str = "") -> str:
+        """生成缓存键"""
+        return f"{lang or ''}:{normalize_title(title)}"
+
+    def get(self, title: str, lang: str = ""):
+        """
+        查询缓存
+        返回: 书籍信息字典；None 表示已缓存的“未找到”；CACHE_MISS 表示未命中
+        """
+        key = self.make_key(title, lang)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT data_json, expires_at FROM book_metadata WHERE cache_key = ?",
+                    (key,)
+                ).fetchone()
+                if row is not None:
+                    data = json.loads(row[0]) if row[0] else None
+                    entry = (data, row[1])
+                    self._memory[key] = entry
+
+            if entry is None:
+                self._stats["misses"] += 1
+                return CACHE_MISS
+
+            data, expires_at = entry
+            if expires_at <= now:
+                self._memory.pop(key, None)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return CACHE_MISS
+
+            if data is None:
+                self._stats["negative_hits"] += 1
+            else:
+                self._stats["hits"] += 1
+            # 返回副本，避免调用方修改缓存内容
+            return dict(data) if data is not None else None
+
+    def put(self, title: str, lang: str, data: Optional[Dict]):
+        """
+        写入缓存
+        data: 书籍信息字典；None 表示未找到（负缓存）
+        """
+        ttl = self.ttl if data is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+
+        key = self.make_key(title, lang)
+        now = time.time()
+        expires_at = now + ttl
+        data_json = json.dumps(data, ensure_ascii=False) if data is not None else None
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO book_metadata (cache_key, data_json, expires_at, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, data_json, expires_at, now)
+            )
+            self._conn.commit()
+            self._memory[key] = (dict(data) if data is not None else None, expires_at)
+            self._stats["writes"] += 1
+
+    def iter_books(self) -> Iterator[Tuple[str, str, Dict, float]]:
+        """遍历所有未过期的命中条目，返回 (规范化书名, 语言, 书籍信息字典, 过期时间戳)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cache_key, data_json, expires_at FROM book_metadata "
+                "WHERE data_json IS NOT NULL AND expires_at > ?",
+                (time.time(),)
+            ).fetchall()
+        for cache_key, data_json, expires_at in rows:
+            lang, _, normalized_title = cache_key.partition(":")
+            yield normalized_title, lang, json.loads(data_json), expires_at
+
+    def invalidate(self, title: str, lang: str = ""):
+        """删除某本书的缓存"""
+        key = self.make_key(title, lang)
+        with self._lock:
+            self._conn.execute("DELETE FROM book_metadata WHERE cache_key = ?", (key,))
+            self._conn.commit()
+            self._memory.pop(key, None)
+
+    def purge_expired(self) -> int:
+        """清理过期条目，返回删除数量"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM book_metadata WHERE expires_at <= ?", (now,)
+            )
+            self._conn.commit()
+            self._memory = {k: v for k, v in self._memory.items() if v[1] > now}
+            return cursor.rowcount
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM book_metadata")
+            self._conn.commit()
+            self._memory.clear()
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute(
+                "SELECT COUNT(*) FROM book_metadata"
+            ).fetchone()[0]
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["negative_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,399 @@
+"""
+DeepRead - 离线书籍元数据索引
+从 Open Library 等批量数据导出文件构建紧凑的排序索引文件，运行时内存映射查询
+已收录的书籍无需联网即可获取 BookInfo
+
+构建索引（作者导出文件可选，用于把 edition 记录中的作者ID解析为姓名）:
+    python offline_index.py build ol_dump_editions.txt.gz --authors ol_dump_authors.txt.gz -o ./cache/offline_index.bin
+查询:
+    python offline_index.py lookup ./cache/offline_index.bin 9787508633558
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from metadata_cache import normalize_title
+
+DEFAULT_INDEX_PATH = "./cache/offline_index.bin"
+
+# 文件格式:
+#   头部:   MAGIC(8字节) + 条目数(uint32) + 数据区偏移(uint64)
+#   条目区: 按键摘要排序的定长条目 (摘要8字节, 记录偏移uint64, 记录长度uint32)
+#   数据区: UTF-8 JSON 记录
+MAGIC = b"DRIDX001"
+HEADER = struct.Struct("<8sIQ")
+ENTRY = struct.Struct("<8sQI")
+
+# 构建时每处理多少条记录提交一次暂存数据库
+BUILD_BATCH_SIZE = 10000
+
+
+def normalize_isbn(isbn: str) -> Optional[str]:
+    """规范化ISBN，统一转换为ISBN-13；格式不正确返回None"""
+    digits = "".join(ch for ch in str(isbn) if ch.isdigit() or ch in "xX").upper()
+    if len(digits) == 10:
+        # 只有校验位可以是 X
+        if not digits[:9].isdigit():
+            return None
+        core = "978" + digits[:9]
+        total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(core))
+        return core + str((10 - total % 10) % 10)
+    if len(digits) == 13 and digits.isdigit():
+        return digits
+    return None
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+
+
+def _title_key(title: str) -> str:
+    return "title:" + normalize_title(title)
+
+
+def _isbn_key(isbn: str) -> str:
+    return "isbn:" + isbn
+
+
+# ==================== 导出数据解析 ====================
+def _iter_dump_records(path: str) -> Iterator[Dict]:
+    """
+    逐行读取导出文件
+    支持 JSONL（每行一个JSON对象）和 Open Library 官方导出的TSV格式
+    （type, key, revision, last_modified, JSON），支持 .gz 压缩
+    """
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith("{"):
+                line = line.rsplit("\t", 1)[-1]
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def record_to_book(
+    record: Dict,
+    author_names: Optional[Callable[[str], Optional[str]]] = None
+) -> Optional[Dict]:
+    """
+    将一条导出记录转换为 BookInfo 字段字典
+    兼容 Open Library 的 edition / work 记录和 search.json 文档
+    author_names: 作者ID（如 /authors/OL23919A）-> 姓名；edition / work 记录只带作者ID，不带姓名
+    """
+    title = record.get("title")
+    if not title:
+        return None
+
+    author = _first(record.get("author_name"))
+    if not author:
+        first_author = _first(record.get("authors"))
+        if isinstance(first_author, dict):
+            # edition: {"key": ...}；work: {"author": {"key": ...}, "type": ...}
+            ref = first_author.get("author") or first_author
+            author = ref.get("name")
+            if not author and author_names is not None and ref.get("key"):
+                author = author_names(ref["key"])
+    if not author:
+        author = record.get("by_statement") or "未知作者"
+
+    isbns = []
+    for field in ("isbn_13", "isbn_10", "isbn"):
+        for isbn in record.get(field) or []:
+            normalized = normalize_isbn(isbn)
+            if normalized and normalized not in isbns:
+                isbns.append(normalized)
+
+    description = record.get("description")
+    if isinstance(description, dict):
+        description = description.get("value")
+
+    cover_id = _first(record.get("covers")) or record.get("cover_i")
+    cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-M.jpg" if isinstance(cover_id, int) and cover_id > 0 else None
+
+    page_count = record.get("number_of_pages") or record.get("number_of_pages_median")
+
+    return {
+        "title": title,
+        "author": author,
+        "isbn": isbns[0] if isbns else None,
+        "published_date": record.get("publish_date") or record.get("first_publish_year"),
+        "description": description,
+        "page_count": page_count if isinstance(page_count, int) else None,
+        "categories": list(record.get("subjects") or record.get("subject") or [])[:10],
+        "cover_url": cover_url,
+        "average_rating": record.get("ratings_average"),
+        "_isbns": isbns,
+    }
+
+
+def _record_score(book: Dict) -> int:
+    """同名书籍有多条记录时，保留信息最完整的一条"""
+    return sum(1 for k, v in book.items() if v and not k.startswith("_"))
+
+
+# ==================== 构建索引 ====================
+def _open_staging(path: Path) -> sqlite3.Connection:
+    """
+    构建用的暂存数据库：去重表和记录都放在磁盘上，完整的 Open Library 导出也不会占满内存
+    只在构建期间存在，不需要崩溃保护
+    """
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript('''
+        CREATE TABLE authors (
+            key TEXT PRIMARY KEY,
+            name TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE payloads (
+            id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL
+        );
+        CREATE TABLE entries (
+            digest BLOB PRIMARY KEY,
+            score INTEGER NOT NULL,
+            payload INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    ''')
+    return conn
+
+
+def _load_authors(conn: sqlite3.Connection, authors_path: str) -> int:
+    """从 Open Library 作者导出文件读入 作者ID -> 姓名，返回作者数"""
+    batch = []
+    for record in _iter_dump_records(authors_path):
+        key, name = record.get("key"), record.get("name")
+        if not key or not name:
+            continue
+        batch.append((key, name))
+        if len(batch) >= BUILD_BATCH_SIZE:
+            conn.executemany("INSERT OR REPLACE INTO authors (key, name) VALUES (?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT OR REPLACE INTO authors (key, name) VALUES (?, ?)", batch)
+    conn.commit()
+    return conn.execute("SELECT COUNT(*) FROM authors").fetchone()[0]
+
+
+def build_index(
+    dump_path: str,
+    output_path: str = DEFAULT_INDEX_PATH,
+    authors_path: Optional[str] = None
+) -> Dict:
+    """
+    从导出文件构建离线索引
+    authors_path: Open Library 作者导出文件（可选），用于解析 edition / work 记录中的作者姓名
+    同一个键有多条记录时保留信息最完整的一条；被完全取代的记录不会写入索引文件
+    返回: 构建统计信息
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    start = time.time()
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+
+    # 暂存数据库放在输出目录旁边（与索引文件同一块磁盘），构建结束后删除
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as staging_dir:
+        conn = _open_staging(Path(staging_dir) / "staging.db")
+        try:
+            authors = _load_authors(conn, authors_path) if authors_path else 0
+
+            def author_name(key: str) -> Optional[str]:
+                row = conn.execute("SELECT name FROM authors WHERE key = ?", (key,)).fetchone()
+                return row[0] if row else None
+
+            processed = 0
+            for record in _iter_dump_records(dump_path):
+                book = record_to_book(record, author_name if authors else None)
+                if book is None:
+                    continue
+
+                payload = json.dumps(book, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                score = _record_score(book)
+                keys = [_title_key(book["title"])] + [_isbn_key(isbn) for isbn in book["_isbns"]]
+
+                payload_id = conn.execute("INSERT INTO payloads (data) VALUES (?)", (payload,)).lastrowid
+                before = conn.total_changes
+                # 只有得分更高才替换已有记录（同分保留先出现的）
+                conn.executemany(
+                    "INSERT INTO entries (digest, score, payload) VALUES (?, ?, ?) "
+                    "ON CONFLICT(digest) DO UPDATE SET score = excluded.score, payload = excluded.payload "
+                    "WHERE excluded.score > entries.score",
+                    [(_digest(key), score, payload_id) for key in keys]
+                )
+                if conn.total_changes == before:
+                    # 没有任何键采用这条记录
+                    conn.execute("DELETE FROM payloads WHERE id = ?", (payload_id,))
+
+                processed += 1
+                if processed % BUILD_BATCH_SIZE == 0:
+                    conn.commit()
+
+            # 压缩：删除所有键都已被更完整记录取代的旧记录，再按ID顺序分配数据区偏移
+            conn.execute("DELETE FROM payloads WHERE id NOT IN (SELECT payload FROM entries)")
+            conn.execute(
+                "CREATE TABLE layout AS SELECT id, "
+                "SUM(length(data)) OVER (ORDER BY id) - length(data) AS offset, length(data) AS length "
+                "FROM payloads"
+            )
+            conn.execute("CREATE UNIQUE INDEX layout_id ON layout (id)")
+            conn.commit()
+
+            records = conn.execute("SELECT COUNT(*) FROM payloads").fetchone()[0]
+            keys = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+            try:
+                with open(tmp_path, "wb") as out:
+                    data_offset = HEADER.size + ENTRY.size * keys
+                    out.write(HEADER.pack(MAGIC, keys, data_offset))
+                    for digest, rec_offset, length in conn.execute(
+                        "SELECT e.digest, l.offset, l.length FROM entries e "
+                        "JOIN layout l ON l.id = e.payload ORDER BY e.digest"
+                    ):
+                        out.write(ENTRY.pack(digest, rec_offset, length))
+                    for (data,) in conn.execute("SELECT data FROM payloads ORDER BY id"):
+                        out.write(data)
+                os.replace(tmp_path, output_path)
+            except BaseException:
+                # 不留下写了一半的临时文件
+                tmp_path.unlink(missing_ok=True)
+                raise
+        finally:
+            conn.close()
+
+    return {
+        "records": records,
+        "keys": keys,
+        "authors": authors,
+        "size_bytes": output_path.stat().st_size,
+        "seconds": round(time.time() - start, 2),
+    }
+
+
+# ==================== 查询索引 ====================
+class OfflineMetadataIndex:
+    """离线元数据索引（内存映射，二分查找）"""
+
+    def __init__(self, index_path: str = DEFAULT_INDEX_PATH):
+        self.index_path = Path(index_path)
+        self._file = open(self.index_path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, self._data_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的离线索引文件: {index_path}")
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, key: str) -> Optional[Dict]:
+        digest = _digest(key)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = HEADER.size + mid * ENTRY.size
+            mid_digest = self._mm[pos:pos + 8]
+            if mid_digest < digest:
+                lo = mid + 1
+            elif mid_digest > digest:
+                hi = mid
+            else:
+                _, offset, length = ENTRY.unpack_from(self._mm, pos)
+                start = self._data_offset + offset
+                return json.loads(self._mm[start:start + length].decode("utf-8"))
+        return None
+
+    @staticmethod
+    def _to_book(record: Dict) -> Dict:
+        return {k: v for k, v in record.items() if not k.startswith("_")}
+
+    def lookup_title(self, title: str) -> Optional[Dict]:
+        """按书名查询，返回 BookInfo 字段字典"""
+        key = normalize_title(title)
+        if not key:
+            return None
+        record = self._find("title:" + key)
+        # 校验书名，排除摘要碰撞
+        if record is None or normalize_title(record["title"]) != key:
+            return None
+        return self._to_book(record)
+
+    def lookup_isbn(self, isbn: str) -> Optional[Dict]:
+        """按ISBN查询（ISBN-10/13均可），返回 BookInfo 字段字典"""
+        normalized = normalize_isbn(isbn)
+        if not normalized:
+            return None
+        record = self._find(_isbn_key(normalized))
+        if record is None or normalized not in record.get("_isbns", []):
+            return None
+        return self._to_book(record)
+
+    def close(self):
+        """释放内存映射"""
+        self._mm.close()
+        self._file.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="DeepRead 离线书籍元数据索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="从导出文件构建索引")
+    build_parser.add_argument("dump", help="JSONL 或 Open Library 导出文件（可为 .gz）")
+    build_parser.add_argument("-o", "--output", default=DEFAULT_INDEX_PATH, help="索引文件路径")
+    build_parser.add_argument("--authors", help="Open Library 作者导出文件（可为 .gz），用于解析作者姓名")
+
+    lookup_parser = sub.add_parser("lookup", help="查询书名或ISBN")
+    lookup_parser.add_argument("index", help="索引文件路径")
+    lookup_parser.add_argument("query", help="书名或ISBN")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(f"📦 正在构建离线索引: {args.dump}")
+        stats = build_index(args.dump, args.output, args.authors)
+        if args.authors:
+            print(f"👤 已读入 {stats['authors']} 位作者")
+        print(f"✅ 完成: {stats['records']} 条记录, {stats['keys']} 个键, "
+              f"{stats['size_bytes'] / 1024**2:.1f}MB, 用时 {stats['seconds']}s")
+        print(f"📁 索引文件: {args.output}")
+    else:
+        index = OfflineMetadataIndex(args.index)
+        start = time.perf_counter()
+        book = index.lookup_isbn(args.query) or index.lookup_title(args.query)
+        elapsed = (time.perf_counter() - start) * 1000
+        if book:
+            print(json.dumps(book, ensure_ascii=False, indent=2))
+        else:
+            print("❌ 未找到")
+        print(f"⏱️ 查询耗时: {elapsed:.3f}ms")
+        index.close()
+
+
+if __name__ == "__main__":
+    # Windows编码修复
+    if sys.platform == "win32":
+        import io
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
@@ -10,6 +10,9 @@ from typing import List, Dict
 from dataclasses import dataclass
 import requests
 
+from circuit_breaker import get_breaker
+from llm_telemetry import get_telemetry
+
 # Edge TTS 是免费的，无需API key
 # 安装: pip install edge-tts
 import edge_tts
@@ -31,6 +34,8 @@ class PodcastScriptGenerator:
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("GROQ_API_KEY", "")
         self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.model = "llama3-70b-8192"
+        self.breaker = get_breaker("groq", max_timeout=60, min_timeout=15)
 
     def generate_script(
         self,
@@ -81,7 +86,7 @@ class PodcastScriptGenerator:
 - 要有观点碰撞，不要只是简单的信息传递
 - 加入一些生活化的例子和比喻"""
 
-        try:
+        def request(timeout: float):
             response = requests.post(
                 self.api_url,
                 headers={
@@ -89,23 +94,34 @@ class PodcastScriptGenerator:
                     "Content-Type": "application/json"
                 },
                 json={
-                    "model": "llama3-70b-8192",
+                    "model": self.model,
                     "messages": [{"role": "user", "content": prompt}],
                     "temperature": 0.8,
                     "response_format": {"type": "json_object"}
                 },
-                timeout=60
+                timeout=timeout
             )
             response.raise_for_status()
+            return response
+
+        try:
+            with get_telemetry().track("groq", self.model, "podcast_script", book_title) as call:
+                # 与书籍分析共用 Groq 熔断器，熔断时直接使用降级脚本
+                response = self.breaker.call(request)
 
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            script_data = json.loads(content)
+                result = response.json()
+                call.set_usage(result.get("usage"))
+                content = result["choices"][0]["message"]["content"]
+                call.json_ok = False
+                script_data = json.loads(content)
+                script = PodcastScript(**script_data)
+                call.json_ok = True
 
-            return PodcastScript(**script_data)
+            return script
 
         except Exception as e:
             print(f"脚本生成错误: {e}")
+            get_telemetry().mark_fallback(e)
             return self._fallback_script(book_title, book_author, key_insights)
 
     def _fallback_script(self, book_title: str, book_author: str, key_insights: List[str]) -> PodcastScript:
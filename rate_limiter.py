@@ -0,0 +1,146 @@
+"""
+DeepRead - 请求限流器
+令牌桶算法，按主机限制外部API的请求速率
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    令牌桶（线程安全）
+    rate: 每秒补充的令牌数
+    capacity: 桶容量（允许的突发请求数）
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        尝试取令牌
+        返回: 0 表示成功；否则为还需等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞直到取得令牌
+        timeout: 最长等待时间（秒），None 表示一直等待
+        返回: 是否取得令牌
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if wait_time == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_time = min(wait_time, remaining)
+            time.sleep(wait_time)
+
+
+class HostRateLimiter:
+    """
+    按主机分别限流
+    limits: {主机名: (每秒请求数, 突发容量)}，未配置的主机使用 default
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        default: Optional[Tuple[float, float]] = None
+    ):
+        self.limits = dict(limits or {})
+        self.default = default
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket_for(self, host: str) -> Optional[TokenBucket]:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                limit = self.limits.get(host, self.default)
+                if limit is None:
+                    return None
+                bucket = TokenBucket(*limit)
+                self._buckets[host] = bucket
+            return bucket
+
+    def acquire(self, url: str, timeout: Optional[float] = None) -> bool:
+        """按URL的主机取令牌；该主机未限流时直接返回True"""
+        bucket = self._bucket_for(urlparse(url).hostname or "")
+        if bucket is None:
+            return True
+        return bucket.acquire(timeout=timeout)
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析时长字符串，如 "2m59.56s"、"7.66s"、"120ms"、"30"，返回秒数"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    total, number = 0.0, ""
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch.isdigit() or ch == ".":
+            number += ch
+        else:
+            unit = "ms" if value[i:i + 2] == "ms" else ch
+            i += len(unit) - 1
+            scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}.get(unit)
+            if scale is None or not number:
+                return None
+            total += float(number) * scale
+            number = ""
+        i += 1
+    return total
+
+
+def parse_rate_limit_headers(headers) -> Dict[str, Optional[float]]:
+    """
+    解析 OpenAI 兼容接口（如Groq）返回的限流响应头
+    返回: retry_after / reset_requests / reset_tokens 为秒数，remaining_* 为剩余额度
+    """
+    headers = headers or {}
+
+    def remaining(name):
+        try:
+            return int(headers.get(name))
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "retry_after": _parse_duration(headers.get("retry-after")),
+        "remaining_requests": remaining("x-ratelimit-remaining-requests"),
+        "remaining_tokens": remaining("x-ratelimit-remaining-tokens"),
+        "reset_requests": _parse_duration(headers.get("x-ratelimit-reset-requests")),
+        "reset_tokens": _parse_duration(headers.get("x-ratelimit-reset-tokens")),
+    }
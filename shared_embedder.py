@@ -0,0 +1,114 @@
+"""
+DeepRead - 进程内共享的文本嵌入模型
+嵌入模型约400MB，整个进程只加载一次，所有知识库实例共用；
+启动时在后台线程加载，页面可以先渲染，通过 state 查看是否就绪
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+NOT_STARTED = "not_started"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class EmbedderNotReady(Exception):
+    """嵌入模型尚未加载完成（等待超时）"""
+
+
+class SharedEmbedder:
+    """
+    后台加载的 SentenceTransformer 包装
+    encode() 在模型就绪前会阻塞等待，调用方也可以先检查 ready 再决定是否调用
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL):
+        self.model_name = model_name
+        self.state = NOT_STARTED
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def start(self) -> "SharedEmbedder":
+        """开始后台加载（重复调用无影响；加载失败后再次调用会重试）"""
+        with self._lock:
+            if self.state in (LOADING, READY):
+                return self
+            self.state = LOADING
+            self.error = None
+            self._loaded.clear()
+        threading.Thread(target=self._load, name=f"embedder-{self.model_name}", daemon=True).start()
+        return self
+
+    def _load(self):
+        start = time.time()
+        try:
+            print(f"📦 后台加载嵌入模型 {self.model_name}（第一次会下载，约400MB）...")
+            # 导入本身也较慢，放在后台线程中
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+            self.load_seconds = time.time() - start
+            self.state = READY
+            print(f"✅ 嵌入模型加载完成（{self.load_seconds:.1f}s）")
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+            print(f"❌ 嵌入模型加载失败: {e}")
+        finally:
+            self._loaded.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待模型加载结束，返回是否就绪"""
+        if self.state == NOT_STARTED:
+            self.start()
+        self._loaded.wait(timeout)
+        return self.ready
+
+    def _require_model(self, timeout: Optional[float] = None):
+        if not self.wait(timeout):
+            if self.state == FAILED:
+                raise RuntimeError(f"嵌入模型加载失败: {self.error}")
+            raise EmbedderNotReady(f"嵌入模型 {self.model_name} 仍在加载中")
+        return self._model
+
+    def encode(self, sentences, **kwargs):
+        """与 SentenceTransformer.encode 相同，模型未就绪时等待加载完成"""
+        return self._require_model().encode(sentences, **kwargs)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._require_model().get_sentence_embedding_dimension()
+
+    def status(self) -> Dict:
+        """加载状态（用于页面显示）"""
+        return {
+            "model": self.model_name,
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+        }
+
+
+_embedders: Dict[str, SharedEmbedder] = {}
+_registry_lock = threading.Lock()
+
+
+def get_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL, start: bool = True) -> SharedEmbedder:
+    """获取进程内共享的嵌入模型；start=True 时立即开始后台加载"""
+    with _registry_lock:
+        embedder = _embedders.get(model_name)
+        if embedder is None:
+            embedder = SharedEmbedder(model_name)
+            _embedders[model_name] = embedder
+    if start:
+        embedder.start()
+    return embedder
@@ -0,0 +1,133 @@
+"""
+DeepRead - 相同请求合并（single-flight）
+同一进程内多个会话同时发起相同的请求时，只执行一次，其余调用等待并共享结果
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class FlightAbandoned(Exception):
+    """执行者中途放弃（如流式分析被关闭），等待者应自行重试"""
+
+
+class _Call:
+    """一次正在执行的请求"""
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    请求合并器（线程安全）
+
+    用法:
+        result, shared = flight.do(key, lambda: expensive_call())
+
+    需要自行控制执行过程时（如流式输出）:
+        call, leader = flight.begin(key)
+        if leader:
+            try:
+                result = ...
+                flight.finish(key, call, result=result)
+            except Exception as e:
+                flight.finish(key, call, error=e)
+        else:
+            result = flight.wait(call)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executed": 0, "shared": 0}
+
+    def begin(self, key: Hashable) -> Tuple[_Call, bool]:
+        """
+        登记一次请求
+        返回: (请求, 是否由本调用执行)
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["shared"] += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self._stats["executed"] += 1
+            return call, True
+
+    def finish(self, key: Hashable, call: _Call, result: Any = None, error: Optional[BaseException] = None):
+        """执行者完成请求，唤醒所有等待者"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def wait(self, call: _Call, timeout: Optional[float] = None) -> Any:
+        """等待执行者的结果；执行失败时抛出同样的异常"""
+        if not call.done.wait(timeout):
+            raise TimeoutError(f"{self.name} 等待合并请求超时")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        执行或等待相同请求
+        返回: (结果, 是否共享了其他调用的结果)
+        """
+        while True:
+            call, leader = self.begin(key)
+            if not leader:
+                try:
+                    return self.wait(call), True
+                except FlightAbandoned:
+                    continue
+
+            try:
+                result = func()
+            except BaseException as e:
+                self.finish(key, call, error=e)
+                raise
+            self.finish(key, call, result=result)
+            return result, False
+
+    def stats(self) -> Dict:
+        """合并统计：shared 即节省的调用次数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+_flights: Dict[str, SingleFlight] = {}
+_registry_lock = threading.Lock()
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    """获取（首次调用时创建）进程内共享的请求合并器"""
+    with _registry_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = SingleFlight(name)
+            _flights[name] = flight
+        return flight
+
+
+def singleflight_stats() -> Dict[str, Dict]:
+    """所有请求合并器的统计（用于监控页面）"""
+    with _registry_lock:
+        flights = list(_flights.values())
+    return {flight.name: flight.stats() for flight in flights}
@@ -0,0 +1,300 @@
+"""
+DeepRead - 流式JSON解析
+LLM逐token生成JSON时，增量解析并在数组元素生成完毕时立即返回
+"""
+
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+# 数组元素在路径中的占位符
+ANY_INDEX = "*"
+
+
+class _Frame:
+    """当前所在的对象/数组层级"""
+    __slots__ = ("kind", "path", "key", "expect_key", "elem_start", "index")
+
+    def __init__(self, kind: str, path: Tuple):
+        self.kind = kind            # "object" 或 "array"
+        self.path = path            # 该容器在文档中的路径
+        self.key = None             # 对象中当前的键
+        self.expect_key = True      # 对象中下一个字符串是否为键
+        self.elem_start = None      # 数组中当前元素的起始位置
+        self.index = 0              # 数组中当前元素的序号
+
+
+class IncrementalJSONParser:
+    """
+    增量JSON解析器
+    只跟踪括号层级、字符串和键名，当关注的数组中某个元素完整生成后立即解析返回
+
+    用法:
+        parser = IncrementalJSONParser([("key_insights", "*"), ("mind_map", "主要分支", "*")])
+        for chunk in stream:
+            for path, index, value in parser.feed(chunk):
+                ...
+        result = parser.result()
+    """
+
+    def __init__(self, watch_paths: Iterable[Tuple]):
+        """watch_paths: 关注的数组元素路径，数组元素用 "*" 表示"""
+        self.watch_paths = {tuple(path) for path in watch_paths}
+        self._buffer = ""
+        self._pos = 0
+        self._root_start = None
+        self._root_end = None
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    @property
+    def done(self) -> bool:
+        """根对象是否已经完整"""
+        return self._root_end is not None
+
+    @property
+    def text(self) -> str:
+        """目前收到的全部文本"""
+        return self._buffer
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple, int, Any]]:
+        """
+        输入新的文本片段
+        返回: 本次新完成的 (路径, 数组下标, 值) 列表
+        """
+        self._buffer += chunk
+        events = []
+        buffer = self._buffer
+
+        for i in range(self._pos, len(buffer)):
+            if self._root_end is not None:
+                break
+            ch = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame.kind == "object" and frame.expect_key:
+                        frame.key = json.loads(buffer[self._string_start:i + 1])
+                        frame.expect_key = False
+                continue
+
+            # 根对象之前的文字（本地模型常见）直接跳过
+            if self._root_start is None:
+                if ch == "{":
+                    self._root_start = i
+                    self._stack.append(_Frame("object", ()))
+                continue
+
+            frame = self._stack[-1]
+
+            if ch.isspace():
+                continue
+
+            # 数组中的新元素开始
+            if frame.kind == "array" and frame.elem_start is None and ch not in ",]":
+                frame.elem_start = i
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if frame.kind == "object":
+                    child_path = frame.path + (frame.key,)
+                else:
+                    child_path = frame.path + (ANY_INDEX,)
+                self._stack.append(_Frame("object" if ch == "{" else "array", child_path))
+            elif ch in "}]":
+                if ch == "]" and frame.kind == "array":
+                    self._finish_element(frame, i, events)
+                self._stack.pop()
+                if not self._stack:
+                    self._root_end = i + 1
+            elif ch == ",":
+                if frame.kind == "array":
+                    self._finish_element(frame, i, events)
+                else:
+                    frame.expect_key = True
+
+        self._pos = len(buffer)
+        return events
+
+    def _finish_element(self, frame: _Frame, end: int, events: list):
+        """数组元素结束（遇到 , 或 ]）"""
+        if frame.elem_start is None:
+            return
+        path = frame.path + (ANY_INDEX,)
+        if path in self.watch_paths:
+            try:
+                value = json.loads(self._buffer[frame.elem_start:end])
+                events.append((frame.path, frame.index, value))
+            except json.JSONDecodeError:
+                pass
+        frame.elem_start = None
+        frame.index += 1
+
+    def result(self) -> Optional[Any]:
+        """解析完整的根对象；尚未生成完毕时抛出 json.JSONDecodeError"""
+        if self._root_start is None or self._root_end is None:
+            raise json.JSONDecodeError("JSON尚未完整", self._buffer, len(self._buffer))
+        return json.loads(self._buffer[self._root_start:self._root_end])
+
+
+class TolerantJSONExtractor:
+    """
+    容错的流式JSON提取器
+    跳过根对象前后的文字，按括号配对找到第一个完整的根对象（不受后面多余括号影响）；
+    输出被截断时，丢弃最后一个不完整的值，补全未闭合的数组/对象，恢复所有已完整生成的字段
+
+    用法:
+        extractor = TolerantJSONExtractor()
+        for chunk in stream:
+            extractor.feed(chunk)
+        value, complete = extractor.result()
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._root_start = None
+        self._root_end = None
+        self._stack: List[str] = []     # 未闭合的容器 "{" / "["
+        self._states: List[str] = []    # 各容器当前期待的内容
+        self._in_string = False
+        self._escape = False
+        self._scalar = False            # 正在读取数字/true/false/null
+        self._safe_end = None           # 最后一个完整值的结束位置
+        self._safe_closers = ""         # 在该位置截断时需要补全的括号
+
+    @property
+    def done(self) -> bool:
+        """根对象是否已经完整"""
+        return self._root_end is not None
+
+    @property
+    def text(self) -> str:
+        """目前收到的全部文本"""
+        return self._buffer
+
+    def _mark_safe(self, end: int):
+        """记录可以截断的位置：end 之前的内容都是完整的值"""
+        self._safe_end = end
+        self._safe_closers = "".join("}" if c == "{" else "]" for c in reversed(self._stack))
+
+    def _value_done(self, end: int):
+        """一个值（字符串/数字/容器）在 end 处结束"""
+        if not self._stack:
+            return
+        self._states[-1] = "comma"
+        self._mark_safe(end)
+
+    def _end_scalar(self, end: int):
+        if self._scalar:
+            self._scalar = False
+            self._value_done(end)
+
+    def feed(self, chunk: str):
+        """输入新的文本片段"""
+        self._buffer += chunk
+        buffer = self._buffer
+
+        for i in range(self._pos, len(buffer)):
+            if self._root_end is not None:
+                break
+            ch = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._states[-1] == "key":
+                        self._states[-1] = "colon"
+                    else:
+                        self._value_done(i + 1)
+                continue
+
+            if self._root_start is None:
+                if ch == "{":
+                    self._root_start = i
+                    self._stack.append("{")
+                    self._states.append("key")
+                    self._mark_safe(i + 1)
+                continue
+
+            if self._scalar:
+                if ch.isspace() or ch in ",]}":
+                    self._end_scalar(i)
+                else:
+                    continue
+
+            if ch.isspace():
+                continue
+
+            state = self._states[-1]
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append(ch)
+                self._states.append("key" if ch == "{" else "value")
+            elif ch in "}]":
+                self._stack.pop()
+                self._states.pop()
+                if not self._stack:
+                    self._root_end = i + 1
+                else:
+                    self._value_done(i + 1)
+            elif ch == ":":
+                self._states[-1] = "value"
+            elif ch == ",":
+                self._states[-1] = "key" if self._stack[-1] == "{" else "value"
+            elif state == "value":
+                self._scalar = True
+
+        self._pos = len(buffer)
+
+    def result(self) -> Tuple[Optional[Any], bool]:
+        """
+        返回: (解析结果, 是否完整)
+        完整时为根对象本身；截断时为修复后的对象；无法恢复任何内容时为 (None, False)
+        """
+        if self._root_start is None:
+            return None, False
+
+        if self._root_end is not None:
+            try:
+                return json.loads(self._buffer[self._root_start:self._root_end]), True
+            except json.JSONDecodeError:
+                return None, False
+
+        # 截断：文本恰好在一个数字/字面量之后结束时，它也可能是完整的
+        candidates = []
+        if self._scalar and self._states:
+            stack = "".join("}" if c == "{" else "]" for c in reversed(self._stack))
+            candidates.append(self._buffer[self._root_start:] + stack)
+        candidates.append(self._buffer[self._root_start:self._safe_end] + self._safe_closers)
+
+        for candidate in candidates:
+            try:
+                return json.loads(candidate), False
+            except json.JSONDecodeError:
+                continue
+        return None, False
+
+
+def extract_json(text: str) -> Tuple[Optional[Any], bool]:
+    """
+    从LLM回复中容错地提取JSON对象
+    返回: (解析结果, 是否完整)，参见 TolerantJSONExtractor
+    """
+    extractor = TolerantJSONExtractor()
+    extractor.feed(text)
+    return extractor.result()
@@ -0,0 +1,142 @@
+"""
+DeepRead 批量分析测试
+用脚本化的假LLM回复覆盖重试、限流、截断输出与检查点续跑（不需要网络和API Key）
+
+运行: python -m pytest test_batch_analyzer.py  或  python test_batch_analyzer.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加当前目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Windows编码修复
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+# 测试不写调用记录
+os.environ.setdefault("DEEPREAD_TELEMETRY", "0")
+
+from batch_analyzer import BatchAnalysisPipeline
+from book_analyzer import BookDeepAnalyzer, BookInfo, RateLimitError
+
+COMPLETE = json.dumps({
+    "key_insights": [f"观点{i}" for i in range(5)],
+    "mind_map": {"中心主题": "主题", "主要分支": [{"分支名": "甲", "子节点": []}, {"分支名": "乙", "子节点": []}]},
+    "quotes": [f"金句{i}" for i in range(5)],
+    "reading_plan": {"week1": "第1章"},
+    "difficulty": "中级",
+    "estimated_hours": 6,
+    "target_readers": ["读者"],
+    "prerequisite_knowledge": []
+}, ensure_ascii=False)
+
+# 只生成了两条观点和半条金句就被截断，缺少 mind_map
+TRUNCATED = '{"key_insights": ["观点1", "观点2"], "quotes": ["金句1", "金'
+
+USAGE = {"prompt_tokens": 100, "completion_tokens": 50}
+
+
+class ScriptedAnalyzer(BookDeepAnalyzer):
+    """按书名依次返回预设的回复；回复为异常实例时抛出"""
+
+    def __init__(self, replies):
+        super().__init__(api_key="test", use_cache=False)
+        self.replies = {title: list(items) for title, items in replies.items()}
+        self.calls = {}
+
+    def _chat_completion(self, prompt: str):
+        title = next(t for t in self.replies if f"书名：{t}" in prompt)
+        self.calls[title] = self.calls.get(title, 0) + 1
+        reply = self.replies[title].pop(0) if len(self.replies[title]) > 1 else self.replies[title][0]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply, dict(USAGE), {}
+
+
+def _pipeline(analyzer, directory, **kwargs):
+    kwargs.setdefault("max_retries", 2)
+    return BatchAnalysisPipeline(
+        analyzer,
+        concurrency=2,
+        checkpoint_path=str(Path(directory) / "checkpoint.jsonl"),
+        base_backoff=0.0,
+        **kwargs
+    )
+
+
+def _book(title):
+    return BookInfo(title=title, author="作者")
+
+
+def test_success_is_checkpointed_and_skipped_on_resume():
+    with tempfile.TemporaryDirectory() as directory:
+        analyzer = ScriptedAnalyzer({"甲": [COMPLETE], "乙": [COMPLETE]})
+        report = _pipeline(analyzer, directory).run([_book("甲"), _book("乙")])
+        assert report["succeeded"] == 2 and report["failed"] == 0
+        assert report["tokens_per_book"] == 150
+
+        report = _pipeline(analyzer, directory).run([_book("甲"), _book("乙")])
+        assert report["skipped_from_checkpoint"] == 2
+        assert analyzer.calls == {"甲": 1, "乙": 1}
+
+
+def test_truncated_output_is_retried_then_failed():
+    with tempfile.TemporaryDirectory() as directory:
+        analyzer = ScriptedAnalyzer({"甲": [TRUNCATED]})
+        pipeline = _pipeline(analyzer, directory)
+        report = pipeline.run([_book("甲")])
+        assert report["failed"] == 1 and report["succeeded"] == 0
+        assert analyzer.calls["甲"] == 3
+        # 失败的书不会进入检查点的已完成集合，续跑时会重新分析
+        assert pipeline.load_checkpoint() == {}
+
+
+def test_truncated_output_recovers_on_retry():
+    with tempfile.TemporaryDirectory() as directory:
+        analyzer = ScriptedAnalyzer({"甲": [TRUNCATED, COMPLETE]})
+        report = _pipeline(analyzer, directory).run([_book("甲")])
+        assert report["succeeded"] == 1 and report["retries"] == 1
+
+
+def test_errors_are_retried_up_to_max_retries():
+    with tempfile.TemporaryDirectory() as directory:
+        analyzer = ScriptedAnalyzer({"甲": [ConnectionError("断开"), COMPLETE], "乙": [ConnectionError("断开")]})
+        report = _pipeline(analyzer, directory).run([_book("甲"), _book("乙")])
+        assert report["succeeded"] == 1 and report["failed"] == 1
+        assert analyzer.calls == {"甲": 2, "乙": 3}
+
+
+def test_rate_limit_pauses_then_succeeds():
+    with tempfile.TemporaryDirectory() as directory:
+        analyzer = ScriptedAnalyzer({"甲": [RateLimitError(0.01), COMPLETE]})
+        report = _pipeline(analyzer, directory).run([_book("甲")])
+        assert report["succeeded"] == 1 and report["rate_limited"] == 1
+
+
+def test_rate_limit_longer_than_max_wait_fails_immediately():
+    with tempfile.TemporaryDirectory() as directory:
+        analyzer = ScriptedAnalyzer({"甲": [RateLimitError(3600)]})
+        report = _pipeline(analyzer, directory, max_rate_limit_wait=1.0).run([_book("甲")])
+        assert report["failed"] == 1
+        assert analyzer.calls["甲"] == 1
+        assert report["elapsed_seconds"] < 1
+
+
+if __name__ == "__main__":
+    tests = [(name, func) for name, func in sorted(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} 通过")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,143 @@
+"""
+DeepRead 熔断器测试
+覆盖熔断/半开试探/恢复、自适应超时，以及流式调用与中断时的试探名额释放（不需要网络）
+
+运行: python -m pytest test_circuit_breaker.py  或  python test_circuit_breaker.py
+"""
+
+import sys
+from pathlib import Path
+
+# 添加当前目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Windows编码修复
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def _fail(timeout):
+    raise ConnectionError("连接失败")
+
+
+def _expect(exception, func, *args):
+    try:
+        func(*args)
+    except exception:
+        return
+    raise AssertionError(f"应抛出 {exception.__name__}")
+
+
+def _trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        _expect(ConnectionError, breaker.call, _fail)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("t", max_timeout=5, failure_threshold=3, recovery_timeout=60)
+    _expect(ConnectionError, breaker.call, _fail)
+    _expect(ConnectionError, breaker.call, _fail)
+    assert breaker.call(lambda timeout: "ok") == "ok"
+    # 成功会清零连续失败次数
+    _expect(ConnectionError, breaker.call, _fail)
+    _expect(ConnectionError, breaker.call, _fail)
+    assert breaker.state == CLOSED
+    _expect(ConnectionError, breaker.call, _fail)
+    assert breaker.state == OPEN
+    _expect(CircuitOpenError, breaker.call, lambda timeout: "ok")
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker("t", max_timeout=5, failure_threshold=1, recovery_timeout=0)
+    _trip(breaker)
+    assert breaker.state == HALF_OPEN
+    _expect(ConnectionError, breaker.call, _fail)
+    assert breaker.snapshot()["trips"] == 2
+    assert breaker.call(lambda timeout: "ok") == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_one_trial_at_a_time():
+    breaker = CircuitBreaker("t", max_timeout=5, failure_threshold=1, recovery_timeout=0)
+    _trip(breaker)
+
+    def trial(timeout):
+        # 试探进行中，其他调用被拒绝
+        _expect(CircuitOpenError, breaker.call, lambda t: "ok")
+        return "ok"
+
+    assert breaker.call(trial) == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_interrupted_trial_releases_slot():
+    breaker = CircuitBreaker("t", max_timeout=5, failure_threshold=1, recovery_timeout=0)
+    _trip(breaker)
+
+    def interrupted(timeout):
+        raise KeyboardInterrupt
+
+    _expect(KeyboardInterrupt, breaker.call, interrupted)
+    # 中断不计为失败，也不会让熔断器永远停在半开
+    assert breaker.snapshot()["failures"] == 1
+    assert breaker.call(lambda timeout: "ok") == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_adaptive_timeout_follows_p95_within_bounds():
+    breaker = CircuitBreaker("t", max_timeout=60, min_timeout=2, min_samples=10)
+    assert breaker.current_timeout() == 60
+    for _ in range(10):
+        breaker.record_success(0.1)
+    assert breaker.current_timeout() == 2
+    for _ in range(10):
+        breaker.record_success(10.0)
+    assert breaker.current_timeout() == 20
+
+
+def test_stream_counts_body_errors_and_skips_latency():
+    breaker = CircuitBreaker("t", max_timeout=60, min_timeout=2, failure_threshold=1, min_samples=1)
+
+    def broken(response):
+        yield "第一段"
+        raise ConnectionError("读取中断")
+
+    stream = breaker.stream(lambda timeout: None, broken)
+    assert next(stream) == "第一段"
+    _expect(ConnectionError, next, stream)
+    assert breaker.state == OPEN
+
+    breaker.reset()
+    assert list(breaker.stream(lambda timeout: None, lambda response: iter(["a", "b"]))) == ["a", "b"]
+    # 流式调用不影响阻塞调用的超时
+    assert breaker.snapshot()["p95_latency"] is None
+    assert breaker.current_timeout() == 60
+
+
+def test_stream_closed_early_releases_trial():
+    breaker = CircuitBreaker("t", max_timeout=5, failure_threshold=1, recovery_timeout=0)
+    _trip(breaker)
+    stream = breaker.stream(lambda timeout: None, lambda response: iter(["a", "b"]))
+    assert next(stream) == "a"
+    stream.close()
+    assert breaker.snapshot()["failures"] == 1
+    assert list(breaker.stream(lambda timeout: None, lambda response: iter(["c"]))) == ["c"]
+    assert breaker.state == CLOSED
+
+
+if __name__ == "__main__":
+    tests = [(name, func) for name, func in sorted(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} 通过")
+    sys.exit(1 if failed else 0)
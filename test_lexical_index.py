@@ -0,0 +1,101 @@
+"""
+DeepRead 关键词索引测试
+覆盖中文二元组切分、BM25 排序、精确匹配、倒数排名融合，以及多实例一致性与清空（不需要嵌入模型）
+
+运行: python -m pytest test_lexical_index.py  或  python test_lexical_index.py
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加当前目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Windows编码修复
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+CARDS = [
+    ("c1", "锚定效应：第一个数字会影响之后的判断", {"content_type": "insight", "book_title": "思考，快与慢"}),
+    ("c2", "系统1快速直觉，系统2缓慢理性", {"content_type": "insight", "book_title": "思考，快与慢"}),
+    ("c3", "锚定与调整是一种启发式", {"content_type": "quote", "book_title": "思考，快与慢"}),
+    ("c4", "Atomic habits compound over time", {"content_type": "insight", "book_title": "Atomic Habits"}),
+]
+
+
+# Windows 上数据库连接未关闭时临时目录删不掉，忽略清理错误
+def _index(directory):
+    index = LexicalIndex(str(Path(directory) / "lexical.db"))
+    index.add(*zip(*CARDS))
+    return index
+
+
+def test_tokenize():
+    assert tokenize("锚定效应") == ["锚定", "定效", "效应"]
+    assert tokenize("书") == ["书"]
+    assert tokenize("System 1 与 GPT-4") == ["system", "1", "与", "gpt", "4"]
+
+
+def test_bm25_ranks_matching_cards():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        index = _index(directory)
+        results = index.search("锚定效应")
+        assert [r["id"] for r in results] == ["c1", "c3"]
+        assert results[0]["score"] > results[1]["score"]
+        assert index.search("habits")[0]["id"] == "c4"
+        assert index.search("不存在的词语") == []
+
+
+def test_exact_and_content_type_filters():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        index = _index(directory)
+        assert [r["id"] for r in index.search("锚定效应", exact=True)] == ["c1"]
+        assert [r["id"] for r in index.search("锚定", content_type="quote")] == ["c3"]
+
+
+def test_add_skips_existing_ids():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        index = _index(directory)
+        assert index.add(["c1", "c5", "c5"], ["重复", "新卡片", "新卡片"], [{}, {}, {}]) == 1
+        assert len(index) == 5
+
+
+def test_instances_see_each_others_writes_and_clear():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        first = _index(directory)
+        second = LexicalIndex(str(Path(directory) / "lexical.db"))
+        assert len(second) == 4
+
+        first.add(["c5"], ["锚定效应的实验"], [{}])
+        assert "c5" in [r["id"] for r in second.search("锚定效应")]
+
+        # 清空后行号会被重新使用，其他实例也要丢弃旧的倒排表
+        first.clear()
+        assert len(second) == 0 and second.search("锚定") == []
+        second.add(["n1"], ["清空后的新卡片"], [{}])
+        assert [r["id"] for r in first.search("新卡片")] == ["n1"]
+        assert len(first) == len(second) == 1
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "d", "c"]
+    assert abs(fused[0][1] - (1 / 62 + 1 / 61)) < 1e-12
+
+
+if __name__ == "__main__":
+    tests = [(name, func) for name, func in sorted(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} 通过")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,138 @@
+"""
+DeepRead 流式JSON解析测试
+覆盖截断的字符串、嵌套数组、代码块包裹等LLM常见输出（纯函数，不需要网络）
+
+运行: python -m pytest test_streaming_json.py  或  python test_streaming_json.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# 添加当前目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Windows编码修复
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+from streaming_json import ANY_INDEX, IncrementalJSONParser, TolerantJSONExtractor, extract_json
+
+ANALYSIS = {
+    "key_insights": ["观点1：锚定效应", "观点2：含\"引号\"和\\反斜杠", "观点3：{括号} [方括号]"],
+    "mind_map": {
+        "中心主题": "思考，快与慢",
+        "主要分支": [
+            {"分支名": "系统1", "子节点": ["直觉", "快速"]},
+            {"分支名": "系统2", "子节点": ["理性", ["嵌套", "数组"]]}
+        ]
+    },
+    "quotes": ["金句1", "金句2"],
+    "estimated_hours": 8.5,
+    "done": True
+}
+TEXT = json.dumps(ANALYSIS, ensure_ascii=False, indent=2)
+
+
+def test_extract_complete():
+    assert extract_json(TEXT) == (ANALYSIS, True)
+
+
+def test_extract_code_fence_and_surrounding_text():
+    text = f"好的，以下是分析结果：\n```json\n{TEXT}\n```\n希望对你有帮助 {{}}"
+    assert extract_json(text) == (ANALYSIS, True)
+
+
+def test_extract_without_json():
+    assert extract_json("抱歉，我无法完成这个请求") == (None, False)
+    assert extract_json("") == (None, False)
+
+
+def test_extract_truncated_string_drops_partial_value():
+    cut = TEXT.index("观点3")
+    value, complete = extract_json(TEXT[:cut])
+    assert not complete
+    assert value == {"key_insights": ["观点1：锚定效应", "观点2：含\"引号\"和\\反斜杠"]}
+
+
+def test_extract_truncated_after_escape():
+    text = '{"quotes": ["完整", "被截断的\\'
+    assert extract_json(text) == ({"quotes": ["完整"]}, False)
+
+
+def test_extract_truncated_nested_arrays():
+    cut = TEXT.index('"数组"')
+    value, complete = extract_json(TEXT[:cut])
+    assert not complete
+    branches = value["mind_map"]["主要分支"]
+    assert branches[0] == {"分支名": "系统1", "子节点": ["直觉", "快速"]}
+    assert branches[1] == {"分支名": "系统2", "子节点": ["理性", ["嵌套"]]}
+    assert "quotes" not in value
+
+
+def test_extract_truncated_after_number():
+    text = '{"quotes": ["金句1"], "estimated_hours": 8.5'
+    assert extract_json(text) == ({"quotes": ["金句1"], "estimated_hours": 8.5}, False)
+
+
+def test_extract_every_prefix_is_valid_or_none():
+    """任意位置截断都只返回原文的一部分，不会抛出异常"""
+    for end in range(len(TEXT)):
+        value, complete = extract_json(TEXT[:end])
+        assert not complete
+        assert value is None or isinstance(value, dict)
+
+
+def test_extractor_fed_in_chunks_matches_whole_text():
+    extractor = TolerantJSONExtractor()
+    for i in range(0, len(TEXT), 7):
+        extractor.feed(TEXT[i:i + 7])
+    assert extractor.done
+    assert extractor.result() == (ANALYSIS, True)
+
+
+def test_incremental_parser_emits_each_item_once():
+    parser = IncrementalJSONParser([
+        ("key_insights", ANY_INDEX), ("quotes", ANY_INDEX), ("mind_map", "主要分支", ANY_INDEX)
+    ])
+    events = []
+    for ch in "```json\n" + TEXT + "\n```":
+        events.extend(parser.feed(ch))
+
+    assert [(path, index) for path, index, _ in events] == (
+        [(("key_insights",), i) for i in range(3)]
+        + [(("mind_map", "主要分支"), i) for i in range(2)]
+        + [(("quotes",), i) for i in range(2)]
+    )
+    assert events[1][2] == ANALYSIS["key_insights"][1]
+    assert events[4][2] == ANALYSIS["mind_map"]["主要分支"][1]
+    assert parser.done
+    assert parser.result() == ANALYSIS
+
+
+def test_incremental_parser_truncated():
+    parser = IncrementalJSONParser([("quotes", ANY_INDEX)])
+    events = parser.feed('{"quotes": ["金句1", "金句')
+    assert [value for _, _, value in events] == ["金句1"]
+    assert not parser.done
+    try:
+        parser.result()
+    except json.JSONDecodeError:
+        pass
+    else:
+        raise AssertionError("截断的JSON应抛出 JSONDecodeError")
+
+
+if __name__ == "__main__":
+    tests = [(name, func) for name, func in sorted(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} 通过")
+    sys.exit(1 if failed else 0)